@@ -100,7 +100,8 @@ class CloudflareTunnelManager {
             const response = await fetch(`${url}/config`, {
                 method: 'GET',
                 headers: {
-                    'Accept': 'application/json'
+                    'Accept': 'application/json',
+                    ...this.authHeaders()
                 },
                 timeout: 5000
             });
@@ -128,6 +129,7 @@ class CloudflareTunnelManager {
         try {
             const response = await fetch(`${this.tunnelUrl}/config`, {
                 method: 'GET',
+                headers: this.authHeaders(),
                 timeout: 3000
             });
 
@@ -141,6 +143,12 @@ class CloudflareTunnelManager {
         }
     }
 
+    // API key of the sdbackend proxy, when it requires one
+    authHeaders() {
+        const key = document.getElementById('sd-backend-key')?.value?.trim() || localStorage.getItem('sd_backend_key');
+        return key ? { 'X-API-Key': key } : {};
+    }
+
     updateStatus(status, text) {
         if (!this.statusIndicator || !this.statusText) return;
 
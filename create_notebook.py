@@ -1,5 +1,11 @@
 #!/usr/bin/env python3
-import json
+import os
+import sys
+
+# sdbackend (notebook writing helpers) lives in server/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server"))
+
+from sdbackend.notebook import describe_write, write_notebook
 
 notebook = {
     "cells": [
@@ -180,8 +186,7 @@ notebook = {
     "nbformat_minor": 4
 }
 
-# Write to file
-with open("sd_colab.ipynb", "w", encoding="utf-8") as f:
-    json.dump(notebook, f, indent=1, ensure_ascii=False)
+# Write to file (skipped when nothing changed)
+result = write_notebook(notebook, "sd_colab.ipynb", indent=1, ensure_ascii=False)
 
-print("✅ Notebook created successfully: sd_colab.ipynb")
+print(describe_write("sd_colab.ipynb", result))
@@ -977,7 +977,8 @@ class DashboardRenderer {
         const loras = parseLorasFromText(combinedText);
         this._addParamRow(paramsEl, 'LoRAs', loras.length ? loras.join(', ') : 'N/A');
         const checkpoint = extractCheckpointFromParams(map, metadata);
-        this._addParamRow(paramsEl, 'Checkpoint', checkpoint || 'N/A');
+        const checkpointRow = this._addParamRow(paramsEl, 'Checkpoint', checkpoint || 'N/A');
+        this._resolveCheckpoint(checkpointRow, map['Model hash'], checkpoint);
 
         const common = ['Steps','Sampler','CFG scale','Seed','Size','Model','Model hash','Checkpoint','sd_model_checkpoint'];
         const shown = new Set();
@@ -1008,6 +1009,25 @@ class DashboardRenderer {
         }
         row.appendChild(nameCell); row.appendChild(valCell);
         container.appendChild(row);
+        return row;
+    }
+
+    // Match the metadata's model hash (then its name) against the models installed on the
+    // connected backend; without the sdbackend proxy the name from the metadata stays shown
+    async _resolveCheckpoint(row, hash, name) {
+        const api = window._sdUI && window._sdUI.api;
+        if (!row || !api || !api.apiUrl || (!hash && !name)) return;
+        let match = null;
+        for (const value of [hash, name]) {
+            if (!value) continue;
+            match = (await api.lookupModelHash(value)).find(m => m.kind === 'checkpoint');
+            if (match) break;
+        }
+        // A newer renderView() has replaced the row meanwhile
+        if (!match || !row.isConnected) return;
+        const valCell = row.querySelector('.param-value');
+        valCell.textContent = `${match.name} (installed)`;
+        valCell.title = name || hash;
     }
 
     renderEdit(metadata) {
@@ -3008,6 +3028,11 @@ class StableDiffusionUI {
     }
 
     loadSavedSettings() {
+        const savedKey = localStorage.getItem('sd_backend_key');
+        if (savedKey) {
+            document.getElementById('sd-backend-key').value = savedKey;
+            this.api.setApiKey(savedKey);
+        }
         const savedURL = localStorage.getItem('sd_api_url');
         if (savedURL) {
             document.getElementById('sd-api-url').value = savedURL;
@@ -3027,6 +3052,7 @@ class StableDiffusionUI {
         const testBtn = document.getElementById('sd-test-connection');
         const saveKeysBtn = document.getElementById('sd-save-keys');
         const urlInput = document.getElementById('sd-api-url');
+        const backendKeyInput = document.getElementById('sd-backend-key');
         const civitaiInput = document.getElementById('sd-civitai-key');
         const hfInput = document.getElementById('sd-huggingface-token');
 
@@ -3036,6 +3062,14 @@ class StableDiffusionUI {
                 showToast('Please enter API URL', 'error');
                 return;
             }
+            // The backend proxy admits only requests carrying its API key
+            const backendKey = backendKeyInput.value.trim();
+            this.api.setApiKey(backendKey);
+            if (backendKey) {
+                localStorage.setItem('sd_backend_key', backendKey);
+            } else {
+                localStorage.removeItem('sd_backend_key');
+            }
             this.api.setBaseURL(url);
             testBtn.disabled = true;
             testBtn.textContent = 'Testing...';
@@ -3335,6 +3369,7 @@ class StableDiffusionUI {
         generateBtn.disabled = true;
         const progressContainer = document.getElementById('sd-progress-container');
         progressContainer.classList.remove('hidden');
+        const stopProgress = this.watchProgress();
 
         try {
             let result;
@@ -3349,13 +3384,11 @@ class StableDiffusionUI {
             // Display results
             this.displayResults(result.images, mode);
             showToast('Generation complete!', 'success');
-
-            // Poll for progress
-            this.startProgressPolling();
         } catch (err) {
             console.error('Generation error:', err);
             showToast('Generation failed: ' + err.message, 'error');
         } finally {
+            stopProgress();
             generateBtn.disabled = false;
             setTimeout(() => {
                 progressContainer.classList.add('hidden');
@@ -3363,21 +3396,52 @@ class StableDiffusionUI {
         }
     }
 
+    // Live previews streamed by the sdbackend proxy; plain progress polling without it
+    watchProgress() {
+        const progressBar = document.getElementById('sd-progress-fill');
+        const progressText = document.getElementById('sd-progress-text');
+        const preview = document.getElementById('sd-progress-preview');
+        progressBar.style.width = '0%';
+        progressText.textContent = '0%';
+        preview.classList.add('hidden');
+
+        const stopStream = this.api.streamPreviews((event) => {
+            if (!event.active) return;
+            const percent = Math.round(event.progress * 100);
+            progressBar.style.width = percent + '%';
+            progressText.textContent = `${percent}% (step ${event.step}/${event.steps})`;
+            if (event.image) {
+                preview.src = event.image;
+                preview.classList.remove('hidden');
+            }
+        });
+        // Until the stream is known to work, poll as well
+        const stopPolling = this.api.previewsSupported ? null : this.startProgressPolling();
+        return () => {
+            if (stopStream) stopStream();
+            if (stopPolling) stopPolling();
+        };
+    }
+
     startProgressPolling() {
         const progressBar = document.getElementById('sd-progress-fill');
         const progressText = document.getElementById('sd-progress-text');
+        let stopped = false;
 
         const poll = async () => {
-            const progress = await this.api.getProgress();
-            const percent = Math.round(progress.progress * 100);
-            progressBar.style.width = percent + '%';
-            progressText.textContent = percent + '%';
-
-            if (progress.progress < 1) {
-                setTimeout(poll, 500);
-            }
+            if (stopped || this.api.previewsSupported) return;
+            try {
+                const progress = await this.api.getProgress();
+                const percent = Math.round(progress.progress * 100);
+                progressBar.style.width = percent + '%';
+                progressText.textContent = percent + '%';
+            } catch (err) {
+                // The generation request reports connection problems itself
+            }
+            if (!stopped) setTimeout(poll, 500);
         };
         poll();
+        return () => { stopped = true; };
     }
 
     displayResults(images, mode) {
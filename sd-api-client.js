@@ -4,9 +4,14 @@
  */
 
 class StableDiffusionAPI {
-    constructor(apiUrl) {
+    constructor(apiUrl, apiKey = null) {
         this.apiUrl = apiUrl?.replace(/\/$/, ''); // Remove trailing slash
+        this.apiKey = apiKey; // sdbackend proxy API key (gateway)
         this.timeout = 300000; // 5 minutes timeout for long requests
+        this.uploadChunkSize = 512 * 1024; // resumable upload chunk (sdbackend proxy)
+        this.uploadsSupported = null; // null = not checked yet
+        this.uploadedBlobs = new Set();
+        this.previewsSupported = null; // null = not checked yet
     }
 
     /**
@@ -16,7 +21,7 @@ class StableDiffusionAPI {
         if (!this.apiUrl) throw new Error('API URL not configured');
         
         try {
-            const response = await fetch(`${this.apiUrl}/sdapi/v1/sd-models`);
+            const response = await this._fetch(`${this.apiUrl}/sdapi/v1/sd-models`);
             if (!response.ok) throw new Error(`API Error: ${response.statusText}`);
             return await response.json();
         } catch (error) {
@@ -32,7 +37,7 @@ class StableDiffusionAPI {
         if (!this.apiUrl) throw new Error('API URL not configured');
         
         try {
-            const response = await fetch(`${this.apiUrl}/sdapi/v1/samplers`);
+            const response = await this._fetch(`${this.apiUrl}/sdapi/v1/samplers`);
             if (!response.ok) throw new Error(`API Error: ${response.statusText}`);
             return await response.json();
         } catch (error) {
@@ -90,26 +95,40 @@ class StableDiffusionAPI {
     async generateImageFromImage(imageData, options = {}) {
         if (!this.apiUrl) throw new Error('API URL not configured');
 
-        const payload = {
-            init_images: [imageData],
-            prompt: options.prompt || '',
-            negative_prompt: options.negative_prompt || '',
-            steps: options.steps || 20,
-            sampler_name: options.sampler || 'Euler',
-            cfg_scale: options.cfg_scale || 7,
-            denoising_strength: options.denoising_strength || 0.75,
-            seed: options.seed ?? -1,
-            send_images: true,
-            save_images: false,
-            ...options
+        // Через проксі sdbackend зображення завантажується частинами і передається як посилання
+        const buildPayload = async () => {
+            const initImage = await this._imageRef(imageData);
+            const mask = options.mask ? await this._imageRef(options.mask) : undefined;
+            return {
+                init_images: [initImage],
+                prompt: options.prompt || '',
+                negative_prompt: options.negative_prompt || '',
+                steps: options.steps || 20,
+                sampler_name: options.sampler || 'Euler',
+                cfg_scale: options.cfg_scale || 7,
+                denoising_strength: options.denoising_strength || 0.75,
+                seed: options.seed ?? -1,
+                send_images: true,
+                save_images: false,
+                ...options,
+                ...(mask ? { mask } : {})
+            };
         };
 
         try {
-            const response = await this._makeRequest(
-                `${this.apiUrl}/sdapi/v1/img2img`,
-                'POST',
-                payload
-            );
+            let response;
+            const payload = await buildPayload();
+            try {
+                response = await this._makeRequest(`${this.apiUrl}/sdapi/v1/img2img`, 'POST', payload);
+            } catch (error) {
+                // Сервер видалив blob (термін дії або ліміт розміру): завантажити ще раз;
+                // якщо й це не вдасться, _imageRef надішле зображення в base64
+                if (error.status !== 422 || !/Unknown upload blob/.test(error.detail || '')) throw error;
+                for (const ref of [...payload.init_images, payload.mask]) {
+                    if (typeof ref === 'string' && ref.startsWith('sdblob:')) this.uploadedBlobs.delete(ref.slice(7));
+                }
+                response = await this._makeRequest(`${this.apiUrl}/sdapi/v1/img2img`, 'POST', await buildPayload());
+            }
             
             if (response.images && response.images.length > 0) {
                 return {
@@ -125,6 +144,92 @@ class StableDiffusionAPI {
         }
     }
 
+    /**
+     * Завантажити зображення частинами (протокол tus, проксі sdbackend)
+     * Повертає посилання "sdblob:<sha256>" для init_images / mask.
+     * Якщо сервер уже має це зображення, нічого не передається.
+     */
+    async uploadImage(imageData) {
+        if (!this.apiUrl) throw new Error('API URL not configured');
+
+        const bytes = this._dataUrlToBytes(imageData);
+        const hash = await crypto.subtle.digest('SHA-256', bytes);
+        const sha256 = Array.from(new Uint8Array(hash)).map(b => b.toString(16).padStart(2, '0')).join('');
+        const ref = `sdblob:${sha256}`;
+        if (this.uploadedBlobs.has(sha256)) return ref;
+
+        const created = await this._fetch(`${this.apiUrl}/uploads`, {
+            method: 'POST',
+            headers: {
+                'Tus-Resumable': '1.0.0',
+                'Upload-Length': String(bytes.length),
+                'Upload-Metadata': `sha256 ${btoa(sha256)}`
+            }
+        });
+        if (!created.ok) throw new Error(`Upload error: HTTP ${created.status}`);
+
+        // 200 + X-Blob-Id: blob вже є на сервері
+        const location = created.headers.get('Location');
+        if (location) {
+            const uploadUrl = `${this.apiUrl}${location}`;
+            let offset = Number(created.headers.get('Upload-Offset') || 0);
+            let failures = 0;
+            while (offset < bytes.length) {
+                try {
+                    const chunk = bytes.subarray(offset, offset + this.uploadChunkSize);
+                    const response = await this._fetch(uploadUrl, {
+                        method: 'PATCH',
+                        headers: {
+                            'Tus-Resumable': '1.0.0',
+                            'Upload-Offset': String(offset),
+                            'Content-Type': 'application/offset+octet-stream'
+                        },
+                        body: chunk
+                    });
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    offset = Number(response.headers.get('Upload-Offset'));
+                    failures = 0;
+                } catch (error) {
+                    if (++failures > 5) throw new Error(`Upload failed: ${error.message}`);
+                    await new Promise(resolve => setTimeout(resolve, 500 * 2 ** failures));
+                    // Продовжити з того місця, яке сервер уже отримав
+                    const status = await this._fetch(uploadUrl, { method: 'HEAD', headers: { 'Tus-Resumable': '1.0.0' } });
+                    if (status.ok) offset = Number(status.headers.get('Upload-Offset'));
+                }
+            }
+        }
+
+        this.uploadedBlobs.add(sha256);
+        return ref;
+    }
+
+    /**
+     * Посилання на завантажений blob, або самі дані, якщо сервер не підтримує /uploads
+     */
+    async _imageRef(imageData) {
+        if (this.uploadsSupported === false || typeof imageData !== 'string' || !window.crypto?.subtle) {
+            return imageData;
+        }
+        try {
+            const ref = await this.uploadImage(imageData);
+            this.uploadsSupported = true;
+            return ref;
+        } catch (error) {
+            // Прямий WebUI без проксі: /uploads немає, надсилаємо base64 як раніше
+            if (this.uploadsSupported === null) this.uploadsSupported = false;
+            console.warn('[SD API] Chunked upload unavailable, sending inline image:', error.message);
+            return imageData;
+        }
+    }
+
+    _dataUrlToBytes(imageData) {
+        const base64 = imageData.includes(',') ? imageData.split(',')[1] : imageData;
+        const binary = atob(base64);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+        return bytes;
+    }
+
     /**
      * Отримати конфігурацію серверу
      */
@@ -132,7 +237,7 @@ class StableDiffusionAPI {
         if (!this.apiUrl) throw new Error('API URL not configured');
         
         try {
-            const response = await fetch(`${this.apiUrl}/config`);
+            const response = await this._fetch(`${this.apiUrl}/config`);
             if (!response.ok) throw new Error(`API Error: ${response.statusText}`);
             return await response.json();
         } catch (error) {
@@ -148,7 +253,7 @@ class StableDiffusionAPI {
         if (!this.apiUrl) throw new Error('API URL not configured');
         
         try {
-            const response = await fetch(`${this.apiUrl}/sdapi/v1/progress`);
+            const response = await this._fetch(`${this.apiUrl}/sdapi/v1/progress`);
             if (!response.ok) throw new Error(`API Error: ${response.statusText}`);
             return await response.json();
         } catch (error) {
@@ -157,6 +262,35 @@ class StableDiffusionAPI {
         }
     }
 
+    /**
+     * Підписатися на потік прев'ю генерації (Server-Sent Events, проксі sdbackend)
+     * onPreview отримує {active, step, steps, progress, eta, image?}, де image - маленький WebP.
+     * Повертає функцію для закриття потоку, або null якщо потоки недоступні
+     * (тоді прогрес доведеться опитувати через getProgress).
+     */
+    streamPreviews(onPreview, kbps = 256) {
+        if (!this.apiUrl) throw new Error('API URL not configured');
+        if (typeof EventSource === 'undefined' || this.previewsSupported === false) return null;
+
+        // EventSource не може надсилати заголовки - ключ передається в URL
+        const key = this.apiKey ? `&key=${encodeURIComponent(this.apiKey)}` : '';
+        const source = new EventSource(`${this.apiUrl}/sdbackend/previews?kbps=${kbps}${key}`);
+        let received = false;
+        source.addEventListener('preview', (event) => {
+            received = true;
+            this.previewsSupported = true;
+            onPreview(JSON.parse(event.data));
+        });
+        source.onerror = () => {
+            // Без проксі (404) потік ніколи не відкриється - не перепідключатися
+            if (!received) {
+                this.previewsSupported = false;
+                source.close();
+            }
+        };
+        return () => source.close();
+    }
+
     /**
      * Отримати список LoRA моделей
      */
@@ -164,7 +298,7 @@ class StableDiffusionAPI {
         if (!this.apiUrl) throw new Error('API URL not configured');
         
         try {
-            const response = await fetch(`${this.apiUrl}/sdapi/v1/loras`);
+            const response = await this._fetch(`${this.apiUrl}/sdapi/v1/loras`);
             if (!response.ok) throw new Error(`API Error: ${response.statusText}`);
             return await response.json();
         } catch (error) {
@@ -180,7 +314,7 @@ class StableDiffusionAPI {
         if (!this.apiUrl) throw new Error('API URL not configured');
         
         try {
-            const response = await fetch(`${this.apiUrl}/sdapi/v1/vae`);
+            const response = await this._fetch(`${this.apiUrl}/sdapi/v1/vae`);
             if (!response.ok) throw new Error(`API Error: ${response.statusText}`);
             return await response.json();
         } catch (error) {
@@ -189,6 +323,24 @@ class StableDiffusionAPI {
         }
     }
 
+    /**
+     * Знайти модель за хешем або назвою з метаданих ("Model hash", "name [hash]")
+     * Повертає список збігів, або [] якщо нічого не знайдено чи проксі sdbackend немає.
+     */
+    async lookupModelHash(hashOrName) {
+        if (!this.apiUrl) throw new Error('API URL not configured');
+        if (!hashOrName) return [];
+
+        try {
+            const response = await this._fetch(`${this.apiUrl}/sdbackend/hashes/${encodeURIComponent(hashOrName)}`);
+            if (!response.ok) return [];
+            return (await response.json()).models || [];
+        } catch (error) {
+            console.error('Error looking up model hash:', error);
+            return [];
+        }
+    }
+
     /**
      * Встановити активну модель
      */
@@ -258,7 +410,7 @@ class StableDiffusionAPI {
         if (!this.apiUrl) return false;
         
         try {
-            const response = await fetch(`${this.apiUrl}/sdapi/v1/sd-models`, {
+            const response = await this._fetch(`${this.apiUrl}/sdapi/v1/sd-models`, {
                 method: 'HEAD'
             });
             return response.ok;
@@ -267,6 +419,21 @@ class StableDiffusionAPI {
         }
     }
 
+    /**
+     * Встановити API ключ проксі sdbackend (надсилається з кожним запитом)
+     */
+    setApiKey(apiKey) {
+        this.apiKey = apiKey || null;
+    }
+
+    /**
+     * fetch з API ключем проксі sdbackend, якщо він заданий
+     */
+    _fetch(url, options = {}) {
+        if (!this.apiKey) return fetch(url, options);
+        return fetch(url, { ...options, headers: { ...options.headers, 'X-API-Key': this.apiKey } });
+    }
+
     /**
      * Внутрішний метод для HTTP запитів з обробкою помилок
      */
@@ -288,10 +455,13 @@ class StableDiffusionAPI {
                 options.body = JSON.stringify(body);
             }
 
-            const response = await fetch(url, options);
+            const response = await this._fetch(url, options);
 
             if (!response.ok) {
-                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+                const error = new Error(`HTTP ${response.status}: ${response.statusText}`);
+                error.status = response.status;
+                error.detail = await response.text().catch(() => '');
+                throw error;
             }
 
             // Деякі endpoints повертають пусто
@@ -313,8 +483,8 @@ class StableDiffusionAPI {
 // Глобальний екземпляр API
 let sdApi = null;
 
-function initializeSDAPI(apiUrl) {
-    sdApi = new StableDiffusionAPI(apiUrl);
+function initializeSDAPI(apiUrl, apiKey = null) {
+    sdApi = new StableDiffusionAPI(apiUrl, apiKey);
     console.log('[SD API] Initialized with URL:', apiUrl);
     return sdApi;
 }
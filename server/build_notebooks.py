@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Rebuild the committed notebooks, and only the ones whose parts changed.
+
+Each notebook is built by its generator script. A generator depends on
+its own source, on sdbackend/notebook.py and on the sdbackend modules it
+embeds: the names in its bundle_cell([...]) calls, plus the profiler
+when it calls instrument(). A one-off build runs every generator;
+write_notebook() leaves a notebook whose cells did not change untouched.
+In watch mode the dependencies are polled and only the generators whose
+dependencies changed are run again.
+
+create_fixed_notebook.py and generate_fixed_notebook_v2.py are left out:
+they write the same Google_Colab_Backend_FIXED.ipynb as
+generate_notebook_v3.py, which superseded them (check_notebooks.py still
+checks all of them).
+
+Usage:
+    python server/build_notebooks.py                 # build everything
+    python server/build_notebooks.py create_backend  # one generator
+    python server/build_notebooks.py --watch         # rebuild on change
+"""
+
+import argparse
+import ast
+import hashlib
+import os
+import subprocess
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SERVER_DIR)
+PACKAGE_DIR = os.path.join(SERVER_DIR, "sdbackend")
+
+# Generator -> directory it runs in (where the committed notebook lives)
+NOTEBOOKS = {
+    os.path.join(SERVER_DIR, "generate_notebook_v3.py"): SERVER_DIR,
+    os.path.join(SERVER_DIR, "create_backend.py"): SERVER_DIR,
+    os.path.join(REPO_DIR, "create_notebook.py"): REPO_DIR,
+}
+
+
+def dependencies(generator):
+    """Files whose content ends up in the generator's notebook."""
+    with open(generator, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), generator)
+    modules = set()
+    uses_package = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and (node.module or "").startswith("sdbackend"):
+            uses_package = True
+        if not isinstance(node, ast.Call):
+            continue
+        name = getattr(node.func, "id", None) or getattr(node.func, "attr", None)
+        if name == "bundle_cell" and node.args and isinstance(node.args[0], ast.List):
+            modules.update(element.value for element in node.args[0].elts
+                           if isinstance(element, ast.Constant) and isinstance(element.value, str))
+        elif name == "instrument":
+            modules.add("profiler")
+    if uses_package:
+        # bundle_source() always ships the package __init__
+        modules.update(["notebook", "__init__"])
+    return [generator] + sorted(os.path.join(PACKAGE_DIR, name + ".py") for name in modules)
+
+
+def fingerprint(paths):
+    """Content hash of a set of files (a missing file hashes as empty)."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode("utf-8") + b"\0")
+        try:
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        except OSError:
+            digest.update(b"missing")
+    return digest.hexdigest()
+
+
+def run_generator(generator):
+    """Run one generator in its directory; returns (ok, output lines)."""
+    env = dict(os.environ, PYTHONPATH=SERVER_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, generator], cwd=NOTEBOOKS[generator], env=env,
+                            capture_output=True, text=True, timeout=120)
+    output = (result.stdout + result.stderr).strip().splitlines()
+    return result.returncode == 0, output
+
+
+def build(generators, verbose=True):
+    """Run generators; returns the number that failed."""
+    failed = 0
+    for generator in generators:
+        start = time.perf_counter()
+        ok, output = run_generator(generator)
+        failed += not ok
+        if verbose:
+            name = os.path.relpath(generator, REPO_DIR)
+            summary = output[0] if ok and output else (output[-1] if output else "no output")
+            print(f"{'🔨' if ok else '❌'} {name} ({time.perf_counter() - start:.2f}s): {summary}")
+    return failed
+
+
+def watch(generators, interval=1.0):
+    """Rebuild a generator whenever one of its dependencies changes."""
+    graph = {generator: dependencies(generator) for generator in generators}
+    prints = {generator: fingerprint(paths) for generator, paths in graph.items()}
+    mtimes = {}
+    print(f"👀 Watching {len(set(p for paths in graph.values() for p in paths))} files "
+          f"for {len(generators)} notebooks (Ctrl+C to stop)")
+    while True:
+        time.sleep(interval)
+        current = {}
+        for paths in graph.values():
+            for path in paths:
+                try:
+                    current[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    current[path] = None
+        if current == mtimes:
+            continue
+        mtimes = current
+        # The generator itself may now bundle different modules
+        graph = {generator: dependencies(generator) for generator in generators}
+        stale = []
+        for generator, paths in graph.items():
+            value = fingerprint(paths)
+            if value != prints[generator]:
+                prints[generator] = value
+                stale.append(generator)
+        if stale:
+            build(stale)
+
+
+def select(names):
+    if not names:
+        return list(NOTEBOOKS)
+    chosen = []
+    for name in names:
+        matches = [g for g in NOTEBOOKS if os.path.splitext(os.path.basename(g))[0] == name]
+        if not matches:
+            raise SystemExit(f"unknown generator {name!r}; choose from "
+                             + ", ".join(os.path.splitext(os.path.basename(g))[0] for g in NOTEBOOKS))
+        chosen += matches
+    return chosen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the Colab notebooks incrementally")
+    parser.add_argument("generators", nargs="*", help="generator names (default: all)")
+    parser.add_argument("--watch", action="store_true", help="rebuild when a notebook's parts change")
+    parser.add_argument("--interval", type=float, default=1.0, help="watch poll interval in seconds")
+    parser.add_argument("--deps", action="store_true", help="print each generator's dependencies")
+    args = parser.parse_args(argv)
+    generators = select(args.generators)
+
+    if args.deps:
+        for generator in generators:
+            print(os.path.relpath(generator, REPO_DIR))
+            for path in dependencies(generator)[1:]:
+                print(f"   {os.path.relpath(path, REPO_DIR)}")
+        return 0
+    failed = build(generators)
+    if args.watch:
+        try:
+            watch(generators, args.interval)
+        except KeyboardInterrupt:
+            pass
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
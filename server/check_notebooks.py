@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Build every notebook generator and validate what it emits.
+
+For each generator script the notebook is rebuilt in a temporary
+directory, then:
+  * the nbformat structure is checked and every code cell is parsed with ast
+  * string constants containing a literal backslash-n are flagged
+    (double-escaped "\\\\n" in the generator source)
+  * the notebook is compared with the golden copy in server/golden/
+  * the imports of every code cell are run in a sandbox process with
+    stubbed torch/psutil/requests and blocked subprocess calls; the
+    non-stdlib modules each cell loads are compared with the golden
+    list (imports.json), so a cell that starts pulling in a new package
+    fails. Import times are printed for information only: wall-clock
+    numbers depend on the machine and are not committed
+and the backend CLI (python -m sdbackend) is checked to start within its
+budget without loading heavy modules before a command needs them.
+
+Usage:
+    python server/check_notebooks.py             # check everything
+    python server/check_notebooks.py --update    # accept current output as golden
+    python server/check_notebooks.py --no-timing create_backend
+    python server/check_notebooks.py --cli       # only the CLI start-up check
+"""
+
+import argparse
+import ast
+import difflib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SERVER_DIR)
+GOLDEN_DIR = os.path.join(SERVER_DIR, "golden")
+
+GENERATORS = [
+    os.path.join(SERVER_DIR, "generate_notebook_v3.py"),
+    os.path.join(SERVER_DIR, "create_backend.py"),
+    os.path.join(SERVER_DIR, "create_fixed_notebook.py"),
+    os.path.join(SERVER_DIR, "generate_fixed_notebook_v2.py"),
+    os.path.join(REPO_DIR, "create_notebook.py"),
+]
+
+# `python -m sdbackend --help`, interpreter start-up included (best of CLI_RUNS)
+CLI_BUDGET_S = 0.1
+CLI_RUNS = 5
+# Must not be imported just to print a command's --help
+HEAVY_MODULES = {"torch", "numpy", "scipy", "PIL", "psutil", "requests", "aiohttp"}
+
+STUB_MODULES = {
+    "torch": (
+        "class _Cuda:\n"
+        "    def is_available(self):\n"
+        "        return False\n"
+        "    def empty_cache(self):\n"
+        "        pass\n"
+        "cuda = _Cuda()\n"
+        "class version:\n"
+        "    cuda = None\n"
+    ),
+    "psutil": (
+        "def cpu_count():\n"
+        "    return 1\n"
+        "def cpu_percent(interval=None):\n"
+        "    return 0.0\n"
+    ),
+    "requests": (
+        "class exceptions:\n"
+        "    class ConnectionError(Exception):\n"
+        "        pass\n"
+    ),
+}
+
+
+def build(generator, out_dir):
+    """Run a generator in out_dir; returns {notebook name: parsed notebook}."""
+    script = os.path.join(out_dir, os.path.basename(generator))
+    shutil.copy(generator, script)
+    env = dict(os.environ, PYTHONPATH=SERVER_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, script], cwd=out_dir, env=env,
+                            capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "generator failed")
+    notebooks = {}
+    for name in sorted(os.listdir(out_dir)):
+        if name.endswith(".ipynb"):
+            with open(os.path.join(out_dir, name), encoding="utf-8") as f:
+                notebooks[name] = json.load(f)
+    if not notebooks:
+        raise RuntimeError("generator wrote no .ipynb file")
+    return notebooks
+
+
+def code_cells(notebook):
+    for index, cell in enumerate(notebook.get("cells", [])):
+        if cell.get("cell_type") == "code":
+            yield index, "".join(cell["source"])
+
+
+def validate(notebook):
+    """Structural, syntax and escaping problems of one notebook."""
+    problems = []
+    if notebook.get("nbformat") != 4:
+        problems.append(f"nbformat is {notebook.get('nbformat')!r}, expected 4")
+    for index, cell in enumerate(notebook.get("cells", [])):
+        kind = cell.get("cell_type")
+        if kind not in ("markdown", "code"):
+            problems.append(f"cell {index}: unknown cell_type {kind!r}")
+            continue
+        source = cell.get("source")
+        if not isinstance(source, list) or not all(isinstance(line, str) for line in source):
+            problems.append(f"cell {index}: source must be a list of strings")
+            continue
+        if not "".join(source).strip():
+            problems.append(f"cell {index}: empty {kind} cell")
+        if kind == "code" and (cell.get("outputs") or cell.get("execution_count") is not None):
+            problems.append(f"cell {index}: code cell is not clean (outputs/execution_count)")
+
+    for index, source in code_cells(notebook):
+        try:
+            tree = ast.parse(source)
+        except SyntaxError as e:
+            problems.append(f"cell {index}: SyntaxError line {e.lineno}: {e.msg}")
+            continue
+        for node in ast.walk(tree):
+            # Embedded multi-line sources (the sdbackend bundle) legitimately contain "\\n"
+            if (isinstance(node, ast.Constant) and isinstance(node.value, str)
+                    and "\\n" in node.value and "\n" not in node.value):
+                problems.append(f"cell {index} line {node.lineno}: literal backslash-n in string "
+                                f"(double-escaped in the generator?)")
+                break
+    return problems
+
+
+def golden_path(generator, name):
+    stem = os.path.splitext(os.path.basename(generator))[0]
+    return os.path.join(GOLDEN_DIR, stem, name)
+
+
+def compare_golden(generator, name, notebook):
+    """Differences against the golden notebook, as printable lines."""
+    path = golden_path(generator, name)
+    if not os.path.exists(path):
+        return ["no golden file (run with --update)"]
+    with open(path, encoding="utf-8") as f:
+        golden = json.load(f)
+    if golden == notebook:
+        return []
+    expected = json.dumps(golden, indent=1, ensure_ascii=False).splitlines()
+    actual = json.dumps(notebook, indent=1, ensure_ascii=False).splitlines()
+    diff = list(difflib.unified_diff(expected, actual, "golden", "built", n=1, lineterm=""))
+    return ["differs from golden:"] + diff[:40] + (["..."] if len(diff) > 40 else [])
+
+
+def import_statements(source):
+    """Source of every import statement in a cell (top level and nested)."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return ""
+    nodes = [node for node in ast.walk(tree) if isinstance(node, (ast.Import, ast.ImportFrom))]
+    nodes.sort(key=lambda node: node.lineno)
+    return "\n".join(ast.unparse(node) for node in nodes)
+
+
+def time_imports(notebook):
+    """Per-cell imports run in a sandbox process: seconds, new packages, error."""
+    cells = [import_statements(source) for _, source in code_cells(notebook)]
+    with tempfile.TemporaryDirectory() as stub_dir:
+        for module, text in STUB_MODULES.items():
+            with open(os.path.join(stub_dir, module + ".py"), "w") as f:
+                f.write(text)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([stub_dir, SERVER_DIR]))
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--sandbox"],
+                                input=json.dumps(cells), env=env,
+                                capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-300:])
+    return json.loads(result.stdout)
+
+
+def sandbox_main():
+    """Run in the sandbox process: exec each cell's imports, report timings."""
+    def blocked(*args, **kwargs):
+        raise RuntimeError("subprocess is blocked in the import sandbox")
+
+    subprocess.run = subprocess.Popen = subprocess.call = subprocess.check_output = blocked
+    os.system = blocked
+
+    timings = []
+    namespace = {}
+    for source in json.loads(sys.stdin.read()):
+        before = set(sys.modules)
+        start = time.perf_counter()
+        error = None
+        try:
+            exec(compile(source, "<cell imports>", "exec"), namespace)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - start
+        # Top-level packages outside the standard library: the same on every machine
+        packages = {name.split(".")[0] for name in set(sys.modules) - before if not name.startswith("__")}
+        timings.append({"seconds": seconds, "error": error,
+                        "packages": sorted(packages - set(sys.stdlib_module_names))})
+    print(json.dumps(timings))
+
+
+def compare_imports(generator, name, timings):
+    problems = []
+    path = golden_path(generator, "imports.json")
+    golden = []
+    if os.path.exists(path):
+        with open(path) as f:
+            golden = json.load(f).get(name, [])
+    for index, timing in enumerate(timings):
+        if timing["error"]:
+            problems.append(f"code cell {index}: import failed: {timing['error']}")
+        if index < len(golden):
+            added = sorted(set(timing["packages"]) - set(golden[index]))
+            if added:
+                problems.append(f"code cell {index}: imports now load {', '.join(added)} "
+                                f"({timing['seconds'] * 1000:.0f} ms)")
+    return problems
+
+
+def write_golden(generator, notebooks, timings):
+    for name, notebook in notebooks.items():
+        path = golden_path(generator, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(notebook, f, indent=1, ensure_ascii=False)
+            f.write("\n")
+    if timings:
+        packages = {name: [timing["packages"] for timing in cells] for name, cells in timings.items()}
+        with open(golden_path(generator, "imports.json"), "w") as f:
+            json.dump(packages, f, indent=1)
+            f.write("\n")
+
+
+def check(generator, update=False, timing=True):
+    """Check one generator; returns the number of problems found."""
+    label = os.path.relpath(generator, REPO_DIR)
+    print(f"\n📓 {label}")
+    with tempfile.TemporaryDirectory() as out_dir:
+        try:
+            notebooks = build(generator, out_dir)
+        except Exception as e:
+            print(f"   ❌ build failed: {e}")
+            return 1
+
+    failures = 0
+    timings = {}
+    for name, notebook in notebooks.items():
+        problems = validate(notebook)
+        if timing:
+            timings[name] = time_imports(notebook)
+        if not update:
+            problems += compare_golden(generator, name, notebook)
+            if timing:
+                problems += compare_imports(generator, name, timings[name])
+        total = sum(t["seconds"] for t in timings.get(name, []))
+        cells = sum(1 for _ in code_cells(notebook))
+        summary = f"{cells} code cells" + (f", imports {total * 1000:.0f} ms" if timing else "")
+        if problems:
+            failures += len(problems)
+            print(f"   ❌ {name} ({summary})")
+            for problem in problems:
+                print(f"      {problem}")
+        else:
+            print(f"   ✅ {name} ({summary})")
+
+    if update:
+        write_golden(generator, notebooks, timings)
+        print("   💾 golden files updated")
+    return failures
+
+
+def imported_modules(argv):
+    """Top-level names of the modules a `python -m sdbackend ...` run imports."""
+    env = dict(os.environ, PYTHONPATH=SERVER_DIR)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-m", "sdbackend"] + argv,
+                            env=env, capture_output=True, text=True, timeout=60)
+    names = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and line.count("|") == 2:
+            names.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return result.returncode, names
+
+
+def check_cli():
+    """Time `python -m sdbackend --help` and make sure no command's --help loads heavy modules."""
+    print("\n⌨️  python -m sdbackend")
+    from sdbackend.__main__ import COMMANDS
+
+    env = dict(os.environ, PYTHONPATH=SERVER_DIR)
+    runs = []
+    for _ in range(CLI_RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "sdbackend", "--help"], env=env,
+                       capture_output=True, check=True, timeout=60)
+        runs.append(time.perf_counter() - start)
+    problems = []
+    best = min(runs)
+    if best > CLI_BUDGET_S:
+        problems.append(f"--help took {best * 1000:.0f} ms (budget {CLI_BUDGET_S * 1000:.0f} ms)")
+    _, names = imported_modules(["--help"])
+    if names & HEAVY_MODULES or "sdbackend" not in names:
+        problems.append("--help imported " + ", ".join(sorted(names & HEAVY_MODULES) or ["nothing of sdbackend"]))
+    for command in COMMANDS:
+        returncode, names = imported_modules([command, "--help"])
+        if returncode != 0:
+            problems.append(f"{command} --help exited with {returncode}")
+        elif names & HEAVY_MODULES:
+            problems.append(f"{command} --help imported " + ", ".join(sorted(names & HEAVY_MODULES)))
+    if problems:
+        print(f"   ❌ {len(COMMANDS)} commands, --help in {best * 1000:.0f} ms")
+        for problem in problems:
+            print(f"      {problem}")
+    else:
+        print(f"   ✅ {len(COMMANDS)} commands, --help in {best * 1000:.0f} ms "
+              f"(budget {CLI_BUDGET_S * 1000:.0f} ms)")
+    return len(problems)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate the notebook generators")
+    parser.add_argument("generators", nargs="*", help="generator names to check (default: all)")
+    parser.add_argument("--update", action="store_true", help="write current output as golden")
+    parser.add_argument("--no-timing", action="store_true", help="skip the import sandbox")
+    parser.add_argument("--cli", action="store_true", help="only check the sdbackend CLI start-up")
+    parser.add_argument("--sandbox", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.sandbox:
+        return sandbox_main()
+
+    selected = [g for g in GENERATORS
+                if not args.cli and (not args.generators or
+                                     os.path.splitext(os.path.basename(g))[0] in args.generators)]
+    failures = sum(check(g, args.update, not args.no_timing) for g in selected)
+    if args.cli or not (args.generators or args.update or args.no_timing):
+        failures += check_cli()
+    print("\n" + ("✅ All notebooks OK" if not failures else f"❌ {failures} problem(s)"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
-import json
+
+from sdbackend.notebook import bundle_cell, describe_write, instrument, write_notebook
 
 notebook = {
     "cells": [
@@ -112,6 +113,7 @@ notebook = {
                 "## ЧАСТИНА 3: Запуск та Тестування"
             ]
         },
+        bundle_cell(["profiles"]),
         {
             "cell_type": "code",
             "execution_count": None,
@@ -131,8 +133,12 @@ notebook = {
                 "\n",
                 "# WebUI\n",
                 "print(\"\\n[1/3] WebUI запуск...\")\n",
+                "from sdbackend.profiles import detect_device, load_overrides, resolve_profile, launch_args\n",
+                "device_name, vram_gb = detect_device()\n",
+                "profile = resolve_profile(device_name, vram_gb, load_overrides())\n",
+                "print(f\"   Профіль: {profile['name']} ({device_name}, {vram_gb:.1f} GB)\")\n",
                 "webui = subprocess.Popen(\n",
-                "    [\"python\", \"launch.py\", \"--api\", \"--cors-allow-origins=*\", \"--listen\", \"127.0.0.1\", \"--port\", \"7860\", \"--xformers\"],\n",
+                "    launch_args(profile),\n",
                 "    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True\n",
                 ")\n",
                 "time.sleep(30)\n",
@@ -180,7 +186,8 @@ notebook = {
     "nbformat_minor": 4
 }
 
-with open("Google_Colab_Backend.ipynb", "w", encoding="utf-8") as f:
-    json.dump(notebook, f, indent=1, ensure_ascii=False)
+instrument(notebook)
+
+result = write_notebook(notebook, "Google_Colab_Backend.ipynb", indent=1, ensure_ascii=False)
 
-print("✅ Google_Colab_Backend.ipynb created!")
+print(describe_write("Google_Colab_Backend.ipynb", result))
@@ -1,58 +1,24 @@
 #!/usr/bin/env python3
 """
 Generate Google_Colab_Backend_FIXED.ipynb with proper cloudflared installation
+
+Superseded by generate_notebook_v3.py, which writes the same notebook
+(build_notebooks.py no longer runs this generator). Its Part 5 is a
+one-shot request against the local API; the monitored launch with
+sdbackend.health.HealthMonitor only exists in the v3 notebook.
 """
 
-import json
 import os
 
+from sdbackend.notebook import describe_write, write_notebook
+
 notebook = {
     "cells": [
         {
             "cell_type": "markdown",
             "metadata": {},
             "source": [
-                "# 🚀 Stable Diffusio                "# Now launch cloudflared\n",
-                "print(\"\\n🌐 Starting Cloudflare Tunnel...\")\n",
-                "\n",
-                "tunnel_url = None\n",
-                "cloudflared_paths = [\n",
-                "    \"/usr/bin/cloudflared\",\n",
-                "    \"/usr/local/bin/cloudflared\",\n",
-                "    \"/snap/bin/cloudflared\",\n",
-                "    \"/opt/cloudflare/cloudflared\",\n",
-                "]\n",
-                "\n",
-                "cloudflared_found = None\n",
-                "for path in cloudflared_paths:\n",
-                "    if os.path.exists(path):\n",
-                "        cloudflared_found = path\n",
-                "        print(f\"   ✅ Found cloudflared at: {path}\")\n",
-                "        break\n",
-                "\n",
-                "if not cloudflared_found:\n",
-                "    print(f\"   ⚠️ cloudflared not in standard paths, using shell=True\")\n",
-                "\n",
-                "try:\n",
-                "    if cloudflared_found:\n",
-                "        # Use specific path\n",
-                "        tunnel_process = subprocess.Popen(\n",
-                "            [cloudflared_found, \"tunnel\", \"--url\", \"http://localhost:7860\"],\n",
-                "            stdout=subprocess.PIPE,\n",
-                "            stderr=subprocess.STDOUT,\n",
-                "            text=True,\n",
-                "            bufsize=1\n",
-                "        )\n",
-                "    else:\n",
-                "        # Use shell=True for better compatibility\n",
-                "        tunnel_process = subprocess.Popen(\n",
-                "            \"cloudflared tunnel --url http://localhost:7860\",\n",
-                "            shell=True,\n",
-                "            stdout=subprocess.PIPE,\n",
-                "            stderr=subprocess.STDOUT,\n",
-                "            text=True,\n",
-                "            bufsize=1\n",
-                "        )"e Tunnel (FIXED)\n",
+                "# 🚀 Stable Diffusion + Cloudflare Tunnel (FIXED)\n",
                 "## Complete setup with proper cloudflared installation for Google Colab\n",
                 "\n",
                 "### ✅ What you'll get:\n",
@@ -213,7 +179,7 @@ notebook = {
                 "        print(f\"\\n✔️ Verifying installation...\")\n",
                 "        result = subprocess.run([\"/usr/local/bin/cloudflared\", \"--version\"], capture_output=True, text=True, timeout=5)\n",
                 "        if result.returncode == 0:\n",
-                "            version_line = result.stdout.strip().split('\\\\n')[0]\n",
+                "            version_line = result.stdout.strip().split('\\n')[0]\n",
                 "            print(f\"   ✅ {version_line[:50]}\")\n",
                 "        else:\n",
                 "            print(f\"   ⚠️ Version check skipped\")\n",
@@ -500,8 +466,7 @@ notebook = {
 script_dir = os.path.dirname(os.path.abspath(__file__))
 output_path = os.path.join(script_dir, "Google_Colab_Backend_FIXED.ipynb")
 
-with open(output_path, "w") as f:
-    json.dump(notebook, f, indent=2)
+result = write_notebook(notebook, output_path, indent=2)
 
-print(f"✅ Created: {output_path}")
+print(describe_write(output_path, result))
 print(f"Size: {os.path.getsize(output_path) / 1024:.1f} KB")
@@ -4,9 +4,10 @@ Generate Google_Colab_Backend_FIXED.ipynb with proper cloudflared installation
 v3 - WITH PROPER DIAGNOSTIC AND INSTALLATION FIX
 """
 
-import json
 import os
 
+from sdbackend.notebook import bundle_cell, describe_write, instrument, write_notebook
+
 notebook = {
     "cells": [
         {
@@ -21,7 +22,7 @@ notebook = {
                 "2. ✅ Install cloudflared properly\n",
                 "3. ✅ Find cloudflared location (diagnostic)\n",
                 "4. ✅ Install Stable Diffusion WebUI\n",
-                "5. ✅ Launch WebUI + Tunnel\n",
+                "5. ✅ Launch WebUI, warm up models, then open the Tunnel\n",
                 "6. ✅ Get public HTTPS URL"
             ]
         },
@@ -38,7 +39,7 @@ notebook = {
             "metadata": {},
             "outputs": [],
             "source": [
-                "import subprocess\nimport os\nimport sys\nimport time\nimport psutil\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"[1/5] SYSTEM DIAGNOSTICS & GPU CHECK\")\nprint(\"=\"*70)\n\n# CPU Info\ncpu_percent = psutil.cpu_percent(interval=1)\ncpu_count = psutil.cpu_count()\nprint(f\"\\n📊 CPU:\")\nprint(f\"   • Cores: {cpu_count}\")\nprint(f\"   • Usage: {cpu_percent}%\")\n\n# Memory Info\nmem = psutil.virtual_memory()\nprint(f\"\\n💾 RAM:\")\nprint(f\"   • Total: {mem.total / (1024**3):.1f} GB\")\nprint(f\"   • Available: {mem.available / (1024**3):.1f} GB\")\nprint(f\"   • Usage: {mem.percent}%\")\n\n# GPU Check\nprint(f\"\\n🎮 GPU Check:\")\ntry:\n    import torch\n    if torch.cuda.is_available():\n        print(f\"   ✅ CUDA Available\")\n        print(f\"   • Device: {torch.cuda.get_device_name(0)}\")\n        print(f\"   • VRAM: {torch.cuda.get_device_properties(0).total_memory / (1024**3):.1f} GB\")\n    else:\n        print(f\"   ❌ CUDA NOT available\")\n        print(f\"   → Go to Runtime → Change runtime type → Select GPU\")\nexcept Exception as e:\n    print(f\"   ⚠️ Error: {e}\")\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"✅ System check complete\")\nprint(\"=\"*70)"
+                "import subprocess\nimport os\nimport sys\nimport time\nimport psutil\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"[1/5] SYSTEM DIAGNOSTICS & GPU CHECK\")\nprint(\"=\"*70)\n\n# CPU Info\ncpu_percent = psutil.cpu_percent(interval=1)\ncpu_count = psutil.cpu_count()\nprint(f\"\\n📊 CPU:\")\nprint(f\"   • Cores: {cpu_count}\")\nprint(f\"   • Usage: {cpu_percent}%\")\n\n# Memory Info\nmem = psutil.virtual_memory()\nprint(f\"\\n💾 RAM:\")\nprint(f\"   • Total: {mem.total / (1024**3):.1f} GB\")\nprint(f\"   • Available: {mem.available / (1024**3):.1f} GB\")\nprint(f\"   • Usage: {mem.percent}%\")\n\n# GPU Check\nprint(f\"\\n🎮 GPU Check:\")\n# nvidia-smi answers in milliseconds; importing torch just for the name takes seconds\ntry:\n    gpu = subprocess.run([\"nvidia-smi\", \"--query-gpu=name,memory.total\", \"--format=csv,noheader,nounits\"],\n                         capture_output=True, text=True, timeout=10)\n    gpu_info = gpu.stdout.strip().splitlines() if gpu.returncode == 0 else []\nexcept (OSError, subprocess.TimeoutExpired):\n    gpu_info = []\nif gpu_info:\n    name, memory = [field.strip() for field in gpu_info[0].split(\",\")]\n    print(f\"   ✅ CUDA Available\")\n    print(f\"   • Device: {name}\")\n    print(f\"   • VRAM: {int(memory) / 1024:.1f} GB\")\nelse:\n    print(f\"   ❌ CUDA NOT available\")\n    print(f\"   → Go to Runtime → Change runtime type → Select GPU\")\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"✅ System check complete\")\nprint(\"=\"*70)"
             ]
         },
         {
@@ -70,9 +71,17 @@ notebook = {
             "metadata": {},
             "outputs": [],
             "source": [
-                "import subprocess\nimport os\nimport time\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"[3/5] STABLE DIFFUSION WEBUI SETUP\")\nprint(\"=\"*70)\n\nwebui_dir = \"/root/stable-diffusion-webui\"\n\nprint(f\"\\n📥 Cloning WebUI to {webui_dir}...\")\nif not os.path.exists(webui_dir):\n    result = subprocess.run(\n        [\"git\", \"clone\", \"https://github.com/AUTOMATIC1111/stable-diffusion-webui\", webui_dir],\n        capture_output=True,\n        timeout=300\n    )\n    if result.returncode == 0:\n        print(f\"   ✅ Cloned successfully\")\n    else:\n        print(f\"   ⚠️ Clone had issues, continuing anyway\")\nelse:\n    print(f\"   ⏭️ Already exists\")\n\nos.chdir(webui_dir)\n\nprint(f\"\\n📦 Installing Python dependencies...\")\ncommands = [\n    (\"pip install --upgrade pip setuptools wheel\", \"pip upgrade\"),\n    (\"pip install torch torchvision torchaudio --index-url https://download.pytorch.org/whl/cu118\", \"PyTorch\"),\n    (\"pip install transformers diffusers accelerate gradio omegaconf einops\", \"ML libraries\"),\n    (\"pip install peft xformers requests Pillow\", \"Additional tools\")\n]\n\nfor i, (cmd, desc) in enumerate(commands, 1):\n    print(f\"   [{i}/{len(commands)}] Installing {desc}...\")\n    try:\n        result = subprocess.run(\n            cmd,\n            shell=True,\n            capture_output=True,\n            timeout=180\n        )\n        if result.returncode == 0:\n            print(f\"        ✅ Done\")\n        else:\n            print(f\"        ⚠️ Some warnings (OK)\")\n    except subprocess.TimeoutExpired:\n        print(f\"        ⏱️ Timeout (continuing)\")\n    except Exception as e:\n        print(f\"        ⚠️ Error: {str(e)[:50]}\")\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"✅ WebUI installation complete\")\nprint(\"=\"*70)"
+                "import subprocess\nimport os\nimport time\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"[3/5] STABLE DIFFUSION WEBUI SETUP\")\nprint(\"=\"*70)\n\nwebui_dir = \"/root/stable-diffusion-webui\"\n\nprint(f\"\\n📥 Cloning WebUI to {webui_dir}...\")\nif not os.path.exists(webui_dir):\n    result = subprocess.run(\n        [\"git\", \"clone\", \"https://github.com/AUTOMATIC1111/stable-diffusion-webui\", webui_dir],\n        capture_output=True,\n        timeout=300\n    )\n    if result.returncode == 0:\n        print(f\"   ✅ Cloned successfully\")\n    else:\n        print(f\"   ⚠️ Clone had issues, continuing anyway\")\nelse:\n    print(f\"   ⏭️ Already exists\")\n\nos.chdir(webui_dir)\n\nprint(f\"\\n📦 Installing Python dependencies...\")\ncommands = [\n    (\"pip install --upgrade pip setuptools wheel\", \"pip upgrade\"),\n    (\"pip install torch torchvision torchaudio --index-url https://download.pytorch.org/whl/cu118\", \"PyTorch\"),\n    (\"pip install transformers diffusers accelerate gradio omegaconf einops\", \"ML libraries\"),\n    (\"pip install peft xformers requests Pillow brotli zstandard\", \"Additional tools\")\n]\n\nfor i, (cmd, desc) in enumerate(commands, 1):\n    print(f\"   [{i}/{len(commands)}] Installing {desc}...\")\n    try:\n        result = subprocess.run(\n            cmd,\n            shell=True,\n            capture_output=True,\n            timeout=180\n        )\n        if result.returncode == 0:\n            print(f\"        ✅ Done\")\n        else:\n            print(f\"        ⚠️ Some warnings (OK)\")\n    except subprocess.TimeoutExpired:\n        print(f\"        ⏱️ Timeout (continuing)\")\n    except Exception as e:\n        print(f\"        ⚠️ Error: {str(e)[:50]}\")\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"✅ WebUI installation complete\")\nprint(\"=\"*70)"
+            ]
+        },
+        {
+            "cell_type": "markdown",
+            "metadata": {},
+            "source": [
+                "## Cell 3b: Install Backend Helpers (sdbackend)"
             ]
         },
+        bundle_cell(["warmup", "profiles", "mockserver", "tunnel", "health", "thumbnails", "gencache", "coalesce", "batcher", "memguard", "storage", "compression", "uploads", "postprocess", "workers", "hashindex", "previews", "gateway", "session", "proxy", "profiler", "tagstats", "__main__"]),
         {
             "cell_type": "markdown",
             "metadata": {},
@@ -86,14 +95,14 @@ notebook = {
             "metadata": {},
             "outputs": [],
             "source": [
-                "import subprocess\nimport time\nimport os\nimport re\nimport json\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"[4/5] LAUNCHING WEBUI & TUNNEL\")\nprint(\"=\"*70)\n\n# Kill old processes\nprint(\"\\n🧹 Cleaning up old processes...\")\nsubprocess.run(\"pkill -f 'python.*launch.py'\", shell=True, stderr=subprocess.DEVNULL)\nsubprocess.run(\"pkill -f cloudflared\", shell=True, stderr=subprocess.DEVNULL)\ntime.sleep(2)\n\n# Launch WebUI\nprint(\"\\n🚀 Starting WebUI...\")\nwebui_dir = \"/root/stable-diffusion-webui\"\nos.chdir(webui_dir)\n\nwebui_process = subprocess.Popen(\n    [\"python\", \"launch.py\", \"--api\", \"--cors-allow-origins=*\", \"--listen\"],\n    stdout=subprocess.PIPE,\n    stderr=subprocess.STDOUT,\n    text=True,\n    bufsize=1,\n    cwd=webui_dir\n)\n\nprint(\"   ⏳ Waiting 30 seconds for WebUI to initialize...\")\ntime.sleep(30)\nprint(\"   ✅ WebUI running on http://localhost:7860\")\n\n# Load cloudflared path\nprint(\"\\n🌐 Setting up Tunnel...\")\ncloudflared_path = None\n\ntry:\n    with open('/tmp/cloudflared_config.json', 'r') as f:\n        config = json.load(f)\n        cloudflared_path = config.get('cloudflared_path')\n        print(f\"   ✅ Loaded cloudflared path from config: {cloudflared_path}\")\nexcept:\n    print(f\"   ⚠️ Config file not found, trying default paths...\")\n    import shutil\n    cloudflared_path = shutil.which('cloudflared')\n    if cloudflared_path:\n        print(f\"   ✅ Found via shutil.which: {cloudflared_path}\")\n\nif not cloudflared_path:\n    print(f\"   ❌ Could not find cloudflared!\")\n    print(f\"      This is likely a Google Colab environment issue.\")\n    print(f\"      Try running the apt-get install cell again.\")\nelse:\n    print(f\"\\n   🚀 Starting tunnel with: {cloudflared_path}\")\n    try:\n        # Start tunnel process\n        tunnel_process = subprocess.Popen(\n            [cloudflared_path, \"tunnel\", \"--url\", \"http://localhost:7860\"],\n            stdout=subprocess.PIPE,\n            stderr=subprocess.STDOUT,\n            text=True,\n            bufsize=1,\n            universal_newlines=True\n        )\n        \n        print(\"   ⏳ Waiting for tunnel URL (15 seconds)...\\n\")\n        timeout = time.time() + 20\n        tunnel_url = None\n        \n        while time.time() < timeout:\n            try:\n                line = tunnel_process.stdout.readline()\n                if line:\n                    print(f\"      {line.rstrip()}\")\n                    # Search for URL\n                    match = re.search(r'https://[a-zA-Z0-9-]+\\.trycloudflare\\.com', line)\n                    if match:\n                        tunnel_url = match.group(0)\n                        break\n                time.sleep(0.1)\n            except:\n                pass\n        \n        if tunnel_url:\n            print(f\"\\n\" + \"=\"*70)\n            print(f\"🎉 SUCCESS! TUNNEL URL OBTAINED\")\n            print(f\"=\"*70)\n            print(f\"\\n🌐 Public URL: {tunnel_url}\")\n            print(f\"\\n📋 NEXT STEPS:\")\n            print(f\"   1. Copy the URL above\")\n            print(f\"   2. Go to your GitHub Pages site\")\n            print(f\"   3. Click ⚙️ Settings (top right)\")\n            print(f\"   4. Paste URL in 'Cloudflared Tunnel URL' field\")\n            print(f\"   5. Click 'Test Connection'\")\n            print(f\"   6. Start generating! 🎨\")\n            print(f\"\\n\" + \"=\"*70)\n            \n            # Save for later use\n            with open('/tmp/tunnel_url.txt', 'w') as f:\n                f.write(tunnel_url)\n        else:\n            print(f\"\\n⚠️ No URL found in output\")\n            print(f\"   But tunnel should be running on port 8000\")\n            print(f\"   Try accessing: http://localhost:8000\")\n    \n    except Exception as e:\n        print(f\"   ❌ Error launching tunnel: {e}\")\n        import traceback\n        traceback.print_exc()\n\nprint(f\"\\n💡 Keep this notebook running!\")\nprint(f\"   Do NOT close this browser tab or this cell.\")"
+                "import subprocess\nimport time\nimport os\nimport re\nimport json\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"[4/5] LAUNCHING WEBUI & TUNNEL\")\nprint(\"=\"*70)\n\n# Kill old processes\nprint(\"\\n🧹 Cleaning up old processes...\")\n# A re-run of this cell first stops what the previous run started in this kernel:\n# its proxy (7870) and dispatcher (7860) still own their ports, and the helper threads\n# would keep running next to the new ones\nif globals().get('proxy_server') is not None:\n    proxy_server.shutdown()\n    proxy_server.server_close()\nif globals().get('dispatcher') is not None:\n    dispatcher.server.shutdown()\n    dispatcher.server.server_close()\nif globals().get('workers') is not None:\n    workers.stop()\nfor previous in ('session', 'guard', 'thumbnails', 'storage', 'uploads'):\n    if globals().get(previous) is not None and hasattr(globals()[previous], 'stop'):\n        globals()[previous].stop()\nif globals().get('proxy') is not None and getattr(proxy, 'postprocessor', None) is not None:\n    proxy.postprocessor.close()\nproxy_server = dispatcher = workers = None\nsubprocess.run(\"pkill -f 'python.*launch.py'\", shell=True, stderr=subprocess.DEVNULL)\n# Mock workers left over from a restarted kernel\nsubprocess.run(\"pkill -f 'sdbackend.mockserver'\", shell=True, stderr=subprocess.DEVNULL)\nsubprocess.run(\"pkill -f cloudflared\", shell=True, stderr=subprocess.DEVNULL)\ntime.sleep(2)\n\n# Launch WebUI\nprint(\"\\n🚀 Starting WebUI...\")\nwebui_dir = \"/root/stable-diffusion-webui\"\nos.chdir(webui_dir)\n\n# Snapshot of the session before a disconnect (on Drive when mounted): the same model,\n# options, warm-up sizes and hot cache entries come back, unfinished jobs are replayed\nfrom sdbackend.session import SessionState, describe as describe_session\nsession = SessionState()\nif session.load():\n    print(\"   💾 Resuming the previous session:\")\n    for line in describe_session(session.previous):\n        print(f\"      • {line}\")\n    session.restore_files()\n\n# Pick performance flags for the detected GPU (override: /content/sdbackend_profiles.yaml)\nfrom sdbackend.profiles import detect_device, load_overrides, resolve_profile, launch_args, record_benchmark\ndevice_name, vram_gb = detect_device()\nprofile = resolve_profile(device_name, vram_gb, load_overrides())\nlaunch_cmd = launch_args(profile)\nprint(f\"   🎛️ Profile: {profile['name']} ({device_name}, {vram_gb:.1f} GB)\")\nprint(f\"   • Flags: {' '.join(launch_cmd[2:])}\")\n\n# CPU-only runtimes (CI, no GPU quota): SDBACKEND_MOCK=1 serves the mock API instead\nuse_mock = profile['name'] == 'cpu' and os.environ.get('SDBACKEND_MOCK') == '1'\nif use_mock:\n    os.environ['PYTHONPATH'] = '/content' + os.pathsep + os.environ.get('PYTHONPATH', '')\n    print(\"   🧪 SDBACKEND_MOCK=1: starting the mock WebUI API (no real generation)\")\n\ndef worker_command(port):\n    if use_mock:\n        return ['python', '-m', 'sdbackend.mockserver', '--host', '0.0.0.0', '--port', str(port)]\n    return launch_args(profile, port)\n\n# Model file hashes (checkpoints, LoRAs, embeddings): reused from earlier sessions while\n# the files are unchanged (inode+size+mtime), new ones hashed on a thread pool. Known\n# hashes go into the WebUI's hash cache before it starts, so model loads do not wait on\n# hashing; files hashed after the launch are added on the next start\nfrom sdbackend.hashindex import HashIndex\nhash_index = HashIndex(webui_dir=webui_dir)\nprint(f\"   #️⃣ Hash cache: {hash_index.export_webui_cache()} known model files\")\nhash_index.start_in_thread()\n\n# One WebUI per GPU (several per GPU with SDBACKEND_WORKER_VRAM_GB=<GB each>), pinned\n# with CUDA_VISIBLE_DEVICES and started one after another; with more than one, a\n# dispatcher on port 7860 spreads requests over them. Logs: /content/sdbackend_workers\nfrom sdbackend.workers import detect_gpus, plan_workers, start_workers\nworker_vram_gb = float(os.environ.get('SDBACKEND_WORKER_VRAM_GB') or session.config.get('worker_vram_gb') or 0) or None\nworker_plan = plan_workers(detect_gpus(), worker_vram_gb)\nsession.config.update(profile=profile['name'], worker_vram_gb=worker_vram_gb)\nworkers, dispatcher = start_workers(worker_command, worker_plan, port=7860, cwd=webui_dir)\n\n# Warm-up: load checkpoint/VAE and compile kernels before anyone gets the URL\nfrom sdbackend.warmup import warm_up, print_report, api_request\nfrom sdbackend.profiler import phase\nprint(\"   ⏳ Waiting for WebUI and warming up models...\")\nwith phase(\"warm-up (first model load)\"):\n    # Every worker loads its own copy of the model\n    warmup_report = [warm_up(worker.url, **session.warmup_settings()) for worker in workers.workers][0]\nprint_report(warmup_report)\nrecord_benchmark(profile, warmup_report)\n\n# Gallery thumbnails: multi-size WebP of every new output\nfrom sdbackend.thumbnails import ThumbnailService\nthumbnails = ThumbnailService(os.path.join(webui_dir, \"outputs\"))\nthumbnails.start_in_thread()\n\n# Persistent outputs: copy to Google Drive (mount it first) or SDBACKEND_STORAGE_DIR;\n# stored local copies are evicted when the disk fills, /outputs still serves them\nfrom sdbackend.storage import StorageManager, LocalTarget, DRIVE_DIR\nstorage = None\nstorage_dir = os.environ.get(\"SDBACKEND_STORAGE_DIR\") or (DRIVE_DIR if os.path.isdir(\"/content/drive/MyDrive\") else None)\nif storage_dir:\n    storage = StorageManager(LocalTarget(storage_dir), os.path.join(webui_dir, \"outputs\"))\n    storage.start_in_thread()\n    print(f\"   💾 Outputs are copied to {storage_dir}\")\nelse:\n    print(\"   💡 Mount Google Drive to keep outputs after the session ends\")\n\n# Front proxy: the tunnel points here; seeded repeats come from the cache and\n# retries of a still-running request attach to it instead of rendering twice;\n# compatible single-image requests arriving within 50 ms share one batch;\n# requests that would run out of VRAM are split/shrunk by the memory guard;\n# JSON responses cross the tunnel zstd/br/gzip-compressed; img2img inputs can be\n# uploaded resumably to /uploads and referenced as sdblob:<sha256>; resize/sharpen/\n# format/watermark steps (\"sdbackend_postprocess\") run on a CPU process pool\nfrom sdbackend.proxy import Proxy, start_server as start_proxy\nfrom sdbackend.gencache import GenerationCache\nfrom sdbackend.coalesce import Coalescer\nfrom sdbackend.batcher import MicroBatcher\nfrom sdbackend.memguard import MemoryGuard, combined_memory_source, webui_memory_source\nfrom sdbackend.compression import Compressor\nfrom sdbackend.uploads import UploadService\nfrom sdbackend.postprocess import PostProcessor\nfrom sdbackend.previews import PreviewStreamer, preview_options\nfrom sdbackend.gateway import Gateway, ensure_keys, default_keys_path\n\n# The tunnel URL is public: every request needs an API key (kept on Drive when mounted;\n# add more with python -m sdbackend.gateway add <name>), and generations are admitted\n# per key by rate, concurrency and a steps x pixels quota. SDBACKEND_AUTH=0 turns it off\ngateway = None\napi_key = None\nif os.environ.get('SDBACKEND_AUTH') != '0':\n    keys, created_key = ensure_keys()\n    gateway = Gateway(keys)\n    api_key = created_key or next((key for key, entry in keys.items() if entry.get('name') == 'owner'), None)\n    print(f\"   🔑 API keys: {len(keys)} in {default_keys_path()}\")\n# Port 7860 may be a dispatcher answering from any worker: sample every worker and plan\n# for the tightest one\nguard = MemoryGuard(combined_memory_source([webui_memory_source(worker.url) for worker in workers.workers]))\nguard.start_in_thread(interval=5)\n# Unfinished uploads expire after a day; stored blobs are trimmed to 2 GB, least recently used first\nuploads = UploadService()\nuploads.start_in_thread()\nproxy = Proxy(\"http://localhost:7860\", cache=GenerationCache(), coalescer=Coalescer(),\n              batcher=MicroBatcher(window=0.05, max_batch=4, guard=guard), thumbnails=thumbnails,\n              guard=guard, storage=storage, compressor=Compressor(),\n              uploads=uploads, postprocessor=PostProcessor(), hashes=hash_index,\n              previews=PreviewStreamer(\"http://localhost:7860\"), gateway=gateway)\nsession.attach(proxy)\nif session.previous:\n    restored = session.restore_cache(proxy.cache)\n    try:\n        session.apply_options(\"http://localhost:7860\")\n    except Exception as e:\n        print(f\"   ⚠️ Could not restore options: {e}\")\n    print(f\"   💾 Restored {restored} cached results, replaying {session.replay_jobs()} unfinished jobs\")\n# Live previews: a cheap latent decode every few steps (SDBACKEND_PREVIEW_EVERY, default 3),\n# streamed to the page as small WebP frames over /sdbackend/previews (bandwidth-capped per client)\ntry:\n    api_request(\"http://localhost:7860\", \"/sdapi/v1/options\", preview_options(int(os.environ.get('SDBACKEND_PREVIEW_EVERY') or 3)))\nexcept Exception as e:\n    print(f\"   ⚠️ Live previews unavailable: {e}\")\nproxy_server = start_proxy(proxy, port=7870)\nsession.start_in_thread()\nprint(\"   ✅ Proxy on http://localhost:7870 (stats: /sdbackend/stats, thumbnails: /thumbs, hashes: /sdbackend/hashes, previews: /sdbackend/previews)\")\nprint(f\"   💾 Session snapshots every {session.interval:.0f}s to {session.root}\")\nprint(f\"   ✅ WebUI running on http://localhost:7860 ({len(workers.workers)} worker(s))\")\n\n# Load cloudflared path\nprint(\"\\n🌐 Setting up Tunnel...\")\ncloudflared_path = None\n\ntry:\n    with open('/tmp/cloudflared_config.json', 'r') as f:\n        config = json.load(f)\n        cloudflared_path = config.get('cloudflared_path')\n        print(f\"   ✅ Loaded cloudflared path from config: {cloudflared_path}\")\nexcept:\n    print(f\"   ⚠️ Config file not found, trying default paths...\")\n    import shutil\n    cloudflared_path = shutil.which('cloudflared')\n    if cloudflared_path:\n        print(f\"   ✅ Found via shutil.which: {cloudflared_path}\")\n\nif not cloudflared_path:\n    print(f\"   ❌ Could not find cloudflared!\")\n    print(f\"      This is likely a Google Colab environment issue.\")\n    print(f\"      Try running the apt-get install cell again.\")\nelse:\n    print(f\"\\n   🚀 Starting tunnel with: {cloudflared_path}\")\n    try:\n        # Start tunnel process\n        tunnel_process = subprocess.Popen(\n            [cloudflared_path, \"tunnel\", \"--url\", \"http://localhost:7870\"],\n            stdout=subprocess.PIPE,\n            stderr=subprocess.STDOUT,\n            text=True,\n            bufsize=1,\n            universal_newlines=True\n        )\n        \n        print(\"   ⏳ Waiting for tunnel URL (15 seconds)...\\n\")\n        timeout = time.time() + 20\n        tunnel_url = None\n        \n        while time.time() < timeout:\n            try:\n                line = tunnel_process.stdout.readline()\n                if line:\n                    print(f\"      {line.rstrip()}\")\n                    # Search for URL\n                    match = re.search(r'https://[a-zA-Z0-9-]+\\.trycloudflare\\.com', line)\n                    if match:\n                        tunnel_url = match.group(0)\n                        break\n                time.sleep(0.1)\n            except:\n                pass\n        \n        if tunnel_url:\n            print(f\"\\n\" + \"=\"*70)\n            print(f\"🎉 SUCCESS! TUNNEL URL OBTAINED\")\n            print(f\"=\"*70)\n            print(f\"\\n🌐 Public URL: {tunnel_url}\")\n            print(f\"\\n📋 NEXT STEPS:\")\n            print(f\"   1. Copy the URL above\")\n            print(f\"   2. Go to your GitHub Pages site\")\n            print(f\"   3. Click ⚙️ Settings (top right)\")\n            print(f\"   4. Paste URL in 'Cloudflared Tunnel URL' field\")\n            if api_key:\n                print(f\"      and this key in 'Backend API Key': {api_key}\")\n            print(f\"   5. Click 'Test Connection'\")\n            print(f\"   6. Start generating! 🎨\")\n            print(f\"\\n\" + \"=\"*70)\n            \n            # Save for later use\n            with open('/tmp/tunnel_url.txt', 'w') as f:\n                f.write(tunnel_url)\n        else:\n            print(f\"\\n⚠️ No URL found in output\")\n            print(f\"   But tunnel should be running on port 8000\")\n            print(f\"   Try accessing: http://localhost:8000\")\n    \n    except Exception as e:\n        print(f\"   ❌ Error launching tunnel: {e}\")\n        import traceback\n        traceback.print_exc()\n\nprint(f\"\\n💡 Keep this notebook running!\")\nprint(f\"   Do NOT close this browser tab or this cell.\")"
             ]
         },
         {
             "cell_type": "markdown",
             "metadata": {},
             "source": [
-                "## Cell 5: Test API Connection & Show Status"
+                "## Cell 5: Health Monitor & Status"
             ]
         },
         {
@@ -102,7 +111,7 @@ notebook = {
             "metadata": {},
             "outputs": [],
             "source": [
-                "import requests\nimport time\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"[5/5] TESTING API CONNECTION\")\nprint(\"=\"*70)\n\napi_url = \"http://localhost:7860\"\n\nprint(f\"\\n🔌 Testing WebUI API...\")\nfor attempt in range(1, 4):\n    try:\n        response = requests.get(f\"{api_url}/api/sd-models\", timeout=5)\n        if response.status_code == 200:\n            print(f\"   ✅ API responding (attempt {attempt})\")\n            data = response.json()\n            if isinstance(data, list) and len(data) > 0:\n                print(f\"   ✅ Models loaded: {len(data)} checkpoint(s)\")\n                print(f\"      • {data[0].get('model_name', 'Unknown')[:60]}\")\n            else:\n                print(f\"   ⚠️ Models still loading, try again in 30 seconds\")\n            break\n    except requests.exceptions.ConnectionError:\n        if attempt < 3:\n            print(f\"   ⏳ WebUI still initializing... (attempt {attempt}/3)\")\n            time.sleep(5)\n        else:\n            print(f\"   ❌ Cannot reach WebUI after {attempt} attempts\")\n            print(f\"      Try running this cell again in 60 seconds\")\n    except Exception as e:\n        print(f\"   ⚠️ Error: {str(e)[:100]}\")\n        break\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"🎉 SETUP COMPLETE!\")\nprint(\"=\"*70)\nprint(f\"\\n✅ WebUI: http://localhost:7860\")\nprint(f\"✅ API: http://localhost:7860/api\")\nprint(f\"✅ Tunnel: Check Cell 4 output for public URL\")\nprint(f\"\\n📌 DO NOT CLOSE THIS NOTEBOOK!\")\nprint(f\"   The tunnel and WebUI will stop if you do.\")"
+                "import time\nfrom sdbackend.health import HealthMonitor, restart_tunnel_action\nfrom sdbackend.tunnel import find_cloudflared\nfrom sdbackend.profiler import print_summary\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"[5/5] HEALTH MONITOR\")\nprint(\"=\"*70)\n\n# Re-running this cell replaces the previous monitor\nif 'monitor' in globals():\n    monitor.stop()\n\n# Checks WebUI, tunnel, GPU memory and disk every 15 s in the background.\n# After 3 failures in a row the tunnel is restarted / the WebUI reloads its checkpoint\n# to release GPU memory (only while no generation is running).\nmonitor = HealthMonitor(\n    \"http://localhost:7860\",\n    actions={\"tunnel\": [restart_tunnel_action(find_cloudflared(), port=7870)]},\n)\nmonitor.start_in_thread()\n\nprint(\"\\n🔌 Running first health check...\")\ntime.sleep(5)\nmonitor.summary()\n\n# Where the cold start went (earlier sessions are compared when Drive is mounted)\nprint(\"\\n⏱️ Startup timeline:\")\nprint_summary()\n\nprint(\"\\n\" + \"=\"*70)\nprint(\"🎉 SETUP COMPLETE!\")\nprint(\"=\"*70)\nprint(f\"\\n✅ WebUI: http://localhost:7860\")\nprint(f\"✅ API: http://localhost:7860/api\")\nprint(f\"✅ Tunnel: Check Cell 4 output for public URL\")\nprint(f\"\\n💡 Run monitor.summary() in a new cell to see live health\")\nprint(f\"\\n📌 DO NOT CLOSE THIS NOTEBOOK!\")\nprint(f\"   The tunnel and WebUI will stop if you do.\")"
             ]
         }
     ],
@@ -121,12 +130,15 @@ notebook = {
     "nbformat_minor": 2
 }
 
+# Time every cell (Cell 0 installs the startup profiler)
+instrument(notebook)
+
 # Write notebook
 script_dir = os.path.dirname(os.path.abspath(__file__))
 output_path = os.path.join(script_dir, "Google_Colab_Backend_FIXED.ipynb")
 
-with open(output_path, "w") as f:
-    json.dump(notebook, f, indent=2)
+# Unchanged cells leave the file (and its mtime) alone
+result = write_notebook(notebook, output_path, indent=2)
 
-print(f"✅ Created: Google_Colab_Backend_FIXED.ipynb")
+print(describe_write("Google_Colab_Backend_FIXED.ipynb", result))
 print(f"Size: {os.path.getsize(output_path) / 1024:.1f} KB")
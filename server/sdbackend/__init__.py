@@ -0,0 +1,7 @@
+"""
+sdbackend - helper modules used by the Colab backend notebooks.
+
+The notebook generators embed these modules into the generated notebooks
+(see sdbackend.notebook), so everything here must run with the standard
+library alone; heavy packages (torch, PIL, ...) are imported lazily.
+"""
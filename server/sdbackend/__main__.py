@@ -0,0 +1,53 @@
+"""
+Single entry point for the backend tools: python -m sdbackend <command>.
+
+Each command is a module with its own main(argv); the module is only
+imported once its command is chosen, so `--help` and the light commands
+never pay for the heavy imports (PIL, asyncio, torch...) of the others.
+Keep this file to importlib and sys: the start-up budget
+(check_notebooks.py, CLI_BUDGET_S) covers `python -m sdbackend --help`.
+"""
+
+import importlib
+import sys
+
+# command: (module, help)
+COMMANDS = {
+    "launch": ("sdbackend.workers", "run the WebUI (one worker per GPU) behind a dispatcher"),
+    "tunnel": ("sdbackend.tunnel", "open a Cloudflare quick tunnel to a local port"),
+    "proxy": ("sdbackend.proxy", "cache/coalesce/admission proxy in front of the WebUI"),
+    "index": ("sdbackend.hashindex", "hash checkpoints, LoRAs and embeddings once"),
+    "bench": ("sdbackend.loadtest", "replay front-end traffic and report latencies"),
+    "keys": ("sdbackend.gateway", "add, remove or list proxy API keys"),
+    "tags": ("sdbackend.tagstats", "tag frequency and co-occurrence of a dataset"),
+    "session": ("sdbackend.session", "show the saved session snapshot"),
+    "mock": ("sdbackend.mockserver", "CPU-only mock of the WebUI API"),
+}
+
+
+def usage():
+    width = max(map(len, COMMANDS))
+    lines = ["usage: python -m sdbackend <command> [options]", "", "commands:"]
+    lines += [f"  {name:<{width}}  {text}" for name, (_, text) in COMMANDS.items()]
+    lines += ["", "python -m sdbackend <command> --help shows the options of a command."]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help", "help"):
+        print(usage())
+        return 0
+    if argv[0] not in COMMANDS:
+        print(usage(), file=sys.stderr)
+        print(f"\nunknown command {argv[0]!r}", file=sys.stderr)
+        return 2
+    module_name, _ = COMMANDS[argv[0]]
+    module = importlib.import_module(module_name)
+    # argparse in the command module reports errors as "sdbackend <command>"
+    sys.argv[0] = f"sdbackend {argv[0]}"
+    return module.main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Automatic micro-batching of compatible txt2img requests.
+
+The WebUI renders batch_size images in one pass far cheaper than N
+separate calls. MicroBatcher holds single-image requests for a short
+window, merges those that share the checkpoint and every generation
+setting into one upstream call and splits the result back per caller.
+
+The stock /sdapi/v1/txt2img model takes one prompt and one seed, so by
+default only requests with the same prompt/negative prompt and a random
+seed are merged (each caller gets one image and its own seed). With
+per_item=True prompts and seeds are sent as lists instead, for backends
+that accept them (the mock server, or a WebUI patched to pass lists to
+its processing code, which already supports them).
+"""
+
+import collections
+import json
+import threading
+import time
+
+# Requests with any of these set are passed through unbatched
+UNBATCHABLE_KEYS = ("enable_hr", "alwayson_scripts", "script_name", "init_images", "mask")
+
+# The only fields allowed to differ inside a batch (merge() sets them)
+PER_ITEM_KEYS = ("prompt", "negative_prompt", "seed", "batch_size", "n_iter")
+
+
+class _Item:
+    def __init__(self, payload):
+        self.payload = payload
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Merge compatible requests arriving within window seconds.
+
+    run(payload, forward, checkpoint) blocks until the caller's share of
+    the batched result is ready; forward(payload) performs one upstream
+    call and returns (status, headers, body). With a memory guard
+    (sdbackend.memguard.MemoryGuard) groups are also capped at the largest
+    batch the guard expects to fit in VRAM for that resolution.
+    """
+
+    def __init__(self, window=0.05, max_batch=4, per_item=False, guard=None):
+        self.window = window
+        self.max_batch = max_batch
+        self.per_item = per_item
+        self.guard = guard
+        self.lock = threading.Lock()
+        self.groups = {}
+        self.batch_sizes = collections.Counter()
+        self.seconds_per_image = collections.defaultdict(list)
+        self.stats = {"requests": 0, "batched_requests": 0, "upstream_calls": 0, "passthrough": 0}
+
+    def batchable(self, payload):
+        if any(payload.get(key) for key in UNBATCHABLE_KEYS):
+            return False
+        try:
+            if int(payload.get("batch_size", 1)) != 1 or int(payload.get("n_iter", 1)) != 1:
+                return False
+            seed = int(payload.get("seed", -1))
+        except (TypeError, ValueError):
+            # Malformed fields go upstream alone; the WebUI answers them
+            return False
+        if not self.per_item and seed != -1:
+            return False
+        return True
+
+    def group_key(self, payload, checkpoint=None):
+        """Equal for requests that differ only in their per-item fields.
+
+        merge() sends the first request's settings for the whole batch, so
+        anything else (restore_faces, styles, subseeds, eta...) must match.
+        Without per_item the prompts have to match as well.
+        """
+        per_item = PER_ITEM_KEYS if self.per_item else ("seed", "batch_size", "n_iter")
+        shared = {key: value for key, value in payload.items() if key not in per_item}
+        return json.dumps([checkpoint, shared], sort_keys=True, default=str)
+
+    def run(self, payload, forward, checkpoint=None):
+        with self.lock:
+            self.stats["requests"] += 1
+        limit = self.max_batch
+        if self.guard is not None and limit > 1:
+            limit = min(limit, self.guard.max_batch(payload, limit))
+        if limit <= 1 or not self.batchable(payload):
+            with self.lock:
+                self.stats["passthrough"] += 1
+            return forward(payload)
+
+        key = self.group_key(payload, checkpoint)
+        item = _Item(payload)
+        flush_now = None
+        with self.lock:
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = []
+                timer = threading.Timer(self.window, self._flush, args=(key, group, forward))
+                timer.daemon = True
+                timer.start()
+            group.append(item)
+            if len(group) >= limit:
+                del self.groups[key]
+                flush_now = group
+
+        if flush_now is not None:
+            self._execute(flush_now, forward)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _flush(self, key, group, forward):
+        with self.lock:
+            # Already flushed because it filled up before the window ended
+            if self.groups.get(key) is not group:
+                return
+            del self.groups[key]
+        self._execute(group, forward)
+
+    def _execute(self, items, forward):
+        start = time.time()
+        try:
+            if len(items) == 1:
+                results = [forward(items[0].payload)]
+            else:
+                response = forward(self.merge([item.payload for item in items]))
+                results = self.split(response, len(items))
+            for item, result in zip(items, results):
+                item.result = result
+        except Exception as e:
+            for item in items:
+                item.error = e
+        finally:
+            elapsed = time.time() - start
+            with self.lock:
+                self.stats["upstream_calls"] += 1
+                if len(items) > 1:
+                    self.stats["batched_requests"] += len(items)
+                self.batch_sizes[len(items)] += 1
+                samples = self.seconds_per_image[len(items)]
+                samples.append(elapsed / len(items))
+                del samples[:-200]
+            for item in items:
+                item.done.set()
+
+    def merge(self, payloads):
+        """One upstream payload rendering every item of the batch."""
+        merged = dict(payloads[0])
+        merged["batch_size"] = len(payloads)
+        merged["n_iter"] = 1
+        if self.per_item:
+            merged["prompt"] = [p.get("prompt", "") for p in payloads]
+            merged["negative_prompt"] = [p.get("negative_prompt", "") for p in payloads]
+            merged["seed"] = [int(p.get("seed", -1)) for p in payloads]
+        return merged
+
+    def split(self, response, count):
+        """Per-caller responses from one batched (status, headers, body)."""
+        status, headers, body = response
+        if status != 200:
+            return [response] * count
+        data = json.loads(body)
+        images = data.get("images") or []
+        # The WebUI puts a grid in front of batches when return_grid is on
+        if len(images) == count + 1:
+            images = images[1:]
+        try:
+            info = json.loads(data.get("info") or "{}")
+        except ValueError:
+            info = {}
+
+        results = []
+        for index in range(count):
+            item_info = dict(info)
+            for key, single in (("all_seeds", "seed"), ("all_prompts", "prompt"),
+                                ("all_negative_prompts", "negative_prompt"), ("all_subseeds", "subseed")):
+                values = info.get(key)
+                if isinstance(values, list) and index < len(values):
+                    item_info[single] = values[index]
+                    item_info[key] = [values[index]]
+            if isinstance(info.get("infotexts"), list) and index < len(info["infotexts"]):
+                item_info["infotexts"] = [info["infotexts"][index]]
+            item_info["batch_size"] = 1
+            item_info["index_of_first_image"] = 0
+            item = dict(data, images=images[index:index + 1], info=json.dumps(item_info))
+            if isinstance(item.get("parameters"), dict):
+                item["parameters"] = dict(item["parameters"], batch_size=1)
+            results.append((status, headers, json.dumps(item).encode("utf-8")))
+        return results
+
+    def report(self):
+        with self.lock:
+            averages = {size: sum(s) / len(s) for size, s in self.seconds_per_image.items() if s}
+            batched = sum(size * count for size, count in self.batch_sizes.items())
+            gain = None
+            if 1 in averages and batched:
+                # Images per GPU-second achieved vs. rendering everything one by one
+                actual = sum(averages[size] * size * count for size, count in self.batch_sizes.items())
+                gain = round(averages[1] * batched / actual, 3) if actual else None
+            return dict(self.stats,
+                        batch_sizes={str(size): count for size, count in sorted(self.batch_sizes.items())},
+                        seconds_per_image={str(size): round(avg, 4) for size, avg in sorted(averages.items())},
+                        throughput_gain=gain)
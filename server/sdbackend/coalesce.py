@@ -0,0 +1,76 @@
+"""
+Request coalescing for identical in-flight generation calls.
+
+When the tunnel times out, SDAPIClient retries while the first request
+is still rendering. Coalescer lets the proxy attach every caller with
+the same canonical request key to the job that is already running, so
+all of them receive that one result and the GPU renders it once.
+"""
+
+import threading
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.shared = True
+        self.waiters = 0
+
+
+class Coalescer:
+    """Run at most one call per key at a time; duplicates share its result."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.stats = {"executed": 0, "coalesced": 0, "unshared": 0, "max_waiters": 0}
+
+    def run(self, key, fn, share=None):
+        """Return (fn() result, shared) where shared is True for attached callers.
+
+        Exceptions raised by the leader's fn() are re-raised in every waiter.
+        When the leader's share(result) is false (a reply that only holds
+        for the leader, such as its own rate limit) the waiters are not
+        given the result and run again under a new flight instead.
+        """
+        while True:
+            with self.lock:
+                flight = self.inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self.inflight[key] = _Flight()
+                    self.stats["executed"] += 1
+                else:
+                    flight.waiters += 1
+                    self.stats["coalesced"] += 1
+                    self.stats["max_waiters"] = max(self.stats["max_waiters"], flight.waiters)
+            if leader:
+                break
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            if flight.shared:
+                return flight.result, True
+
+        try:
+            flight.result = fn()
+            if share is not None and not share(flight.result):
+                flight.shared = False
+                with self.lock:
+                    self.stats["unshared"] += flight.waiters
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            flight.done.set()
+        return flight.result, False
+
+    def report(self):
+        with self.lock:
+            total = self.stats["executed"] + self.stats["coalesced"]
+            return dict(self.stats, in_flight=len(self.inflight),
+                        coalesced_rate=round(self.stats["coalesced"] / total, 4) if total else 0.0)
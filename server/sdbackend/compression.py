@@ -0,0 +1,160 @@
+"""
+Negotiated response compression for the front proxy.
+
+cloudflared forwards the WebUI's JSON (model lists, options, LoRA
+metadata, base64 results) at full size. Compressor picks the best
+encoding the client accepts (zstd, br, gzip; brotli and zstandard are
+optional packages), skips small and already-compressed bodies, and keeps
+the compressed variants of recent bodies keyed by content digest, so a
+repeated model list or a generation cache hit is compressed only once.
+"""
+
+import collections
+import gzip
+import hashlib
+import threading
+import time
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml",
+                      "application/xml")
+
+# Preference when the client accepts several with the same q-value
+PREFERENCE = ("zstd", "br", "gzip")
+
+
+def _gzip(level):
+    return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(level):
+    import brotli
+    return lambda data: brotli.compress(data, quality=level)
+
+
+def _zstd(level):
+    import zstandard
+    compressor = zstandard.ZstdCompressor(level=level)
+    return compressor.compress
+
+
+FACTORIES = {"gzip": (_gzip, 6), "br": (_brotli, 5), "zstd": (_zstd, 6)}
+
+
+def available_codecs(levels=None):
+    """{encoding: compress function} for every codec that can be imported."""
+    codecs = {}
+    for name, (factory, default_level) in FACTORIES.items():
+        try:
+            codecs[name] = factory((levels or {}).get(name, default_level))
+        except ImportError:
+            continue
+    return codecs
+
+
+def parse_accept_encoding(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in (header or "").split(","):
+        fields = [field.strip() for field in part.split(";")]
+        if not fields[0]:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            if param.lower().startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[fields[0].lower()] = q
+    return accepted
+
+
+def negotiate(header, available):
+    """Best encoding in available the client accepts, or None for identity."""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*")
+    best, best_q = None, 0.0
+    for name in PREFERENCE:
+        if name not in available:
+            continue
+        q = accepted.get(name, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compressible(content_type):
+    content_type = (content_type or "").lower()
+    return any(content_type.startswith(prefix) for prefix in COMPRESSIBLE_TYPES)
+
+
+class Compressor:
+    """Compress responses; compressed variants are kept in a byte-bounded LRU."""
+
+    def __init__(self, min_size=1024, levels=None, cache_bytes=64 * 1024**2):
+        self.min_size = min_size
+        self.codecs = available_codecs(levels)
+        self.cache_bytes = cache_bytes
+        self.lock = threading.Lock()
+        self.variants = collections.OrderedDict()
+        self.variant_bytes = 0
+        self.stats = {"compressed": 0, "skipped": 0, "variant_hits": 0, "bytes_in": 0, "bytes_out": 0,
+                      "compress_seconds": 0.0}
+        self.encodings = collections.Counter()
+
+    def compress(self, body, encoding):
+        """Compressed body for encoding, from the variant cache when possible."""
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        with self.lock:
+            data = self.variants.get(key)
+            if data is not None:
+                self.variants.move_to_end(key)
+                self.stats["variant_hits"] += 1
+                return data
+        start = time.perf_counter()
+        data = self.codecs[encoding](body)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.stats["compress_seconds"] += elapsed
+            if len(data) <= self.cache_bytes and key not in self.variants:
+                self.variants[key] = data
+                self.variant_bytes += len(data)
+                while self.variant_bytes > self.cache_bytes:
+                    _, evicted = self.variants.popitem(last=False)
+                    self.variant_bytes -= len(evicted)
+        return data
+
+    def apply(self, accept_encoding, status, headers, body):
+        """Return (headers, body), compressed if negotiated and worthwhile."""
+        names = {key.lower(): value for key, value in headers}
+        if (status != 200 or len(body) < self.min_size or "content-encoding" in names
+                or not compressible(names.get("content-type"))):
+            self.stats["skipped"] += 1
+            return headers, body
+        encoding = negotiate(accept_encoding, self.codecs)
+        if encoding is None:
+            self.stats["skipped"] += 1
+            return headers, body
+        data = self.compress(body, encoding)
+        if len(data) >= len(body):
+            self.stats["skipped"] += 1
+            return headers, body
+        self.stats["compressed"] += 1
+        self.stats["bytes_in"] += len(body)
+        self.stats["bytes_out"] += len(data)
+        self.encodings[encoding] += 1
+        vary = ", ".join([names["vary"], "Accept-Encoding"] if "vary" in names else ["Accept-Encoding"])
+        # A strong ETag names the identity bytes, so it cannot be kept as-is
+        headers = [(key, value) for key, value in headers if key.lower() not in ("vary", "etag")]
+        return headers + [("Content-Encoding", encoding), ("Vary", vary)], data
+
+    def report(self):
+        with self.lock:
+            ratio = self.stats["bytes_out"] / self.stats["bytes_in"] if self.stats["bytes_in"] else None
+            return dict(self.stats,
+                        compress_seconds=round(self.stats["compress_seconds"], 4),
+                        ratio=round(ratio, 4) if ratio is not None else None,
+                        encodings=dict(self.encodings),
+                        codecs=sorted(self.codecs),
+                        variants=len(self.variants),
+                        variant_bytes=self.variant_bytes)
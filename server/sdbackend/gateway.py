@@ -0,0 +1,354 @@
+"""
+Admission control at the tunnel edge: API keys, rate limits and quotas.
+
+A trycloudflare URL is public, so anyone who finds it can queue work on
+the GPU. With a Gateway attached, the proxy admits a request only when
+  * it carries a known API key: "Authorization: Bearer <key>",
+    "X-API-Key: <key>", or ?key=<key> for EventSource/<img> URLs that
+    cannot set headers
+  * the key's request bucket has a token (rate per minute, burst)
+  * for generations, the key has fewer than `concurrency` jobs running
+    and its cost bucket covers the job. Cost is steps x pixels x images,
+    hires pass included, in units of one 20-step 512x512 image; the
+    bucket holds `quota` units and refills at quota per hour
+  * the backend can finish the job within the key's max_wait. The wait
+    is estimated from the cost already admitted and the measured
+    throughput, so excess work is shed with 503 before it is queued,
+    and short max_wait keys are shed first
+Rejections are 401/429/503 with Retry-After, answered by the proxy.
+CORS preflights pass without a key, and addresses that keep failing
+authentication are throttled.
+
+Keys file (JSON, created with one "owner" key by ensure_keys()):
+    {"keys": {"sdk_...": {"name": "owner", "rate": 300, "quota": 1200}}}
+
+    python -m sdbackend.gateway add friend --quota 200 --max-wait 60
+    python -m sdbackend.gateway list
+
+Load tests against a protected proxy need a key too:
+    python -m sdbackend.loadtest --url http://localhost:7870 --key sdk_...
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import secrets
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+KEYS_PATH = "/content/sdbackend_keys.json"
+DRIVE_KEYS_PATH = "/content/drive/MyDrive/sdbackend/keys.json"
+AUTH_HEADERS = {"authorization", "x-api-key"}
+
+# Per-key limits; a key's entry in the keys file overrides any of them
+DEFAULT_LIMITS = {
+    "rate": 300,        # requests per minute (progress polling included)
+    "burst": 60,        # requests allowed at once
+    "concurrency": 2,   # generations running at the same time
+    "quota": 600,       # cost units per hour (one unit = 20 steps at 512x512)
+    "max_wait": 120,    # seconds of queued work this key is willing to wait behind
+}
+UNIT_COST = 20 * 512 * 512
+
+
+class GatewayError(Exception):
+    """A rejected request: HTTP status, and seconds until a retry can succeed."""
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def default_keys_path():
+    """Google Drive when mounted (keys survive the VM), else local disk."""
+    return DRIVE_KEYS_PATH if os.path.isdir("/content/drive/MyDrive") else KEYS_PATH
+
+
+def new_key():
+    return "sdk_" + secrets.token_urlsafe(24)
+
+
+def load_keys(path):
+    try:
+        with open(path) as f:
+            return json.load(f).get("keys", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_keys(path, keys):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        json.dump({"keys": keys}, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def ensure_keys(path=None):
+    """Keys from path, creating the file with one owner key when missing.
+
+    Returns (keys, created key or None).
+    """
+    path = path or default_keys_path()
+    keys = load_keys(path)
+    if keys:
+        return keys, None
+    key = new_key()
+    keys = {key: {"name": "owner", "rate": 600, "burst": 120, "concurrency": 4,
+                  "quota": 3000, "max_wait": 600}}
+    save_keys(path, keys)
+    return keys, key
+
+
+def job_cost(payload, mode="txt2img"):
+    """Cost of a generation in units of one 20-step 512x512 image."""
+    def number(name, default):
+        try:
+            return float(payload.get(name) if payload.get(name) is not None else default)
+        except (TypeError, ValueError):
+            return float(default)
+
+    steps = number("steps", 20)
+    if mode == "img2img":
+        steps = max(1.0, steps * number("denoising_strength", 0.75))
+    pixels = number("width", 512) * number("height", 512)
+    images = max(1.0, number("batch_size", 1)) * max(1.0, number("n_iter", 1))
+    cost = steps * pixels * images
+    if mode == "txt2img" and payload.get("enable_hr"):
+        scale = number("hr_scale", 2.0)
+        hr_steps = number("hr_second_pass_steps", 0) or steps
+        cost += hr_steps * pixels * scale * scale * images
+    return cost / UNIT_COST
+
+
+class TokenBucket:
+    """capacity tokens, refilled at rate per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount=1.0):
+        """Take amount tokens; returns 0, or the seconds until they would be there."""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+    def give_back(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class Client:
+    """State of one API key."""
+
+    def __init__(self, name, limits):
+        self.name = name
+        self.limits = limits
+        self.requests = TokenBucket(limits["rate"] / 60, limits["burst"])
+        self.budget = TokenBucket(limits["quota"] / 3600, limits["quota"])
+        self.running = 0
+        self.stats = {"requests": 0, "generations": 0, "cost": 0.0, "rejected": 0}
+
+
+class Ticket:
+    def __init__(self, client, cost):
+        self.client = client
+        self.cost = cost
+        self.start = time.monotonic()
+
+
+class Gateway:
+    """Authenticates requests and admits generations (see the module docstring).
+
+    keys maps API key -> limits (as in the keys file); throughput is the
+    cost units per second assumed until real jobs have been measured.
+    """
+
+    def __init__(self, keys, max_jobs=32, throughput=0.3, window=300.0,
+                 auth_failures_per_minute=10):
+        self.lock = threading.Lock()
+        self.clients = {}
+        for key, entry in keys.items():
+            limits = dict(DEFAULT_LIMITS, **{k: v for k, v in entry.items() if k in DEFAULT_LIMITS})
+            self.clients[self._digest(key)] = Client(entry.get("name") or key[:8], limits)
+        self.max_jobs = max_jobs
+        self.initial_throughput = throughput
+        self.window = window
+        self.failure_rate = auth_failures_per_minute
+        self.failures = {}
+        self.outstanding_jobs = 0
+        self.outstanding_cost = 0.0
+        self._work = 0.0
+        self._busy = 0.0
+        self._clock = time.monotonic()
+        self.stats = {"unauthorized": 0, "rate_limited": 0, "over_concurrency": 0,
+                      "over_quota": 0, "shed": 0, "admitted": 0}
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def request_key(headers, path):
+        """The API key a request carries, or None."""
+        headers = {key.lower(): value for key, value in headers.items()}
+        authorization = headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            return authorization[7:].strip()
+        if headers.get("x-api-key"):
+            return headers["x-api-key"].strip()
+        values = parse_qs(urlparse(path).query).get("key")
+        return values[0] if values else None
+
+    # -- requests ---------------------------------------------------------
+
+    def authenticate(self, headers, path, address="local"):
+        """The Client for a request; raises GatewayError when it is not let in."""
+        key = self.request_key(headers, path)
+        client = self.clients.get(self._digest(key)) if key else None
+        with self.lock:
+            if client is None:
+                self.stats["unauthorized"] += 1
+                bucket = self.failures.get(address)
+                if bucket is None:
+                    if len(self.failures) > 10000:
+                        self.failures.clear()
+                    bucket = self.failures[address] = TokenBucket(self.failure_rate / 60, self.failure_rate)
+                wait = bucket.take()
+                if wait:
+                    raise GatewayError(429, "Too many failed authentication attempts", math.ceil(wait))
+                raise GatewayError(401, "Missing or unknown API key")
+            client.stats["requests"] += 1
+            wait = client.requests.take()
+            if wait:
+                self.stats["rate_limited"] += 1
+                client.stats["rejected"] += 1
+                raise GatewayError(429, f"Rate limit of {client.limits['rate']} requests/min exceeded",
+                                   math.ceil(wait))
+        return client
+
+    # -- generations ------------------------------------------------------
+
+    def _advance(self):
+        """Decay the throughput counters to now (called with the lock held)."""
+        now = time.monotonic()
+        elapsed = now - self._clock
+        decay = math.exp(-elapsed / self.window)
+        self._work *= decay
+        self._busy = self._busy * decay + (elapsed if self.outstanding_jobs else 0.0)
+        self._clock = now
+
+    def throughput(self):
+        """Cost units the backend finishes per busy second."""
+        if self._busy < 10 or self._work <= 0:
+            return self.initial_throughput
+        return self._work / self._busy
+
+    def estimated_wait(self, cost=0.0):
+        with self.lock:
+            self._advance()
+            return (self.outstanding_cost + cost) / self.throughput()
+
+    def admit(self, client, payload, mode="txt2img"):
+        """Admit one generation; returns a Ticket for finish(), or raises GatewayError."""
+        cost = job_cost(payload, mode)
+        with self.lock:
+            self._advance()
+            limits = client.limits
+            if client.running >= limits["concurrency"]:
+                self.stats["over_concurrency"] += 1
+                client.stats["rejected"] += 1
+                raise GatewayError(429, f"At most {limits['concurrency']} generations at a time per key", 5)
+            # The work already queued ahead of this job decides its latency
+            wait = (self.outstanding_cost + cost) / self.throughput()
+            if self.outstanding_jobs >= self.max_jobs or (self.outstanding_jobs and wait > limits["max_wait"]):
+                self.stats["shed"] += 1
+                client.stats["rejected"] += 1
+                retry = max(1, math.ceil(wait - limits["max_wait"])) if wait > limits["max_wait"] else 10
+                raise GatewayError(503, f"Server busy (about {wait:.0f}s of work queued)", retry)
+            refill = client.budget.take(min(cost, client.budget.capacity))
+            if refill:
+                self.stats["over_quota"] += 1
+                client.stats["rejected"] += 1
+                raise GatewayError(429, f"Quota of {limits['quota']} units/hour used up "
+                                        f"(this job costs {cost:.1f})", math.ceil(refill))
+            client.running += 1
+            client.stats["generations"] += 1
+            client.stats["cost"] += cost
+            self.outstanding_jobs += 1
+            self.outstanding_cost += cost
+            self.stats["admitted"] += 1
+        return Ticket(client, cost)
+
+    def finish(self, ticket, ok=True):
+        """Release a ticket; failed jobs get their cost back."""
+        with self.lock:
+            self._advance()
+            ticket.client.running -= 1
+            self.outstanding_jobs -= 1
+            self.outstanding_cost = max(0.0, self.outstanding_cost - ticket.cost)
+            if ok:
+                self._work += ticket.cost
+            else:
+                ticket.client.budget.give_back(min(ticket.cost, ticket.client.budget.capacity))
+
+    def report(self):
+        with self.lock:
+            self._advance()
+            return dict(self.stats, jobs=self.outstanding_jobs,
+                        queued_cost=round(self.outstanding_cost, 2),
+                        throughput=round(self.throughput(), 3),
+                        estimated_wait=round(self.outstanding_cost / self.throughput(), 1),
+                        clients={client.name: dict(client.stats, cost=round(client.stats["cost"], 2),
+                                                   running=client.running,
+                                                   quota_left=round(client.budget.tokens, 1))
+                                 for client in self.clients.values()})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the proxy's API keys")
+    parser.add_argument("--keys", default=None, help="keys file (default: Drive when mounted)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="create a key")
+    add.add_argument("name")
+    for name, value in DEFAULT_LIMITS.items():
+        add.add_argument("--" + name.replace("_", "-"), type=int, default=None, help=f"default {value}")
+    remove = commands.add_parser("remove", help="delete the keys with this name")
+    remove.add_argument("name")
+    commands.add_parser("list", help="show the keys and their limits")
+    args = parser.parse_args(argv)
+
+    path = args.keys or default_keys_path()
+    keys = load_keys(path)
+    if args.command == "add":
+        key = new_key()
+        keys[key] = dict({"name": args.name}, **{name: getattr(args, name) for name in DEFAULT_LIMITS
+                                                 if getattr(args, name) is not None})
+        save_keys(path, keys)
+        print(f"🔑 {args.name}: {key}")
+    elif args.command == "remove":
+        kept = {key: entry for key, entry in keys.items() if entry.get("name") != args.name}
+        save_keys(path, kept)
+        print(f"🗑️ Removed {len(keys) - len(kept)} key(s)")
+    else:
+        for key, entry in keys.items():
+            limits = dict(DEFAULT_LIMITS, **{k: v for k, v in entry.items() if k in DEFAULT_LIMITS})
+            print(f"{entry.get('name', '?'):<12} {key[:10]}…  " + ", ".join(f"{k}={v}" for k, v in limits.items()))
+        print(f"({len(keys)} key(s) in {path})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Generation result cache keyed on deterministic generation parameters.
+
+A txt2img/img2img call with a fixed seed and identical parameters always
+produces the same image, so the proxy can answer repeats (page reloads,
+retries through a flaky tunnel) from disk instead of the GPU.
+request_key() canonicalizes the payload together with the loaded
+checkpoint/VAE; GenerationCache stores response bodies on disk with a
+size-bounded LRU and tracks its hit rate.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import re
+import threading
+
+CACHE_DIR = "/content/sdbackend_cache/generations"
+
+# Payload keys that never change the generated pixels
+IGNORED_KEYS = {"save_images", "do_not_save_samples", "do_not_save_grid", "force_task_id"}
+
+# Defaults the front end may omit or send explicitly (sd-api-client.js)
+DEFAULTS = {
+    "negative_prompt": "",
+    "steps": 20,
+    "sampler_name": "Euler",
+    "cfg_scale": 7.0,
+    "width": 512,
+    "height": 512,
+    "batch_size": 1,
+    "n_iter": 1,
+    "subseed": -1,
+    "subseed_strength": 0.0,
+    "denoising_strength": 0.75,
+    "send_images": True,
+}
+
+LORA_PATTERN = re.compile(r"<lora:([^:>]+)(?::([^>]*))?>")
+
+
+def _normalize(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def seed_value(value):
+    """A seed as int; -1 (random) for a missing, null or malformed seed."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+
+def _number(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def is_deterministic(payload):
+    """True when the payload pins every random input (seed, subseed)."""
+    if seed_value(payload.get("seed", -1)) == -1:
+        return False
+    if _number(payload.get("subseed_strength")) > 0 and seed_value(payload.get("subseed", -1)) == -1:
+        return False
+    return True
+
+
+def canonical_payload(payload, mode="txt2img", options=None):
+    """Canonical form of a generation request, including model state.
+
+    options are the WebUI options in effect (sd_model_checkpoint carries
+    the checkpoint hash, sd_vae the VAE); LoRAs referenced from the prompt
+    are listed explicitly as a sorted set.
+    """
+    canonical = dict(DEFAULTS)
+    canonical.update({key: value for key, value in payload.items() if key not in IGNORED_KEYS})
+    if mode == "txt2img" and "denoising_strength" not in payload:
+        # Only meaningful for hires fix, which sends it explicitly
+        del canonical["denoising_strength"]
+    options = options or {}
+    canonical["_mode"] = mode
+    canonical["_checkpoint"] = options.get("sd_model_checkpoint")
+    canonical["_vae"] = options.get("sd_vae")
+    canonical["_loras"] = sorted(
+        f"{name}:{_number(weight or 1, 1.0):g}"
+        for name, weight in LORA_PATTERN.findall(str(payload.get("prompt", "")))
+    )
+    return _normalize(canonical)
+
+
+def request_key(payload, mode="txt2img", options=None):
+    """sha256 of the canonical payload; equal keys mean identical results."""
+    canonical = canonical_payload(payload, mode, options)
+    data = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Disk-backed response cache with LRU eviction by total bytes."""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=2 * 1024**3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "uncacheable": 0, "stores": 0, "evictions": 0}
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".json"):
+                    path = os.path.join(dirpath, name)
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key):
+        """Stored response body for key, or None (counts a hit or miss)."""
+        with self.lock:
+            if key not in self.entries:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+        try:
+            with open(self.path(key), "rb") as f:
+                body = f.read()
+            os.utime(self.path(key))
+        except OSError:
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+                self.stats["misses"] += 1
+            return None
+        with self.lock:
+            self.stats["hits"] += 1
+        return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.total_bytes += len(body) - self.entries.pop(key, 0)
+            self.entries[key] = len(body)
+            self.stats["stores"] += 1
+            while self.total_bytes > self.max_bytes and self.entries:
+                old_key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                self.stats["evictions"] += 1
+                try:
+                    os.remove(self.path(old_key))
+                except OSError:
+                    pass
+
+    def count_uncacheable(self):
+        with self.lock:
+            self.stats["uncacheable"] += 1
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def report(self):
+        return dict(self.stats, hit_rate=round(self.hit_rate(), 4), entries=len(self.entries),
+                    bytes=self.total_bytes, max_bytes=self.max_bytes)
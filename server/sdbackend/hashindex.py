@@ -0,0 +1,349 @@
+"""
+Checkpoint, LoRA and embedding hash index, computed once and reused.
+
+The WebUI hashes model files lazily: the first load of a multi-GB
+checkpoint waits for a full SHA256, and images can only be matched to a
+model by the "Model hash" in their metadata once that has happened.
+HashIndex hashes every model file in one pass per file (mmap, large
+slices, one file per thread-pool worker; hashlib releases the GIL), and
+keeps the results in a JSON index keyed by path and validated by
+inode + size + mtime, so an unchanged file is never read again. The
+known hashes are also written into the WebUI's own hash cache
+(cache.json) before the WebUI starts, so model switches do not wait on
+hashing either. The WebUI rewrites that file while it runs, so files
+hashed after the launch reach it on the next start.
+
+Every entry has the hashes A1111 shows:
+  sha256   full SHA256 of the file
+  autov2   sha256[:10], the "Model hash" of checkpoints
+  short    sha256[:12], used for embeddings ("TI hashes")
+  legacy   the old 8-digit model hash (64 KiB at offset 1 MiB)
+  addnet   SHA256 of the tensor data of a .safetensors file (header
+           skipped); LoRA hashes use its first 12 digits
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+
+WEBUI_DIR = "/root/stable-diffusion-webui"
+MODEL_DIRS = {
+    "checkpoint": "models/Stable-diffusion",
+    "lora": "models/Lora",
+    "embedding": "embeddings",
+}
+MODEL_EXTENSIONS = (".safetensors", ".ckpt", ".pt", ".pth", ".bin")
+INDEX_PATH = "/content/sdbackend_hashes.json"
+DRIVE_INDEX_PATH = "/content/drive/MyDrive/sdbackend/hashes.json"
+CHUNK_SIZE = 64 * 1024**2
+
+
+def default_index_path():
+    """Google Drive when mounted (survives the VM), else local disk."""
+    return DRIVE_INDEX_PATH if os.path.isdir("/content/drive/MyDrive") else INDEX_PATH
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """{"sha256", "legacy", "addnet"} of one file, read once through mmap."""
+    full = hashlib.sha256()
+    addnet = hashlib.sha256() if path.lower().endswith(".safetensors") else None
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return {"sha256": full.hexdigest(), "legacy": None, "addnet": None}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                data.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(data)
+            try:
+                legacy = hashlib.sha256(view[0x100000:0x110000]).hexdigest()[:8]
+                # .safetensors: 8-byte little-endian header length, JSON header, tensor data
+                data_start = 8 + struct.unpack("<Q", view[:8])[0] if addnet and size >= 8 else size
+                for offset in range(0, size, chunk_size):
+                    with view[offset:offset + chunk_size] as chunk:
+                        full.update(chunk)
+                        if addnet and offset + len(chunk) > data_start:
+                            addnet.update(chunk[max(0, data_start - offset):])
+            finally:
+                view.release()
+    return {"sha256": full.hexdigest(), "legacy": legacy,
+            "addnet": addnet.hexdigest() if addnet and data_start <= size else None}
+
+
+class HashIndex:
+    """Hashes of the model files under webui_dir, persisted at path."""
+
+    def __init__(self, path=None, webui_dir=WEBUI_DIR, model_dirs=None, workers=4,
+                 chunk_size=CHUNK_SIZE, verbose=True):
+        self.path = path or default_index_path()
+        self.webui_dir = webui_dir
+        self.model_dirs = model_dirs or MODEL_DIRS
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self._by_hash = {}
+        self._by_name = {}
+        self.ready = threading.Event()
+        self.stats = {"hashed": 0, "reused": 0, "errors": 0, "bytes_hashed": 0, "hash_seconds": 0.0,
+                      "lookups": 0, "lookup_misses": 0}
+        self._rebuild()
+
+    # -- persistence ----------------------------------------------------
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f).get("entries", {})
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        with self.lock:
+            data = json.dumps({"version": 1, "entries": self.entries})
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    # -- scanning -------------------------------------------------------
+
+    def files(self):
+        """[(kind, name, path, stat)] of every model file; name is relative to its folder."""
+        found = []
+        for kind, folder in self.model_dirs.items():
+            root = os.path.join(self.webui_dir, folder)
+            for dirpath, _, filenames in os.walk(root, followlinks=True):
+                for filename in filenames:
+                    if not filename.lower().endswith(MODEL_EXTENSIONS):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((kind, os.path.relpath(path, root).replace(os.sep, "/"), path, stat))
+        return found
+
+    @staticmethod
+    def _current(entry, stat):
+        return (entry is not None and entry.get("inode") == stat.st_ino and entry.get("size") == stat.st_size
+                and entry.get("mtime") == stat.st_mtime)
+
+    def _hash(self, kind, name, path, stat):
+        start = time.time()
+        hashes = hash_file(path, self.chunk_size)
+        elapsed = time.time() - start
+        entry = {
+            "kind": kind,
+            "name": name,
+            "inode": stat.st_ino,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": hashes["sha256"],
+            "autov2": hashes["sha256"][:10],
+            "short": hashes["sha256"][:12],
+            "legacy": hashes["legacy"],
+            "addnet": hashes["addnet"],
+            "hashed": time.time(),
+        }
+        with self.lock:
+            self.entries[path] = entry
+            self.stats["hashed"] += 1
+            self.stats["bytes_hashed"] += stat.st_size
+            self.stats["hash_seconds"] += elapsed
+            if self.verbose:
+                print(f"   #️⃣ {kind} {name}: {entry['autov2']} ({stat.st_size / 1024**3:.1f} GB in {elapsed:.1f}s)")
+        return entry
+
+    def scan(self):
+        """Hash new and changed files, drop deleted ones; returns what was done."""
+        files = self.files()
+        present = {path for _, _, path, _ in files}
+        stale = [item for item in files if not self._current(self.entries.get(item[2]), item[3])]
+        with self.lock:
+            removed = [path for path in self.entries if path not in present]
+            for path in removed:
+                del self.entries[path]
+            self.stats["reused"] += len(files) - len(stale)
+        # Largest first, so one big checkpoint does not finish last on its own
+        stale.sort(key=lambda item: -item[3].st_size)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._hash, *item) for item in stale]
+            for future in futures:
+                try:
+                    future.result()
+                except OSError as e:
+                    self.stats["errors"] += 1
+                    if self.verbose:
+                        print(f"   ⚠️ Could not hash a model file: {e}")
+        self._rebuild()
+        if stale or removed:
+            self.save()
+        self.ready.set()
+        return {"files": len(files), "hashed": len(stale), "removed": len(removed)}
+
+    def start_in_thread(self):
+        """Scan in a daemon thread.
+
+        The WebUI's cache.json is not touched: the WebUI may be running and
+        overwrites it with its own copy, so call export_webui_cache() before
+        launching it instead.
+        """
+        thread = threading.Thread(target=self.scan, daemon=True)
+        thread.start()
+        return thread
+
+    # -- lookup ---------------------------------------------------------
+
+    def _rebuild(self):
+        by_hash, by_name = {}, {}
+        with self.lock:
+            for path, entry in self.entries.items():
+                for field in ("sha256", "autov2", "short", "legacy", "addnet"):
+                    if entry.get(field):
+                        by_hash.setdefault(entry[field], []).append(path)
+                if entry.get("addnet"):
+                    by_hash.setdefault(entry["addnet"][:12], []).append(path)
+                stem = os.path.splitext(os.path.basename(entry["name"]))[0].lower()
+                for name in {entry["name"].lower(), stem}:
+                    by_name.setdefault(name, []).append(path)
+            self._by_hash, self._by_name = by_hash, by_name
+
+    def lookup(self, value):
+        """Entries matching a hash (full, AutoV2, short, legacy, addnet) or a model name.
+
+        Accepts what image metadata carries: "Model hash: 6ce0161689",
+        "sd_model_checkpoint" titles like "model.safetensors [6ce0161689]"
+        or a bare name. Returns [{"path", ...entry}].
+        """
+        value = str(value or "").strip()
+        candidates = [value]
+        if value.endswith("]") and "[" in value:
+            # A WebUI title: "name.safetensors [hash]"
+            name, _, digest = value[:-1].rpartition("[")
+            candidates = [digest.strip(), name.strip()]
+        self.stats["lookups"] += 1
+        paths = []
+        for candidate in candidates:
+            key = candidate.lower()
+            paths = self._by_hash.get(key) or self._by_name.get(key)
+            if not paths and len(key) >= 8 and all(c in "0123456789abcdef" for c in key):
+                paths = [path for digest, matched in self._by_hash.items() if digest.startswith(key)
+                         for path in matched]
+            if paths:
+                break
+        if not paths:
+            self.stats["lookup_misses"] += 1
+            return []
+        with self.lock:
+            return [dict(self.entries[path], path=path) for path in dict.fromkeys(paths) if path in self.entries]
+
+    # -- WebUI cache ----------------------------------------------------
+
+    def export_webui_cache(self, cache_path=None):
+        """Merge the hashes into the WebUI's cache.json (what sha256_from_cache reads).
+
+        Checkpoints are cached as "checkpoint/<name>" (subfolder
+        included), embeddings as "textual_inversion/<stem>" and
+        .safetensors LoRAs as "lora/<stem>" under "hashes-addnet" (other
+        LoRAs under "hashes"); like the WebUI, stems drop the subfolder.
+        Only call this while the WebUI is stopped. Returns the number of
+        entries written.
+        """
+        cache_path = cache_path or os.path.join(self.webui_dir, "cache.json")
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        written = 0
+        with self.lock:
+            entries = list(self.entries.values())
+        for entry in entries:
+            stem = os.path.splitext(os.path.basename(entry["name"]))[0]
+            if entry["kind"] == "checkpoint":
+                section, title, digest = "hashes", f"checkpoint/{entry['name']}", entry["sha256"]
+            elif entry["kind"] == "embedding":
+                section, title, digest = "hashes", f"textual_inversion/{stem}", entry["sha256"]
+            elif entry.get("addnet"):
+                section, title, digest = "hashes-addnet", f"lora/{stem}", entry["addnet"]
+            else:
+                section, title, digest = "hashes", f"lora/{stem}", entry["sha256"]
+            cache.setdefault(section, {})[title] = {"mtime": entry["mtime"], "sha256": digest}
+            written += 1
+        if written:
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cache, f, indent=4)
+            os.replace(tmp_path, cache_path)
+        return written
+
+    def report(self):
+        with self.lock:
+            kinds = {}
+            for entry in self.entries.values():
+                kinds[entry["kind"]] = kinds.get(entry["kind"], 0) + 1
+            seconds = self.stats["hash_seconds"]
+            return dict(self.stats,
+                        hash_seconds=round(seconds, 2),
+                        mb_per_s=round(self.stats["bytes_hashed"] / 1024**2 / seconds, 1) if seconds else None,
+                        files=len(self.entries),
+                        kinds=kinds,
+                        ready=self.ready.is_set())
+
+
+def serve_hashes(index, handler):
+    """Answer GET /sdbackend/hashes[/<hash or name>] on a BaseHTTPRequestHandler.
+
+    Without a value the whole index is listed; otherwise the matching
+    models are returned, or 404 when nothing matches.
+    """
+    value = unquote(urlparse(handler.path).path[len("/sdbackend/hashes"):]).strip("/")
+    if value:
+        matches = index.lookup(value)
+        status, data = (200, {"query": value, "models": matches}) if matches else \
+            (404, {"detail": f"No model with hash or name {value!r}", "ready": index.ready.is_set()})
+    else:
+        with index.lock:
+            models = [dict(entry, path=path) for path, entry in index.entries.items()]
+        status, data = 200, {"ready": index.ready.is_set(), "models": models}
+    body = json.dumps(data).encode("utf-8")
+    handler.send_response(status)
+    handler.send_header("Content-Type", "application/json")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.send_header("Access-Control-Allow-Origin", "*")
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hash the WebUI's model files into the index")
+    parser.add_argument("--index", default=None, help="index file (default: Drive when mounted)")
+    parser.add_argument("--webui-dir", default=WEBUI_DIR)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--no-webui-cache", action="store_true", help="do not update the WebUI's cache.json")
+    parser.add_argument("--lookup", default=None, metavar="HASH_OR_NAME", help="print the matching models")
+    args = parser.parse_args(argv)
+
+    index = HashIndex(args.index, args.webui_dir, workers=args.workers)
+    if args.lookup:
+        print(json.dumps(index.lookup(args.lookup), indent=2))
+        return
+    done = index.scan()
+    written = 0 if args.no_webui_cache else index.export_webui_cache()
+    print(f"#️⃣ {done['files']} model files in {index.path}: {done['hashed']} hashed, "
+          f"{done['removed']} removed, {written} WebUI cache entries written")
+
+
+if __name__ == "__main__":
+    main()
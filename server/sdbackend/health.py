@@ -0,0 +1,260 @@
+"""
+Async health monitor for the Colab backend.
+
+Checks the local WebUI, the tunnel (through its public URL), GPU memory
+pressure and disk space in parallel with short timeouts, keeps a rolling
+history and runs recovery actions (restart the tunnel, have the WebUI
+reload its checkpoint to release GPU memory) after repeated failures of
+a check.
+
+In a notebook the kernel already runs an event loop, so use
+HealthMonitor.start_in_thread() there; asyncio.run(monitor.run()) works
+everywhere else.
+"""
+
+import asyncio
+import collections
+import json
+import shutil
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from sdbackend import tunnel
+
+DEFAULT_URL = "http://localhost:7860"
+
+
+def _http_get(url, timeout):
+    request = urllib.request.Request(url, headers={"Accept": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+    return json.loads(body) if body else {}
+
+
+def _http_post(url, timeout):
+    request = urllib.request.Request(url, data=b"{}", headers={"Content-Type": "application/json",
+                                                               "Accept": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+    return json.loads(body) if body else {}
+
+
+def gpu_memory_from_webui(webui_url=DEFAULT_URL, timeout=3):
+    """(used_bytes, total_bytes) from the WebUI's /sdapi/v1/memory, or None."""
+    data = _http_get(webui_url.rstrip("/") + "/sdapi/v1/memory", timeout)
+    system = (data.get("cuda") or {}).get("system") or {}
+    if not system.get("total"):
+        return None
+    return system["used"], system["total"]
+
+
+def gpu_memory_from_nvidia_smi(timeout=3):
+    """(used_bytes, total_bytes) of GPU 0 from nvidia-smi, or None."""
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.used,memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0 or not result.stdout.strip():
+        return None
+    used, total = result.stdout.strip().split("\n")[0].split(",")
+    return int(used) * 1024**2, int(total) * 1024**2
+
+
+def reload_checkpoint(monitor, result, reload_timeout=600):
+    """Recovery action: have the WebUI unload and reload its checkpoint.
+
+    The WebUI runs in its own processes (launch.py workers, the kernel
+    never touches CUDA), so the memory has to be released there: the
+    unload drops the weights and empties that process's CUDA cache, and
+    the dispatcher sends both calls to every worker. Nothing is done
+    while a generation is running.
+    """
+    progress = _http_get(monitor.webui_url + "/sdapi/v1/progress", monitor.timeout)
+    if (progress.get("state") or {}).get("job_count"):
+        return "generation running, checkpoint left loaded"
+    _http_post(monitor.webui_url + "/sdapi/v1/unload-checkpoint", reload_timeout)
+    _http_post(monitor.webui_url + "/sdapi/v1/reload-checkpoint", reload_timeout)
+    return "checkpoint unloaded and reloaded"
+
+
+def restart_tunnel_action(cloudflared_path=None, port=7860):
+    """Build a recovery action that restarts the cloudflared quick tunnel."""
+    def restart(monitor, result):
+        _, url = tunnel.restart_tunnel(cloudflared_path, port)
+        if url:
+            monitor.tunnel_url = url
+            print(f"\n🌐 Tunnel restarted - NEW public URL: {url}")
+            return f"tunnel restarted: {url}"
+        return "tunnel restart failed"
+    return restart
+
+
+class HealthMonitor:
+    """Periodic parallel health checks with rolling history and actions.
+
+    actions maps a check name ("webui", "tunnel", "gpu", "disk") to a list
+    of callables(monitor, result) that run once a check has failed
+    failures_before_action times in a row.
+    gpu_source is a callable returning (used_bytes, total_bytes) or None;
+    by default the WebUI's /sdapi/v1/memory is used, then nvidia-smi.
+    """
+
+    def __init__(self, webui_url=DEFAULT_URL, tunnel_url=None, disk_path="/",
+                 interval=15, timeout=3, history_size=240, gpu_pressure=0.92,
+                 disk_pressure=0.95, failures_before_action=3, actions=None,
+                 gpu_source=None, verbose=True):
+        self.webui_url = webui_url.rstrip("/")
+        self.tunnel_url = tunnel_url
+        self.disk_path = disk_path
+        self.interval = interval
+        self.timeout = timeout
+        self.gpu_pressure = gpu_pressure
+        self.disk_pressure = disk_pressure
+        self.failures_before_action = failures_before_action
+        self.gpu_source = gpu_source
+        self.verbose = verbose
+        self.history = collections.deque(maxlen=history_size)
+        self.failures = collections.Counter()
+        self.action_log = collections.deque(maxlen=100)
+        self.actions = {"gpu": [reload_checkpoint]}
+        if actions:
+            self.actions.update(actions)
+        self._stop = threading.Event()
+
+    # -- checks ---------------------------------------------------------
+
+    async def check_webui(self):
+        data = await asyncio.to_thread(_http_get, self.webui_url + "/sdapi/v1/progress", self.timeout)
+        return {"job_count": (data.get("state") or {}).get("job_count", 0)}
+
+    async def check_tunnel(self):
+        url = self.tunnel_url or tunnel.read_tunnel_url()
+        if not url:
+            raise RuntimeError("no tunnel URL")
+        self.tunnel_url = url
+        try:
+            await asyncio.to_thread(_http_get, url.rstrip("/") + "/sdapi/v1/progress", self.timeout)
+        except urllib.error.HTTPError as e:
+            # The proxy answered (401 without an API key, 429...): the tunnel itself works
+            if e.code >= 500:
+                raise
+        return {"url": url}
+
+    async def check_gpu(self):
+        if self.gpu_source:
+            sample = await asyncio.to_thread(self.gpu_source)
+        else:
+            try:
+                sample = await asyncio.to_thread(gpu_memory_from_webui, self.webui_url, self.timeout)
+            except Exception:
+                sample = None
+            if sample is None:
+                sample = await asyncio.to_thread(gpu_memory_from_nvidia_smi, self.timeout)
+        if sample is None:
+            return {"available": False}
+        used, total = sample
+        fraction = used / total
+        if fraction >= self.gpu_pressure:
+            raise RuntimeError(f"GPU memory {fraction:.0%} used")
+        return {"used_gb": round(used / 1024**3, 2), "total_gb": round(total / 1024**3, 2),
+                "fraction": round(fraction, 3)}
+
+    async def check_disk(self):
+        usage = await asyncio.to_thread(shutil.disk_usage, self.disk_path)
+        fraction = usage.used / usage.total
+        if fraction >= self.disk_pressure:
+            raise RuntimeError(f"disk {fraction:.0%} used, {usage.free / 1024**3:.1f} GB free")
+        return {"free_gb": round(usage.free / 1024**3, 2), "fraction": round(fraction, 3)}
+
+    async def _timed(self, name, check):
+        start = time.time()
+        try:
+            value = await asyncio.wait_for(check(), self.timeout + 1)
+            return {"name": name, "ok": True, "latency_s": time.time() - start, "value": value, "error": None}
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            return {"name": name, "ok": False, "latency_s": time.time() - start, "value": None, "error": error}
+
+    # -- loop -----------------------------------------------------------
+
+    async def check_once(self):
+        """Run every check in parallel, record the snapshot and act on it."""
+        checks = {
+            "webui": self.check_webui,
+            "tunnel": self.check_tunnel,
+            "gpu": self.check_gpu,
+            "disk": self.check_disk,
+        }
+        results = await asyncio.gather(*(self._timed(name, check) for name, check in checks.items()))
+        snapshot = {"time": time.time(), "checks": {result["name"]: result for result in results}}
+        snapshot["status"] = "ok" if all(result["ok"] for result in results) else "degraded"
+        self.history.append(snapshot)
+
+        for result in results:
+            name = result["name"]
+            if result["ok"]:
+                self.failures[name] = 0
+                continue
+            self.failures[name] += 1
+            if self.verbose and self.failures[name] == 1:
+                print(f"⚠️ [health] {name}: {result['error'][:100]}")
+            if self.failures[name] >= self.failures_before_action:
+                self.failures[name] = 0
+                await self._run_actions(name, result)
+        return snapshot
+
+    async def _run_actions(self, name, result):
+        for action in self.actions.get(name, []):
+            try:
+                outcome = await asyncio.to_thread(action, self, result)
+            except Exception as e:
+                outcome = f"action failed: {e}"
+            self.action_log.append({"time": time.time(), "check": name, "outcome": outcome})
+            if self.verbose:
+                print(f"🔧 [health] {name}: {outcome}")
+
+    async def run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            await self.check_once()
+            await asyncio.sleep(max(0.0, self.interval - (time.time() - started)))
+
+    def start_in_thread(self):
+        """Run the monitor on its own event loop in a daemon thread."""
+        thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    # -- reporting ------------------------------------------------------
+
+    def uptime(self, name):
+        """Fraction of recorded snapshots in which a check passed."""
+        if not self.history:
+            return None
+        return sum(1 for s in self.history if s["checks"][name]["ok"]) / len(self.history)
+
+    def summary(self):
+        """Print the latest snapshot plus rolling uptime per check."""
+        if not self.history:
+            print("⏳ [health] no checks yet")
+            return
+        latest = self.history[-1]
+        icon = "✅" if latest["status"] == "ok" else "⚠️"
+        print(f"\n{icon} Health: {latest['status']} ({len(self.history)} samples)")
+        for name, result in latest["checks"].items():
+            mark = "✅" if result["ok"] else "❌"
+            detail = result["error"] if not result["ok"] else json.dumps(result["value"], default=str)[:80]
+            print(f"   {mark} {name:<7} {result['latency_s'] * 1000:6.0f} ms  "
+                  f"uptime {self.uptime(name):.0%}  {detail}")
+        for entry in list(self.action_log)[-3:]:
+            print(f"   🔧 {time.strftime('%H:%M:%S', time.localtime(entry['time']))} "
+                  f"{entry['check']}: {entry['outcome']}")
@@ -0,0 +1,464 @@
+"""
+Load generator that replays the front end's API traffic.
+
+Each virtual user behaves like one browser tab of index.html. On page
+load it runs the connection test and fetches the model, sampler and LoRA
+lists (loadModels/loadSamplers/loadLoras). Then it loops: think, then
+pick an action by weight:
+
+  txt2img   a burst of generations, polling /sdapi/v1/progress every
+            500 ms while each one runs (startProgressPolling)
+  img2img   the init image goes through /uploads when the server has it,
+            inline otherwise, as in sd-api-client.js
+  options   a model switch through /sdapi/v1/options (setModel)
+  reload    the page is reloaded: the lists are fetched again
+
+Payloads match sd-api-client.js defaults; a share of generations repeat
+the previous seed, like a user re-rendering a fixed-seed prompt. The
+report has throughput, latency percentiles and error rates per endpoint.
+
+    python -m sdbackend.loadtest --url http://localhost:7870 --users 8 --duration 120
+    python -m sdbackend.loadtest --mock --users 16 --think 0.5
+
+Behind a gateway (sdbackend.gateway) pass --key: every request then
+carries it as X-API-Key, as the page does.
+"""
+
+import argparse
+import asyncio
+import base64
+import collections
+import gzip
+import hashlib
+import json
+import os
+import random
+import time
+from urllib.parse import urlparse
+
+DEFAULT_URL = "http://localhost:7870"
+DEFAULT_WEIGHTS = {"txt2img": 0.6, "img2img": 0.2, "options": 0.05, "reload": 0.15}
+PERCENTILES = (50, 90, 95, 99)
+
+PROMPTS = [
+    "a cozy cabin in a snowy forest, warm light, detailed",
+    "portrait of a knight in ornate armor, dramatic lighting",
+    "a cat astronaut floating in space, digital art",
+    "city street at night in the rain, neon reflections",
+    "watercolor landscape with mountains and a lake",
+]
+NEGATIVE = "lowres, bad anatomy, blurry"
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection (a browser keeps a few per origin)."""
+
+    def __init__(self, url, timeout=600, api_key=None):
+        parsed = urlparse(url)
+        self.api_key = api_key
+        self.https = parsed.scheme == "https"
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.https else 80)
+        self.prefix = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None, headers=None):
+        """(status, headers, body); a dropped keep-alive connection is retried once."""
+        for attempt in range(2):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.host, self.port, ssl=True if self.https else None)
+            try:
+                return await asyncio.wait_for(self._exchange(method, path, body, headers), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if not reused or attempt:
+                    raise
+            except BaseException:
+                self.close()
+                raise
+
+    async def _exchange(self, method, path, body, headers):
+        default_port = 443 if self.https else 80
+        host = self.host if self.port == default_port else f"{self.host}:{self.port}"
+        lines = [f"{method} {self.prefix}{path} HTTP/1.1", f"Host: {host}", "Accept-Encoding: gzip"]
+        if self.api_key:
+            lines.append(f"X-API-Key: {self.api_key}")
+        lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b""))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            response_headers[key.strip().lower()] = value.strip()
+
+        if method == "HEAD" or status in (204, 304):
+            data = b""
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            data = b""
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                data += chunk[:-2]
+        elif "content-length" in response_headers:
+            data = await self.reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await self.reader.read()
+            self.close()
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        if response_headers.get("content-encoding") == "gzip":
+            data = gzip.decompress(data)
+        return status, response_headers, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Recorder:
+    """Latency samples and outcomes per endpoint label."""
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.error_kinds = collections.Counter()
+        self.statuses = collections.Counter()
+        self.images = 0
+
+    def record(self, label, status, seconds, error=None):
+        self.latencies[label].append(seconds)
+        self.statuses[str(status) if status is not None else "failed"] += 1
+        if error:
+            self.errors[label] += 1
+            self.error_kinds[f"{label}: {error}"] += 1
+
+    def report(self, elapsed):
+        endpoints = {}
+        for label, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[label] = dict(
+                count=len(values),
+                errors=self.errors[label],
+                error_rate=round(self.errors[label] / len(values), 4),
+                mean=round(sum(values) / len(values), 4),
+                max=round(values[-1], 4),
+                **{f"p{p}": round(percentile(values, p), 4) for p in PERCENTILES})
+        requests = sum(len(values) for values in self.latencies.values())
+        errors = sum(self.errors.values())
+        generations = sum(endpoints[label]["count"] - endpoints[label]["errors"]
+                          for label in ("txt2img", "img2img") if label in endpoints)
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": requests,
+            "errors": errors,
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+            "throughput_rps": round(requests / elapsed, 3) if elapsed else 0.0,
+            "generations_per_min": round(generations * 60 / elapsed, 2) if elapsed else 0.0,
+            "images_per_min": round(self.images * 60 / elapsed, 2) if elapsed else 0.0,
+            "statuses": dict(self.statuses),
+            "top_errors": dict(self.error_kinds.most_common(5)),
+            "endpoints": endpoints,
+        }
+
+
+class Scenario:
+    """What the virtual users do, and how often.
+
+    think_time is the mean pause between actions (exponentially
+    distributed, like independent users); a txt2img action is a burst of
+    1..max_burst generations burst_gap seconds apart; repeat_rate is the
+    share of generations that reuse the previous seed.
+    """
+
+    def __init__(self, think_time=5.0, weights=None, max_burst=3, burst_gap=1.0, repeat_rate=0.1,
+                 steps=20, width=512, height=512, batch_size=1, poll_interval=0.5, uploads=True,
+                 timeout=600, api_key=None):
+        self.think_time = think_time
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.max_burst = max_burst
+        self.burst_gap = burst_gap
+        self.repeat_rate = repeat_rate
+        self.steps = steps
+        self.width = width
+        self.height = height
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.uploads = uploads
+        self.timeout = timeout
+        self.api_key = api_key
+
+
+class VirtualUser:
+    """One browser tab driving the API."""
+
+    def __init__(self, index, url, scenario, recorder, seed=None):
+        self.index = index
+        self.url = url
+        self.scenario = scenario
+        self.recorder = recorder
+        self.rng = random.Random(seed)
+        self.main = Connection(url, scenario.timeout, scenario.api_key)
+        self.poller = Connection(url, 30, scenario.api_key)
+        self.models = []
+        self.samplers = ["Euler"]
+        self.last_payload = None
+        self.uploads_supported = None if scenario.uploads else False
+        self.uploaded = set()
+        self.init_image = None
+
+    async def call(self, connection, label, method, path, payload=None, body=None, headers=None,
+                   expected=()):
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+            headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            status, response_headers, data = await connection.request(method, path, body, headers)
+        except Exception as e:
+            self.recorder.record(label, None, time.perf_counter() - start, type(e).__name__)
+            return None, {}, b""
+        self.recorder.record(label, status, time.perf_counter() - start,
+                             f"HTTP {status}" if status >= 400 and status not in expected else None)
+        return status, response_headers, data
+
+    async def page_load(self):
+        # testConnection, then loadModels/loadSamplers/loadLoras side by side
+        await self.call(self.main, "sd-models", "GET", "/sdapi/v1/sd-models")
+        extra = [Connection(self.url, 30, self.scenario.api_key) for _ in range(2)]
+        try:
+            (_, _, models), (_, _, samplers), _ = await asyncio.gather(
+                self.call(self.main, "sd-models", "GET", "/sdapi/v1/sd-models"),
+                self.call(extra[0], "samplers", "GET", "/sdapi/v1/samplers"),
+                self.call(extra[1], "loras", "GET", "/sdapi/v1/loras"))
+        finally:
+            for connection in extra:
+                connection.close()
+        try:
+            self.models = [model["title"] for model in json.loads(models)]
+            self.samplers = [sampler["name"] for sampler in json.loads(samplers)][:10] or self.samplers
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    def payload(self, mode):
+        if self.last_payload is not None and self.rng.random() < self.scenario.repeat_rate:
+            # Same prompt and seed again (a fixed-seed re-render)
+            return dict(self.last_payload)
+        payload = {
+            "prompt": self.rng.choice(PROMPTS),
+            "negative_prompt": NEGATIVE,
+            "steps": self.scenario.steps,
+            "sampler_name": self.rng.choice(self.samplers),
+            "cfg_scale": 7,
+            "width": self.scenario.width,
+            "height": self.scenario.height,
+            "seed": self.rng.randrange(2**31),
+            "batch_size": self.scenario.batch_size,
+            "n_iter": 1,
+            "send_images": True,
+            "save_images": False,
+        }
+        if mode == "img2img":
+            payload["denoising_strength"] = 0.75
+        self.last_payload = payload
+        return dict(payload)
+
+    async def image_ref(self):
+        """The init image as sdblob:<sha256> when /uploads works, else inline."""
+        if self.init_image is None:
+            from sdbackend.mockserver import make_png
+
+            self.init_image = make_png(self.scenario.width, self.scenario.height, self.index)
+        data = self.init_image
+        inline = "data:image/png;base64," + base64.b64encode(data).decode("ascii")
+        if self.uploads_supported is False:
+            return inline
+        sha256 = hashlib.sha256(data).hexdigest()
+        if sha256 in self.uploaded:
+            return f"sdblob:{sha256}"
+        headers = {"Tus-Resumable": "1.0.0", "Upload-Length": str(len(data)),
+                   "Upload-Metadata": "sha256 " + base64.b64encode(sha256.encode()).decode()}
+        # A WebUI without the proxy has no /uploads; the client then falls back to inline
+        status, response_headers, _ = await self.call(self.main, "upload", "POST", "/uploads", body=b"",
+                                                      headers=headers, expected=(404, 405))
+        if status is None or status >= 400:
+            self.uploads_supported = False
+            return inline
+        location = response_headers.get("location")
+        if location:
+            status, _, _ = await self.call(self.main, "upload", "PATCH", location, body=data, headers={
+                "Tus-Resumable": "1.0.0", "Upload-Offset": "0",
+                "Content-Type": "application/offset+octet-stream"})
+            if status is None or status >= 400:
+                return inline
+        self.uploads_supported = True
+        self.uploaded.add(sha256)
+        return f"sdblob:{sha256}"
+
+    async def poll_progress(self, done):
+        while not done.is_set():
+            await self.call(self.poller, "progress", "GET", "/sdapi/v1/progress")
+            try:
+                await asyncio.wait_for(done.wait(), self.scenario.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def generate(self, mode):
+        payload = self.payload(mode)
+        if mode == "img2img":
+            payload["init_images"] = [await self.image_ref()]
+        done = asyncio.Event()
+        poller = asyncio.ensure_future(self.poll_progress(done))
+        try:
+            status, _, data = await self.call(self.main, mode, "POST", f"/sdapi/v1/{mode}", payload)
+        finally:
+            done.set()
+            await poller
+        if status == 200:
+            try:
+                self.recorder.images += len(json.loads(data).get("images") or [])
+            except ValueError:
+                pass
+
+    async def act(self, action):
+        if action == "txt2img":
+            for i in range(self.rng.randint(1, max(1, self.scenario.max_burst))):
+                if i:
+                    await asyncio.sleep(self.scenario.burst_gap)
+                await self.generate("txt2img")
+        elif action == "img2img":
+            await self.generate("img2img")
+        elif action == "options" and self.models:
+            await self.call(self.main, "options", "POST", "/sdapi/v1/options",
+                            {"sd_model_checkpoint": self.rng.choice(self.models)})
+        elif action == "reload":
+            await self.page_load()
+
+    async def run(self, deadline):
+        await self.page_load()
+        actions, weights = zip(*self.scenario.weights.items())
+        while time.monotonic() < deadline:
+            think = self.rng.expovariate(1 / self.scenario.think_time) if self.scenario.think_time > 0 else 0
+            await asyncio.sleep(min(think, 5 * self.scenario.think_time, max(0, deadline - time.monotonic())))
+            if time.monotonic() >= deadline:
+                break
+            await self.act(self.rng.choices(actions, weights)[0])
+
+    def close(self):
+        self.main.close()
+        self.poller.close()
+
+
+async def run_load(url=DEFAULT_URL, users=4, duration=60.0, scenario=None, ramp=0.0, seed=None):
+    """Drive users virtual users for duration seconds; returns the report dict.
+
+    Users start ramp/users seconds apart; generations still running at the
+    deadline are waited for and counted.
+    """
+    scenario = scenario or Scenario()
+    recorder = Recorder()
+    start = time.monotonic()
+    deadline = start + duration
+
+    async def user(index):
+        await asyncio.sleep(ramp * index / users)
+        virtual_user = VirtualUser(index, url, scenario, recorder,
+                                   None if seed is None else seed * 1000 + index)
+        try:
+            await virtual_user.run(deadline)
+        finally:
+            virtual_user.close()
+
+    await asyncio.gather(*(user(index) for index in range(users)))
+    report = recorder.report(time.monotonic() - start)
+    report.update(url=url, users=users)
+    return report
+
+
+def print_report(report):
+    """Print a load test report in the notebook's output style."""
+    print(f"\n📊 Load test: {report['users']} users, {report['elapsed_s']:.0f}s against {report['url']}")
+    print(f"   • Requests: {report['requests']} ({report['throughput_rps']:.1f}/s), "
+          f"errors: {report['errors']} ({report['error_rate']:.1%})")
+    print(f"   • Generations: {report['generations_per_min']:.1f}/min, images: {report['images_per_min']:.1f}/min")
+    print(f"   {'endpoint':<12} {'count':>6} {'err%':>6} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for label, stats in report["endpoints"].items():
+        print(f"   {label:<12} {stats['count']:>6} {stats['error_rate']:>6.1%} "
+              + " ".join(f"{stats[key]:>7.3f}s" for key in ("p50", "p90", "p95", "p99", "max")))
+    for error, count in report["top_errors"].items():
+        print(f"   ⚠️ {error} ×{count}")
+
+
+def parse_weights(text):
+    weights = dict(DEFAULT_WEIGHTS)
+    for part in filter(None, (text or "").split(",")):
+        action, _, value = part.partition("=")
+        if action.strip() not in DEFAULT_WEIGHTS:
+            raise argparse.ArgumentTypeError(f"unknown action {action!r}")
+        weights[action.strip()] = float(value)
+    return weights
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay front-end traffic against the WebUI API")
+    parser.add_argument("--url", default=DEFAULT_URL, help="proxy, tunnel or WebUI base URL")
+    parser.add_argument("--mock", action="store_true", help="start an in-process mock WebUI and target it")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds until every user has started")
+    parser.add_argument("--think", type=float, default=5.0, help="mean seconds between actions")
+    parser.add_argument("--weights", type=parse_weights, default=dict(DEFAULT_WEIGHTS),
+                        help="action mix, e.g. txt2img=0.6,img2img=0.2,options=0.05,reload=0.15")
+    parser.add_argument("--max-burst", type=int, default=3, help="most txt2img calls in one burst")
+    parser.add_argument("--repeat-rate", type=float, default=0.1, help="share of fixed-seed repeats")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--size", default="512x512", help="WIDTHxHEIGHT")
+    parser.add_argument("--no-uploads", action="store_true", help="always send img2img inputs inline")
+    parser.add_argument("--seed", type=int, default=None, help="make the user behaviour reproducible")
+    parser.add_argument("--key", default=os.environ.get("SDBACKEND_KEY"),
+                        help="API key for a gateway-protected proxy (default: $SDBACKEND_KEY)")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    url = args.url
+    if args.mock:
+        from sdbackend import mockserver
+
+        server = mockserver.start_server(port=0)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    scenario = Scenario(think_time=args.think, weights=args.weights, max_burst=args.max_burst,
+                        repeat_rate=args.repeat_rate, steps=args.steps, width=width, height=height,
+                        uploads=not args.no_uploads, api_key=args.key)
+    report = asyncio.run(run_load(url, args.users, args.duration, scenario, args.ramp, args.seed))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+GPU memory watchdog and adaptive resolution/batch limiter.
+
+A T4 that OOMs on a large batch_size or hires-fix wedges the WebUI and
+the tunnel session with it. MemoryGuard samples GPU memory, learns the
+peak cost of each (resolution, batch, hires) workload from finished
+generations and lets the proxy shrink oversized requests before they
+reach the GPU: batches are split into sequential n_iter passes first,
+then the hires scale is reduced, and only then the resolution.
+
+Memory sources are callables returning a dict with "total", "allocated"
+and (optionally) "peak" in bytes:
+  webui_memory_source    - the WebUI's /sdapi/v1/memory (per-job peak)
+  combined_memory_source - the tightest reading of several workers
+  nvidia_smi_memory_source - device-wide used/total from nvidia-smi
+  torch_memory_source    - torch.cuda stats of the current process
+  StubMemorySource       - fixed numbers for tests and the mock server
+"""
+
+import collections
+import json
+import math
+import subprocess
+import threading
+import time
+import urllib.request
+
+GB = 1024**3
+
+
+def webui_memory_source(webui_url="http://localhost:7860", timeout=3):
+    """Readings of one WebUI; behind a dispatcher that is whichever worker it picks."""
+    def sample():
+        with urllib.request.urlopen(webui_url.rstrip("/") + "/sdapi/v1/memory", timeout=timeout) as response:
+            cuda = json.loads(response.read()).get("cuda") or {}
+        system = cuda.get("system") or {}
+        allocated = cuda.get("allocated") or {}
+        if not system.get("total"):
+            return None
+        return {
+            "total": system["total"],
+            "used": system.get("used"),
+            "allocated": allocated.get("current"),
+            "peak": allocated.get("peak"),
+            "ooms": (cuda.get("events") or {}).get("oom"),
+        }
+    return sample
+
+
+def combined_memory_source(sources):
+    """One reading for several workers: the smallest GPU and the largest use.
+
+    A dispatcher may send a request to any worker, so it has to fit the
+    tightest one; sources that fail are skipped.
+    """
+    def sample():
+        readings = []
+        for source in sources:
+            try:
+                reading = source()
+            except Exception:
+                continue
+            if reading:
+                readings.append(reading)
+        if not readings:
+            return None
+        combined = {"total": min(reading["total"] for reading in readings)}
+        for key in ("used", "allocated", "peak"):
+            values = [reading[key] for reading in readings if reading.get(key) is not None]
+            combined[key] = max(values) if values else None
+        return combined
+    return sample
+
+
+def nvidia_smi_memory_source(timeout=3):
+    def sample():
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.used,memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=timeout,
+        )
+        if result.returncode != 0 or not result.stdout.strip():
+            return None
+        used, total = (int(x) * 1024**2 for x in result.stdout.strip().split("\n")[0].split(","))
+        return {"total": total, "used": used, "allocated": used, "peak": None}
+    return sample
+
+
+def torch_memory_source(device=0):
+    def sample():
+        import torch
+        if not torch.cuda.is_available():
+            return None
+        return {
+            "total": torch.cuda.get_device_properties(device).total_memory,
+            "allocated": torch.cuda.memory_allocated(device),
+            "reserved": torch.cuda.memory_reserved(device),
+            "peak": torch.cuda.max_memory_allocated(device),
+        }
+    return sample
+
+
+class StubMemorySource:
+    """Settable memory readings for tests."""
+
+    def __init__(self, total_gb=15.0, allocated_gb=2.5, peak_gb=None):
+        self.total = total_gb * GB
+        self.allocated = allocated_gb * GB
+        self.peak = peak_gb * GB if peak_gb is not None else None
+
+    def __call__(self):
+        return {"total": self.total, "allocated": self.allocated, "peak": self.peak}
+
+
+def _number(payload, name, default, kind=int):
+    """payload[name] as a positive number; missing, null or malformed values give default.
+
+    The WebUI rejects a malformed request itself, the guard only needs
+    an estimate that does not crash the proxy in the meantime.
+    """
+    try:
+        value = kind(payload.get(name) or default)
+    except (TypeError, ValueError, OverflowError):
+        return default
+    return value if value > 0 else default
+
+
+def hires_scale(payload):
+    if not payload.get("enable_hr"):
+        return 1.0
+    width, height = _number(payload, "width", 512), _number(payload, "height", 512)
+    if payload.get("hr_resize_x") or payload.get("hr_resize_y"):
+        x = _number(payload, "hr_resize_x", width)
+        y = _number(payload, "hr_resize_y", height)
+        return max(x / width, y / height)
+    return _number(payload, "hr_scale", 2.0, float)
+
+
+def workload(payload):
+    """(key, megapixels) of a request; megapixels counts every image of a batch."""
+    width, height = _number(payload, "width", 512), _number(payload, "height", 512)
+    batch = _number(payload, "batch_size", 1)
+    scale = round(hires_scale(payload), 2)
+    key = (width, height, batch, scale)
+    return key, width * height * batch * scale * scale / 1e6
+
+
+def percentile(values, q):
+    """Nearest-rank q-th percentile (0-100) of a non-empty sequence."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def is_oom(response):
+    status, _, body = response
+    return status >= 500 and (b"out of memory" in body.lower() or b"outofmemory" in body.lower())
+
+
+class MemoryGuard:
+    """Learned memory model plus request planning against the GPU budget.
+
+    estimate(payload) = the `quantile` percentile of the last `window`
+    peaks seen for that workload key, otherwise baseline + per-megapixel
+    cost (prior_gb_per_mp until a generation has been observed, then the
+    same percentile of the recent costs). An OOM marks its workload as
+    not fitting for oom_ttl seconds and adds a lower-bound cost sample;
+    successful generations replace both, so one bad reading (fragmented
+    memory, another process on the GPU) does not shrink requests for
+    the rest of the session. The budget is safety x total VRAM.
+    """
+
+    def __init__(self, source, safety=0.9, prior_gb_per_mp=1.5, min_side=256, history_size=300,
+                 window=16, quantile=90, oom_ttl=600.0):
+        self.source = source
+        self.safety = safety
+        self.prior_cost = prior_gb_per_mp * GB
+        self.min_side = min_side
+        self.quantile = quantile
+        self.oom_ttl = oom_ttl
+        self.lock = threading.Lock()
+        # key -> recent peaks of finished generations; key -> time of the last OOM
+        self.learned = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.oom_marks = {}
+        self.costs = collections.deque(maxlen=window * 4)
+        self.total = None
+        self.baseline = None
+        self.history = collections.deque(maxlen=history_size)
+        self.stats = {"observed": 0, "ooms": 0, "adjusted": 0, "sample_errors": 0}
+        self._stop = threading.Event()
+
+    # -- sampling -------------------------------------------------------
+
+    def sample(self):
+        try:
+            reading = self.source()
+        except Exception:
+            reading = None
+        with self.lock:
+            if not reading:
+                self.stats["sample_errors"] += 1
+                return None
+            self.total = reading["total"]
+            allocated = reading.get("allocated")
+            if allocated is not None:
+                # The idle floor (model weights) is the smallest allocation seen
+                self.baseline = allocated if self.baseline is None else min(self.baseline, allocated)
+            self.history.append({"time": time.time(), **reading})
+        return reading
+
+    def run(self, interval=2.0):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(interval)
+
+    def start_in_thread(self, interval=2.0):
+        thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    # -- learning -------------------------------------------------------
+
+    def observe(self, payload):
+        """Record the memory peak of a generation that just finished."""
+        reading = self.sample()
+        if not reading:
+            return
+        peak = reading.get("peak") or reading.get("used") or reading.get("allocated")
+        if not peak:
+            return
+        key, megapixels = workload(payload)
+        with self.lock:
+            self.stats["observed"] += 1
+            self.learned[key].append(peak)
+            # It just fitted, whatever an earlier OOM suggested
+            self.oom_marks.pop(key, None)
+            if self.baseline is not None and megapixels > 0:
+                self.costs.append((peak - self.baseline) / megapixels)
+
+    def record_oom(self, payload):
+        """Mark a workload as not fitting after the GPU ran out of memory."""
+        key, megapixels = workload(payload)
+        with self.lock:
+            self.stats["ooms"] += 1
+            self.oom_marks[key] = time.time()
+            if self.total and self.baseline is not None and megapixels > 0:
+                self.costs.append((self.total - self.baseline) / megapixels)
+
+    @property
+    def cost_per_mp(self):
+        return percentile(self.costs, self.quantile) if self.costs else self.prior_cost
+
+    def _learned_peak(self, key):
+        """Learned peak for a workload key, or None; call with the lock held."""
+        marked = self.oom_marks.get(key)
+        if marked is not None and time.time() - marked < self.oom_ttl:
+            if self.total:
+                return self.total * 1.05
+        elif marked is not None:
+            del self.oom_marks[key]
+        peaks = self.learned.get(key)
+        return percentile(peaks, self.quantile) if peaks else None
+
+    # -- planning -------------------------------------------------------
+
+    def budget(self):
+        if self.total is None:
+            self.sample()
+        return self.total * self.safety if self.total else None
+
+    def estimate(self, payload):
+        key, megapixels = workload(payload)
+        with self.lock:
+            peak = self._learned_peak(key)
+            if peak is not None:
+                return peak
+            return (self.baseline or 0) + self.cost_per_mp * megapixels
+
+    def fits(self, payload):
+        budget = self.budget()
+        return budget is None or self.estimate(payload) <= budget
+
+    def max_batch(self, payload, limit=64):
+        """Largest batch_size of this request shape that fits the budget."""
+        batch = 1
+        while batch < limit and self.fits(dict(payload, batch_size=batch + 1)):
+            batch += 1
+        return batch
+
+    def plan(self, payload):
+        """Return (payload, adjustments) that fit the budget.
+
+        Splits the batch into sequential n_iter passes (same image count
+        and seeds), then lowers the hires scale, then the resolution.
+        """
+        if self.fits(payload):
+            return payload, []
+        planned = dict(payload)
+        adjustments = []
+
+        batch = _number(planned, "batch_size", 1)
+        if batch > 1:
+            fitting = [b for b in range(batch, 0, -1) if batch % b == 0
+                       and self.fits(dict(planned, batch_size=b))]
+            new_batch = fitting[0] if fitting else 1
+            planned["batch_size"] = new_batch
+            planned["n_iter"] = _number(planned, "n_iter", 1) * (batch // new_batch)
+            adjustments.append(f"batch_size {batch}->{new_batch}x{planned['n_iter']}")
+
+        if planned.get("enable_hr") and not self.fits(planned):
+            scale = hires_scale(planned)
+            planned.pop("hr_resize_x", None)
+            planned.pop("hr_resize_y", None)
+            while scale > 1.0 and not self.fits(dict(planned, hr_scale=scale)):
+                scale = round(scale - 0.25, 2)
+            if scale <= 1.0:
+                planned["enable_hr"] = False
+                adjustments.append("hires fix disabled")
+            else:
+                planned["hr_scale"] = scale
+                adjustments.append(f"hr_scale->{scale}")
+
+        if not self.fits(planned):
+            width, height = _number(planned, "width", 512), _number(planned, "height", 512)
+            ratio = math.sqrt(max(self.budget() - (self.baseline or 0), 0) /
+                              max(self.estimate(planned) - (self.baseline or 0), 1))
+            new_width = max(self.min_side, int(width * ratio) // 64 * 64)
+            new_height = max(self.min_side, int(height * ratio) // 64 * 64)
+            planned["width"], planned["height"] = new_width, new_height
+            adjustments.append(f"size {width}x{height}->{new_width}x{new_height}")
+
+        with self.lock:
+            self.stats["adjusted"] += 1
+        return planned, adjustments
+
+    def report(self):
+        with self.lock:
+            learned = {key: self._learned_peak(key) for key in set(self.learned) | set(self.oom_marks)}
+            return dict(
+                self.stats,
+                total_gb=round(self.total / GB, 2) if self.total else None,
+                baseline_gb=round(self.baseline / GB, 2) if self.baseline is not None else None,
+                gb_per_megapixel=round(self.cost_per_mp / GB, 3),
+                learned={"x".join(str(part) for part in key): round(peak / GB, 2)
+                         for key, peak in sorted(learned.items()) if peak is not None},
+            )
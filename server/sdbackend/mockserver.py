@@ -0,0 +1,353 @@
+"""
+CPU-only stand-in for the Stable Diffusion WebUI API.
+
+Implements the /sdapi/v1/* surface used by sd-api-client.js (txt2img,
+img2img, progress, sd-models, samplers, loras, vae, options, interrupt) with
+synthetic latency and small generated PNGs, so the proxy, cache, queue
+and tunnel logic can be exercised and benchmarked without a GPU.
+
+    python -m sdbackend.mockserver --port 7860 --step-latency 0.02
+"""
+
+import argparse
+import base64
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+SAMPLERS = ["Euler a", "Euler", "DPM++ 2M Karras", "DPM++ SDE Karras", "DDIM", "UniPC"]
+
+
+class MockConfig:
+    """Synthetic cost model of the mock backend.
+
+    A generation takes base_latency + steps * step_latency seconds for the
+    first image of a batch; every further image in the batch costs
+    batch_cost of that (GPUs render batches cheaper than separate calls).
+    Returned images are width*output_scale x height*output_scale PNGs.
+
+    With vram_gb set, a pass needs model_gb + gb_per_megapixel for every
+    megapixel rendered at once (batch_size images, hires-scaled) and fails
+    with an OutOfMemoryError above vram_gb, like a real GPU.
+    """
+
+    def __init__(self, step_latency=0.02, base_latency=0.05, batch_cost=0.35,
+                 output_scale=0.125, model_count=3, lora_count=5, load_latency=0.5,
+                 vram_gb=None, model_gb=2.5, gb_per_megapixel=1.2):
+        self.step_latency = step_latency
+        self.base_latency = base_latency
+        self.batch_cost = batch_cost
+        self.output_scale = output_scale
+        self.model_count = model_count
+        self.lora_count = lora_count
+        self.load_latency = load_latency
+        self.vram_gb = vram_gb
+        self.model_gb = model_gb
+        self.gb_per_megapixel = gb_per_megapixel
+
+    def generation_time(self, steps, batch_size=1, n_iter=1):
+        single = self.base_latency + steps * self.step_latency
+        return single * (1 + self.batch_cost * (batch_size - 1)) * n_iter
+
+    def memory_needed(self, width, height, batch_size=1, hr_scale=1.0):
+        """Peak GB of one pass."""
+        return self.model_gb + self.gb_per_megapixel * width * height * batch_size * hr_scale**2 / 1e6
+
+
+class MockOutOfMemory(Exception):
+    pass
+
+
+def make_png(width, height, seed=0):
+    """Encode a solid-colour RGB PNG using only the standard library."""
+    width, height = max(1, int(width)), max(1, int(height))
+    rng = random.Random(seed)
+    pixel = bytes([rng.randrange(256), rng.randrange(256), rng.randrange(256)])
+    row = b"\x00" + pixel * width
+    raw = row * height
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b""))
+
+
+class MockBackend:
+    """State of the mock WebUI: options, model lists and the running job."""
+
+    def __init__(self, config=None):
+        self.config = config or MockConfig()
+        self.models = [
+            {
+                "title": f"mock-model-{i}.safetensors [{i:010x}]",
+                "model_name": f"mock-model-{i}",
+                "hash": f"{i:08x}",
+                "sha256": f"{i:064x}",
+                "filename": f"/models/Stable-diffusion/mock-model-{i}.safetensors",
+                "config": None,
+            }
+            for i in range(self.config.model_count)
+        ]
+        self.loras = [
+            {"name": f"mock-lora-{i}", "alias": f"mock-lora-{i}",
+             "path": f"/models/Lora/mock-lora-{i}.safetensors", "metadata": {}}
+            for i in range(self.config.lora_count)
+        ]
+        self.vaes = [{"model_name": "mock-vae.pt", "filename": "/models/VAE/mock-vae.pt"}]
+        self.options = {
+            "sd_model_checkpoint": self.models[0]["title"] if self.models else None,
+            "sd_vae": "Automatic",
+            "CLIP_stop_at_last_layers": 1,
+        }
+        self.gpu_lock = threading.Lock()
+        self.job = None
+        self.interrupted = threading.Event()
+        self.interrupts = 0
+        self.generated = 0
+        self.peak_gb = self.config.model_gb
+        self.ooms = 0
+
+    def set_options(self, values):
+        if "sd_model_checkpoint" in values and values["sd_model_checkpoint"] != self.options.get("sd_model_checkpoint"):
+            with self.gpu_lock:
+                time.sleep(self.config.load_latency)
+        self.options.update(values)
+
+    def progress(self):
+        job = self.job
+        if job is None:
+            return {"progress": 0.0, "eta_relative": 0.0, "state": {"job_count": 0, "sampling_step": 0,
+                    "sampling_steps": 0}, "current_image": None, "textinfo": None}
+        elapsed = time.time() - job["start"]
+        fraction = min(elapsed / job["duration"], 1.0) if job["duration"] else 1.0
+        step = int(fraction * job["steps"])
+        current_image = None
+        every = int(self.options.get("show_progress_every_n_steps", 0) or 0)
+        if self.options.get("live_previews_enable") and every > 0 and step >= every:
+            # Latent-resolution preview, as the "Approx cheap" decoder returns it
+            current_image = base64.b64encode(make_png(
+                job["width"] // 8, job["height"] // 8, job["seed"] + step // every)).decode("ascii")
+        return {
+            "progress": fraction,
+            "eta_relative": max(job["duration"] - elapsed, 0.0),
+            "state": {"job_count": 1, "sampling_step": step, "sampling_steps": job["steps"]},
+            "current_image": current_image,
+            "textinfo": None,
+        }
+
+    def generate(self, payload, mode="txt2img"):
+        steps = int(payload.get("steps", 20))
+        if mode == "img2img":
+            steps = max(1, int(steps * float(payload.get("denoising_strength", 0.75))))
+        width = int(payload.get("width", 512))
+        height = int(payload.get("height", 512))
+        batch_size = max(1, int(payload.get("batch_size", 1)))
+        n_iter = max(1, int(payload.get("n_iter", 1)))
+        count = batch_size * n_iter
+        # Lists (one entry per image) are accepted like the WebUI's processing code does
+        # null means random, as in the WebUI's get_fixed_seed()
+        seed = payload.get("seed", -1)
+        if isinstance(seed, list):
+            seeds = [int(s) if s is not None and int(s) != -1 else random.randrange(2**32) for s in seed]
+        else:
+            seed = int(seed) if seed is not None and int(seed) != -1 else random.randrange(2**32)
+            seeds = [seed + i for i in range(count)]
+        prompt = payload.get("prompt", "")
+        prompts = prompt if isinstance(prompt, list) else [prompt] * count
+        negative = payload.get("negative_prompt", "")
+        negatives = negative if isinstance(negative, list) else [negative] * count
+
+        hr_scale = float(payload.get("hr_scale", 2.0)) if payload.get("enable_hr") else 1.0
+        needed = self.config.memory_needed(width, height, batch_size, hr_scale)
+        duration = self.config.generation_time(steps, batch_size, n_iter)
+        with self.gpu_lock:
+            # Peak statistics are reset per job, as the WebUI's memory monitor does
+            self.peak_gb = needed
+            if self.config.vram_gb is not None and needed > self.config.vram_gb:
+                self.peak_gb = self.config.vram_gb
+                self.ooms += 1
+                raise MockOutOfMemory(f"CUDA out of memory. Tried to allocate "
+                                      f"{needed - self.config.vram_gb:.2f} GiB")
+            self.job = {"start": time.time(), "duration": duration, "steps": steps,
+                        "width": width, "height": height, "seed": seeds[0]}
+            # /sdapi/v1/interrupt ends the job early, as in the WebUI
+            self.interrupted.clear()
+            self.interrupted.wait(duration)
+            self.job = None
+            self.generated += count
+
+        images = []
+        if payload.get("send_images", True):
+            scale = self.config.output_scale
+            images = [base64.b64encode(make_png(width * scale, height * scale, s)).decode("ascii")
+                      for s in seeds]
+        info = {
+            "prompt": prompts[0],
+            "all_prompts": prompts,
+            "negative_prompt": negatives[0],
+            "all_negative_prompts": negatives,
+            "seed": seeds[0],
+            "all_seeds": seeds,
+            "width": width,
+            "height": height,
+            "steps": steps,
+            "cfg_scale": payload.get("cfg_scale", 7),
+            "sampler_name": payload.get("sampler_name", "Euler"),
+            "sd_model_name": self.options.get("sd_model_checkpoint"),
+        }
+        # The "parameters" text the WebUI embeds in each PNG
+        info["infotexts"] = [
+            prompt_text + (f"\nNegative prompt: {negative_text}" if negative_text else "")
+            + f"\nSteps: {steps}, Sampler: {info['sampler_name']}, CFG scale: {info['cfg_scale']}, "
+            f"Seed: {seed}, Size: {width}x{height}"
+            for prompt_text, negative_text, seed in zip(prompts, negatives, seeds)]
+        parameters = {key: value for key, value in payload.items() if key not in ("init_images", "mask")}
+        return {"images": images, "parameters": parameters, "info": json.dumps(info)}
+
+    def memory(self):
+        """/sdapi/v1/memory in the WebUI's format (only the CUDA fields used here)."""
+        gb = 1024**3
+        total = (self.config.vram_gb or 16.0) * gb
+        current = self.config.model_gb * gb
+        used = (self.peak_gb if self.job is not None else self.config.model_gb) * gb
+        return {"cuda": {
+            "system": {"free": total - used, "used": used, "total": total},
+            "allocated": {"current": current, "peak": self.peak_gb * gb},
+            "reserved": {"current": current, "peak": self.peak_gb * gb},
+            "events": {"retries": 0, "oom": self.ooms},
+        }}
+
+
+def make_handler(backend):
+    """Build a request handler class bound to one MockBackend."""
+
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body=None, head=False):
+            data = json.dumps(body).encode("utf-8") if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            if not head:
+                self.wfile.write(data)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length))
+
+        def _get(self, head=False):
+            path = urlparse(self.path).path.rstrip("/")
+            routes = {
+                "/sdapi/v1/sd-models": lambda: backend.models,
+                "/sdapi/v1/samplers": lambda: [{"name": name, "aliases": [], "options": {}} for name in SAMPLERS],
+                "/sdapi/v1/loras": lambda: backend.loras,
+                "/sdapi/v1/vae": lambda: backend.vaes,
+                "/sdapi/v1/sd-vae": lambda: backend.vaes,
+                "/sdapi/v1/options": lambda: backend.options,
+                "/sdapi/v1/progress": backend.progress,
+                "/sdapi/v1/memory": backend.memory,
+                "/config": lambda: {"version": "mock"},
+            }
+            if path not in routes:
+                return self._send(404, {"detail": "Not Found"}, head)
+            self._send(200, routes[path](), head)
+
+        def do_GET(self):
+            self._get()
+
+        def do_HEAD(self):
+            self._get(head=True)
+
+        def do_OPTIONS(self):
+            self.send_response(204)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Access-Control-Allow-Methods", "GET, POST, HEAD, OPTIONS")
+            self.send_header("Access-Control-Allow-Headers", "*")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_POST(self):
+            path = urlparse(self.path).path.rstrip("/")
+            try:
+                payload = self._read_json()
+            except ValueError:
+                return self._send(422, {"detail": "Invalid JSON"})
+            if path in ("/sdapi/v1/txt2img", "/sdapi/v1/img2img"):
+                try:
+                    return self._send(200, backend.generate(payload, path.rsplit("/", 1)[1]))
+                except MockOutOfMemory as e:
+                    return self._send(500, {"error": "OutOfMemoryError", "detail": str(e)})
+                except (TypeError, ValueError) as e:
+                    # The WebUI's request models reject malformed fields the same way
+                    return self._send(422, {"detail": f"Invalid field: {e}"})
+            if path == "/sdapi/v1/options":
+                backend.set_options(payload)
+                return self._send(200, None)
+            if path in ("/sdapi/v1/interrupt", "/sdapi/v1/skip"):
+                backend.interrupts += 1
+                backend.interrupted.set()
+                return self._send(200, None)
+            if path in ("/sdapi/v1/refresh-checkpoints", "/sdapi/v1/unload-checkpoint",
+                        "/sdapi/v1/reload-checkpoint"):
+                return self._send(200, None)
+            self._send(404, {"detail": "Not Found"})
+
+    return MockHandler
+
+
+def start_server(host="127.0.0.1", port=7860, config=None):
+    """Start a mock server in a daemon thread; returns the HTTP server.
+
+    Pass port=0 to bind a free port (see server.server_address).
+    """
+    backend = MockBackend(config)
+    server = ThreadingHTTPServer((host, port), make_handler(backend))
+    server.daemon_threads = True
+    server.backend = backend
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock Stable Diffusion WebUI API (CPU only)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--step-latency", type=float, default=0.02, help="seconds per sampling step")
+    parser.add_argument("--base-latency", type=float, default=0.05, help="fixed seconds per generation")
+    parser.add_argument("--batch-cost", type=float, default=0.35, help="relative cost of each extra batch image")
+    parser.add_argument("--output-scale", type=float, default=0.125, help="returned image size / requested size")
+    parser.add_argument("--models", type=int, default=3, help="number of fake checkpoints")
+    parser.add_argument("--loras", type=int, default=5, help="number of fake LoRAs")
+    parser.add_argument("--vram-gb", type=float, default=None, help="simulate OOM above this much VRAM")
+    args = parser.parse_args(argv)
+
+    config = MockConfig(step_latency=args.step_latency, base_latency=args.base_latency,
+                        batch_cost=args.batch_cost, output_scale=args.output_scale,
+                        model_count=args.models, lora_count=args.loras, vram_gb=args.vram_gb)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(MockBackend(config)))
+    server.daemon_threads = True
+    print(f"🧪 Mock WebUI API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Helpers for the notebook generator scripts.
+
+Colab only sees the .ipynb, so bundle_cell() embeds sdbackend module
+sources into a code cell that writes them to /content/sdbackend and puts
+the package on sys.path for the cells that follow. instrument() adds the
+startup profiler (sdbackend.profiler) to a generated notebook, and
+write_notebook() saves it only when its content changed.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+INSTALL_ROOT = "/content"
+
+
+def read_module(name):
+    with open(os.path.join(PACKAGE_DIR, name + ".py"), encoding="utf-8") as f:
+        return f.read()
+
+
+def bundle_source(modules, install_root=INSTALL_ROOT):
+    """Return Python source that installs the given sdbackend modules."""
+    names = ["__init__"] + [name for name in modules if name != "__init__"]
+    lines = [
+        "import os",
+        "import sys",
+        "",
+        f"package_dir = os.path.join({install_root!r}, 'sdbackend')",
+        "os.makedirs(package_dir, exist_ok=True)",
+        "",
+        "sources = {}",
+    ]
+    for name in names:
+        lines.append(f"sources[{name!r}] = {read_module(name)!r}")
+    lines += [
+        "",
+        "for name, text in sources.items():",
+        "    with open(os.path.join(package_dir, name + '.py'), 'w', encoding='utf-8') as f:",
+        "        f.write(text)",
+        "",
+        f"if {install_root!r} not in sys.path:",
+        f"    sys.path.insert(0, {install_root!r})",
+        "",
+        "print(f\"✅ sdbackend installed to {package_dir}: {', '.join(sorted(sources))}\")",
+    ]
+    return "\n".join(lines)
+
+
+def bundle_cell(modules, install_root=INSTALL_ROOT):
+    """Return a notebook code cell that installs the given sdbackend modules."""
+    return {
+        "cell_type": "code",
+        "execution_count": None,
+        "metadata": {},
+        "outputs": [],
+        "source": [bundle_source(modules, install_root)],
+    }
+
+
+def code_cell(source):
+    return {"cell_type": "code", "execution_count": None, "metadata": {}, "outputs": [], "source": [source]}
+
+
+def profiler_cell(install_root=INSTALL_ROOT):
+    """Code cell that installs sdbackend.profiler and starts timing cells."""
+    source = bundle_source(["profiler"], install_root) + (
+        "\n\nfrom sdbackend.profiler import install"
+        "\nprofiler = install()"
+        "\nprint(f\"⏱️ Startup profiler on (session {profiler.session}); "
+        "timeline is saved after every cell\")"
+    )
+    return code_cell(source)
+
+
+def cell_text(cell):
+    source = cell["source"]
+    return source if isinstance(source, str) else "".join(source)
+
+
+def instrument(notebook, install_root=INSTALL_ROOT):
+    """Add the startup profiler to a notebook dict in place.
+
+    Every code cell gets a "# phase: <heading>" marker named after the
+    closest markdown heading above it, and a profiler cell (with its own
+    heading) is inserted before the heading of the first code cell, so
+    "## Cell 1" stays right above the code it names. The notebook title
+    (a heading in the very first cell) stays first.
+    """
+    heading = None
+    heading_index = None
+    insert_at = None
+    for index, cell in enumerate(notebook["cells"]):
+        if cell["cell_type"] == "markdown":
+            match = re.search(r"^#+\s*(.+)$", cell_text(cell), re.MULTILINE)
+            if match:
+                heading, heading_index = match.group(1).strip(), index
+            continue
+        if cell["cell_type"] != "code":
+            continue
+        if insert_at is None:
+            insert_at = heading_index if heading_index else index
+        name = heading or f"cell {index}"
+        marker = f"# phase: {name}\n"
+        if isinstance(cell["source"], str):
+            cell["source"] = marker + cell["source"]
+        else:
+            cell["source"] = [marker] + list(cell["source"])
+    if insert_at is not None:
+        notebook["cells"][insert_at:insert_at] = [
+            {"cell_type": "markdown", "metadata": {}, "source": ["## Cell 0: Startup Profiler"]},
+            profiler_cell(install_root),
+        ]
+    return notebook
+
+
+def cell_hash(cell):
+    """Content hash of one cell; how its source is split into lines does not matter."""
+    canonical = json.dumps(dict(cell, source=cell_text(cell)), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def write_notebook(notebook, path, indent=2, ensure_ascii=True):
+    """Write a notebook dict to path unless the file already holds exactly it.
+
+    The file is replaced atomically (temporary file + rename), so an open
+    Jupyter/Colab tab or a concurrent build never sees half a notebook,
+    and an unchanged notebook keeps its mtime. Returns {"written",
+    "created", "changed": indexes of cells whose hash is new, "cells"}.
+    """
+    text = json.dumps(notebook, indent=indent, ensure_ascii=ensure_ascii)
+    hashes = [cell_hash(cell) for cell in notebook["cells"]]
+    try:
+        with open(path, encoding="utf-8") as f:
+            old_text = f.read()
+    except OSError:
+        old_text = None
+    try:
+        old_hashes = {cell_hash(cell) for cell in json.loads(old_text)["cells"]} if old_text else set()
+    except (ValueError, KeyError, TypeError):
+        old_hashes = set()
+    result = {"written": text != old_text, "created": old_text is None, "cells": len(hashes),
+              "changed": [index for index, digest in enumerate(hashes) if digest not in old_hashes]}
+    if not result["written"]:
+        return result
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".notebook-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600; keep what the file had, or the usual umask default
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = os.stat(path).st_mode & 0o777 if old_text is not None else 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return result
+
+
+def describe_write(name, result):
+    """One line for the generator output: created, updated (which cells) or unchanged."""
+    if not result["written"]:
+        return f"✅ Unchanged: {name}"
+    if result["created"]:
+        return f"✅ Created: {name}"
+    return f"✅ Updated: {name} ({len(result['changed'])} of {result['cells']} cells changed)"
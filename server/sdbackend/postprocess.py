@@ -0,0 +1,364 @@
+"""
+Process-pool image post-processing, off the WebUI process.
+
+Resizing, sharpening, format conversion, metadata stamping and
+watermarking are CPU work; run through the WebUI's extras endpoints they
+hold the same process that drives the GPU. PostProcessor runs them on
+every CPU core in a process pool while the GPU renders the next job.
+Images travel to and from the workers through pre-allocated shared
+memory slots instead of being pickled through a pipe.
+
+A step list is JSON, applied in order:
+
+    [{"op": "resize", "width": 1024},            # or "scale": 2, "height"
+     {"op": "sharpen", "radius": 2, "percent": 120, "threshold": 3},
+     {"op": "watermark", "text": "poyo", "opacity": 0.35},
+     {"op": "metadata"},                          # A1111 "parameters" text
+     {"op": "format", "format": "webp", "quality": 90}]
+
+Numeric parameters are range-checked up front (PARAMETERS), and a
+resize may not produce more than MAX_SIDE per side or MAX_PIXELS.
+
+The proxy applies it to generation results when a txt2img/img2img
+payload carries "sdbackend_postprocess": [...], and serves
+POST /sdbackend/postprocess {"images": [...], "steps": [...]}.
+
+Requires Pillow (installed by the WebUI setup cell).
+"""
+
+import base64
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+POSTPROCESS_KEY = "sdbackend_postprocess"
+FORMATS = {"png": "PNG", "webp": "WEBP", "jpeg": "JPEG", "jpg": "JPEG"}
+OPERATIONS = ("resize", "sharpen", "format", "metadata", "watermark")
+MAX_SIDE = 8192
+MAX_PIXELS = 32 * 1024**2
+
+# op: {parameter: (type, min, max)}
+PARAMETERS = {
+    "resize": {"width": (int, 1, MAX_SIDE), "height": (int, 1, MAX_SIDE), "scale": (float, 0.01, 8.0)},
+    "sharpen": {"radius": (float, 0.0, 50.0), "percent": (int, 0, 1000), "threshold": (int, 0, 255)},
+    "watermark": {"size": (float, 0.005, 0.5), "opacity": (float, 0.0, 1.0)},
+    "format": {"quality": (int, 1, 100)},
+}
+
+
+class PostProcessError(ValueError):
+    pass
+
+
+def validate_steps(steps):
+    """Check a step list; returns it with numeric parameters converted and range-checked."""
+    if not isinstance(steps, list) or not all(isinstance(step, dict) for step in steps):
+        raise PostProcessError("steps must be a list of objects")
+    checked = []
+    for step in steps:
+        op = step.get("op")
+        if op not in OPERATIONS:
+            raise PostProcessError(f"unknown post-processing op {op!r}")
+        if op == "format" and str(step.get("format", "png")).lower() not in FORMATS:
+            raise PostProcessError(f"unsupported format {step.get('format')!r}")
+        step = dict(step)
+        for name, (kind, low, high) in PARAMETERS.get(op, {}).items():
+            if step.get(name) is None:
+                continue
+            try:
+                if isinstance(step[name], bool):
+                    raise ValueError
+                value = kind(step[name])
+            except (TypeError, ValueError):
+                raise PostProcessError(f"{op}: {name} must be a number") from None
+            if not low <= value <= high:
+                raise PostProcessError(f"{op}: {name} must be between {low:g} and {high:g}")
+            step[name] = value
+        checked.append(step)
+    return checked
+
+
+# -- image operations (run in the workers) ------------------------------
+
+def _resize(image, step):
+    from PIL import Image
+
+    width, height = image.size
+    if step.get("scale"):
+        size = (round(width * float(step["scale"])), round(height * float(step["scale"])))
+    elif step.get("width") and step.get("height"):
+        size = (int(step["width"]), int(step["height"]))
+    elif step.get("width"):
+        size = (int(step["width"]), round(height * int(step["width"]) / width))
+    elif step.get("height"):
+        size = (round(width * int(step["height"]) / height), int(step["height"]))
+    else:
+        return image
+    size = (max(1, size[0]), max(1, size[1]))
+    if size[0] > MAX_SIDE or size[1] > MAX_SIDE or size[0] * size[1] > MAX_PIXELS:
+        raise PostProcessError(f"resize: {size[0]}x{size[1]} is larger than allowed")
+    return image.resize(size, Image.LANCZOS, reducing_gap=3.0 if size[0] < width else None)
+
+
+def _sharpen(image, step):
+    from PIL import ImageFilter
+
+    return image.filter(ImageFilter.UnsharpMask(radius=float(step.get("radius", 2)),
+                                                percent=int(step.get("percent", 120)),
+                                                threshold=int(step.get("threshold", 3))))
+
+
+def _watermark(image, step):
+    from PIL import Image, ImageDraw, ImageFont
+
+    text = str(step.get("text", ""))
+    if not text:
+        return image
+    base = image.convert("RGBA")
+    size = max(12, int(min(base.size) * float(step.get("size", 0.04))))
+    try:
+        font = ImageFont.load_default(size=size)
+    except TypeError:
+        font = ImageFont.load_default()
+    layer = Image.new("RGBA", base.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    margin = size // 2
+    position = (base.size[0] - (right - left) - margin, base.size[1] - (bottom - top) - margin)
+    alpha = int(255 * float(step.get("opacity", 0.35)))
+    draw.text(position, text, font=font, fill=(255, 255, 255, alpha),
+              stroke_width=max(1, size // 16), stroke_fill=(0, 0, 0, alpha))
+    result = Image.alpha_composite(base, layer)
+    return result if image.mode == "RGBA" else result.convert(image.mode)
+
+
+def process_image(data, steps):
+    """Apply steps to encoded image bytes; returns encoded bytes."""
+    from PIL import Image, PngImagePlugin
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    target = (image.format or "PNG").upper()
+    quality = 90
+    lossless = False
+    text = image.info.get("parameters")
+    for step in steps:
+        op = step["op"]
+        if op == "resize":
+            image = _resize(image, step)
+        elif op == "sharpen":
+            image = _sharpen(image, step)
+        elif op == "watermark":
+            image = _watermark(image, step)
+        elif op == "metadata":
+            text = step.get("text", text)
+        elif op == "format":
+            target = FORMATS[str(step.get("format", "png")).lower()]
+            quality = int(step.get("quality", quality))
+            lossless = bool(step.get("lossless", False))
+
+    out = io.BytesIO()
+    if target == "PNG":
+        info = PngImagePlugin.PngInfo()
+        if text:
+            info.add_text("parameters", text)
+        image.save(out, "PNG", pnginfo=info, compress_level=4)
+    else:
+        if target == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        exif = Image.Exif()
+        if text:
+            # ImageDescription: what MetadataParser.parseJPEG/parseWEBP read first
+            exif[0x010E] = text
+        options = {"quality": quality, "exif": exif.tobytes()}
+        if target == "WEBP":
+            options.update(lossless=lossless, method=4)
+        image.save(out, target, **options)
+    return out.getvalue()
+
+
+# -- shared memory transport --------------------------------------------
+
+_attached = {}
+
+
+def _attach(name):
+    """Attach to a parent-owned block once per worker, without tracking it."""
+    block = _attached.get(name)
+    if block is None:
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13: workers share the parent's resource tracker, so
+            # the attachment's registration is a no-op and the parent unlinks
+            block = shared_memory.SharedMemory(name=name)
+        _attached[name] = block
+    return block
+
+
+def _job(input_name, input_size, output_name, steps):
+    """Worker entry: read the input slot, write the result to the output slot.
+
+    Returns (size, None), or (size, bytes) when the result does not fit.
+    """
+    data = bytes(_attach(input_name).buf[:input_size])
+    result = process_image(data, steps)
+    output = _attach(output_name)
+    if len(result) > output.size:
+        return len(result), result
+    output.buf[:len(result)] = result
+    return len(result), None
+
+
+class SharedBufferPool:
+    """Fixed (input, output) shared memory slot pairs, handed out one job at a time."""
+
+    def __init__(self, count, size):
+        self.size = size
+        self.slots = [(shared_memory.SharedMemory(create=True, size=size),
+                       shared_memory.SharedMemory(create=True, size=size)) for _ in range(count)]
+        self.free = queue.Queue()
+        for slot in self.slots:
+            self.free.put(slot)
+
+    def acquire(self):
+        return self.free.get()
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def close(self):
+        for slot in self.slots:
+            for block in slot:
+                block.close()
+                block.unlink()
+        self.slots = []
+
+
+class PostProcessor:
+    """Run step lists on a process pool; at most `slots` images in flight."""
+
+    def __init__(self, workers=None, slot_size=16 * 1024**2, slots=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        # One slot per worker keeps every core busy; /dev/shm pages are only used once written
+        self.buffers = SharedBufferPool(slots or self.workers, slot_size)
+        self.lock = threading.Lock()
+        self.stats = {"images": 0, "errors": 0, "oversized": 0, "bytes_in": 0, "bytes_out": 0,
+                      "seconds": 0.0, "pool_restarts": 0}
+
+    def _submit(self, fn, *args):
+        """pool.submit(); a pool broken by a dead worker (OOM kill) is replaced once."""
+        pool = self.pool
+        try:
+            return pool, pool.submit(fn, *args)
+        except BrokenProcessPool:
+            pool = self._replace_pool(pool)
+            return pool, pool.submit(fn, *args)
+
+    def _replace_pool(self, broken):
+        """Swap a broken pool for a new one (once, whoever notices first)."""
+        with self.lock:
+            if self.pool is broken:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                self.stats["pool_restarts"] += 1
+            pool = self.pool
+        broken.shutdown(wait=False)
+        return pool
+
+    def submit(self, data, steps):
+        """Queue one image; returns a Future of the processed bytes."""
+        future = Future()
+        start = time.time()
+        if len(data) > self.buffers.size:
+            # Too big for a slot: pickle it through the pool instead
+            pool, inner = self._submit(process_image, data, steps)
+            inner.add_done_callback(lambda f: self._finish(future, f, None, len(data), start, pool))
+            return future
+        slot = self.buffers.acquire()
+        try:
+            slot[0].buf[:len(data)] = data
+            pool, inner = self._submit(_job, slot[0].name, len(data), slot[1].name, steps)
+        except BaseException:
+            # Nothing will run _finish for this slot
+            self.buffers.release(slot)
+            raise
+        inner.add_done_callback(lambda f: self._finish(future, f, slot, len(data), start, pool))
+        return future
+
+    def _finish(self, future, inner, slot, input_size, start, pool):
+        try:
+            try:
+                result = inner.result()
+            except BrokenProcessPool:
+                # The worker died mid-job; later jobs get a fresh pool
+                self._replace_pool(pool)
+                raise
+            if slot is None:
+                data = result
+            else:
+                size, inline = result
+                data = inline if inline is not None else bytes(slot[1].buf[:size])
+                if inline is not None:
+                    with self.lock:
+                        self.stats["oversized"] += 1
+            with self.lock:
+                self.stats["images"] += 1
+                self.stats["bytes_in"] += input_size
+                self.stats["bytes_out"] += len(data)
+                self.stats["seconds"] += time.time() - start
+            future.set_result(data)
+        except Exception as e:
+            with self.lock:
+                self.stats["errors"] += 1
+            future.set_exception(e)
+        finally:
+            if slot is not None:
+                self.buffers.release(slot)
+
+    def process_many(self, images, steps):
+        """Process a list of encoded images in parallel; returns encoded bytes."""
+        futures = [self.submit(data, steps) for data in images]
+        return [future.result() for future in futures]
+
+    def apply_to_response(self, response, steps):
+        """Post-process the images of a txt2img/img2img (status, headers, body)."""
+        status, headers, body = response
+        if status != 200:
+            return response
+        data = json.loads(body)
+        images = data.get("images") or []
+        try:
+            info = json.loads(data.get("info") or "{}")
+        except ValueError:
+            info = {}
+        infotexts = info.get("infotexts") if isinstance(info.get("infotexts"), list) else []
+        # The WebUI puts a grid first when return_grid is on; it has no infotext of its own
+        offset = len(images) - len(infotexts) if infotexts and len(images) > len(infotexts) else 0
+
+        futures = []
+        for index, image in enumerate(images):
+            image_steps = steps
+            text = infotexts[index - offset] if 0 <= index - offset < len(infotexts) else None
+            if text is not None:
+                image_steps = [dict(step, text=step.get("text", text)) if step["op"] == "metadata" else step
+                               for step in steps]
+            futures.append(self.submit(base64.b64decode(image), image_steps))
+        data["images"] = [base64.b64encode(future.result()).decode("ascii") for future in futures]
+        return status, headers, json.dumps(data).encode("utf-8")
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.buffers.close()
+
+    def report(self):
+        with self.lock:
+            images = self.stats["images"]
+            return dict(self.stats, seconds=round(self.stats["seconds"], 3), workers=self.workers,
+                        seconds_per_image=round(self.stats["seconds"] / images, 4) if images else None)
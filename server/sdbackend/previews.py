@@ -0,0 +1,269 @@
+"""
+Low-resolution previews of a running generation, pushed to clients.
+
+The WebUI can decode the latent every N sampling steps with its "Approx
+cheap" decoder (a small matrix product on the latent instead of a VAE
+pass, so sampling does not slow down), but the preview only reaches
+clients through /sdapi/v1/progress polling, as a full base64 PNG per
+poll and per client. preview_options() turns those previews on;
+PreviewStreamer polls progress once for everyone while somebody is
+watching, encodes each new preview as a small WebP frame (at most
+max_size pixels on the long side) and pushes it to every subscriber of
+GET /sdbackend/previews, a Server-Sent Events stream of
+
+    event: preview
+    data: {"active", "step", "steps", "progress", "eta", "image"?}
+
+where image ("data:image/webp;base64,...") is only present when the
+preview changed. Each client gets a byte budget per second (?kbps=,
+capped by max_kbps). A frame arriving while a client is over budget
+replaces its unsent one, so slow clients skip frames instead of lagging.
+
+Requires Pillow (installed by the WebUI setup cell).
+"""
+
+import base64
+import hashlib
+import io
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_URL = "http://localhost:7860"
+EVERY_N_STEPS = 3
+HEARTBEAT = 15.0
+
+
+def preview_options(every_n_steps=EVERY_N_STEPS, decoder="Approx cheap"):
+    """WebUI options that make progress carry a cheap preview every N steps."""
+    return {
+        "live_previews_enable": True,
+        "show_progress_every_n_steps": every_n_steps,
+        "show_progress_type": decoder,
+        "live_previews_image_format": "png",
+    }
+
+
+def encode_frame(data, max_size=256, quality=60):
+    """WebP bytes of an image, shrunk to max_size on the long side."""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (max_size, max_size))
+    image = image.convert("RGB")
+    image.thumbnail((max_size, max_size), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", quality=quality, method=0)
+    return buffer.getvalue()
+
+
+class Subscriber:
+    """One streaming client: the frame waiting to be sent and a token bucket."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.pending = None
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class PreviewStreamer:
+    """Shared progress poller that fans previews out to subscribers.
+
+    The poller only runs while at least one client is subscribed; it
+    polls every poll_interval seconds during a job and every
+    idle_interval seconds otherwise, unless wake() says a job started.
+    """
+
+    def __init__(self, upstream=DEFAULT_URL, poll_interval=0.25, idle_interval=1.0,
+                 max_size=256, quality=60, max_kbps=512, default_kbps=256):
+        self.upstream = upstream.rstrip("/")
+        self.poll_interval = poll_interval
+        self.idle_interval = idle_interval
+        self.max_size = max_size
+        self.quality = quality
+        self.max_kbps = max_kbps
+        self.default_kbps = default_kbps
+        self.condition = threading.Condition()
+        self.subscribers = set()
+        self.latest = None
+        self.latest_image = None
+        self._image_digest = None
+        self._poller = None
+        self._wake = threading.Event()
+        self._woken_until = 0.0
+        self.stats = {"polls": 0, "poll_errors": 0, "frames": 0, "frame_bytes": 0,
+                      "events": 0, "sent_bytes": 0, "skipped": 0, "clients": 0}
+
+    # -- polling ----------------------------------------------------------
+
+    def poll(self):
+        """One progress poll; returns the event to publish, or None if nothing changed."""
+        from sdbackend.warmup import api_request
+
+        progress = api_request(self.upstream, "/sdapi/v1/progress?skip_current_image=false", timeout=10)
+        self.stats["polls"] += 1
+        state = progress.get("state") or {}
+        event = {
+            "active": bool(state.get("job_count")) or progress.get("progress", 0) > 0,
+            "step": state.get("sampling_step", 0),
+            "steps": state.get("sampling_steps", 0),
+            "progress": round(progress.get("progress") or 0.0, 4),
+            "eta": round(progress.get("eta_relative") or 0.0, 1),
+        }
+        image = progress.get("current_image")
+        if image:
+            digest = hashlib.sha1(image.encode("ascii")).hexdigest()
+            if digest != self._image_digest:
+                self._image_digest = digest
+                frame = encode_frame(base64.b64decode(image.split(",", 1)[-1]), self.max_size, self.quality)
+                self.stats["frames"] += 1
+                self.stats["frame_bytes"] += len(frame)
+                event["image"] = "data:image/webp;base64," + base64.b64encode(frame).decode("ascii")
+        elif not event["active"]:
+            self._image_digest = None
+        previous = self.latest
+        if previous is not None and "image" not in event and \
+                all(previous.get(key) == value for key, value in event.items()):
+            return None
+        return event
+
+    def publish(self, event):
+        with self.condition:
+            self.stats["events"] += 1
+            self.latest = event
+            if "image" in event:
+                self.latest_image = event["image"]
+            elif not event["active"]:
+                self.latest_image = None
+            for subscriber in self.subscribers:
+                pending = subscriber.pending
+                subscriber.pending = event
+                if pending is not None:
+                    self.stats["skipped"] += 1
+                    if event["active"] and "image" not in event and "image" in pending:
+                        # Skip the step, not the picture
+                        subscriber.pending = dict(event, image=pending["image"])
+            self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.subscribers:
+                    self._poller = None
+                    self.latest = self.latest_image = None
+                    self._image_digest = None
+                    return
+            active = False
+            try:
+                event = self.poll()
+                if event is not None:
+                    self.publish(event)
+                active = bool(self.latest and self.latest["active"])
+            except Exception:
+                self.stats["poll_errors"] += 1
+            fast = active or time.monotonic() < self._woken_until
+            self._wake.wait(self.poll_interval if fast else self.idle_interval)
+            self._wake.clear()
+
+    def wake(self, grace=3.0):
+        """A generation is starting: poll at the job pace until it shows up."""
+        self._woken_until = time.monotonic() + grace
+        self._wake.set()
+
+    # -- subscribers ------------------------------------------------------
+
+    def subscribe(self, kbps=None):
+        """Register a client limited to kbps kilobits per second (1..max_kbps).
+
+        Raises ValueError for a kbps that is not positive.
+        """
+        if kbps is not None and kbps <= 0:
+            raise ValueError(f"kbps must be positive, got {kbps}")
+        kbps = max(1, min(kbps or self.default_kbps, self.max_kbps))
+        subscriber = Subscriber(kbps * 1000 / 8)
+        with self.condition:
+            # A client joining mid-job sees the last picture right away
+            subscriber.pending = self.latest
+            if self.latest is not None and self.latest_image is not None:
+                subscriber.pending = dict(self.latest, image=self.latest_image)
+            self.subscribers.add(subscriber)
+            self.stats["clients"] += 1
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._run, daemon=True)
+                self._poller.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.condition:
+            self.subscribers.discard(subscriber)
+
+    def next_event(self, subscriber, timeout=HEARTBEAT):
+        """Wait for the subscriber's next event within its budget; None on timeout."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                if subscriber.pending is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self.condition.wait(remaining)
+                    continue
+                data = json.dumps(subscriber.pending)
+                subscriber.refill()
+                # A frame larger than a second's budget goes out on a full bucket (and leaves a debt)
+                cost = min(len(data), subscriber.rate)
+                if subscriber.tokens >= cost:
+                    subscriber.tokens -= len(data)
+                    subscriber.pending = None
+                    self.stats["sent_bytes"] += len(data)
+                    return data
+                # Over budget: wait, then send whatever is newest by then
+                self.condition.wait((cost - subscriber.tokens) / subscriber.rate)
+
+    def report(self):
+        with self.condition:
+            watching = len(self.subscribers)
+        return dict(self.stats, watching=watching, max_kbps=self.max_kbps)
+
+
+def serve_previews(streamer, handler):
+    """Stream GET /sdbackend/previews[?kbps=N] as Server-Sent Events."""
+    query = parse_qs(urlparse(handler.path).query)
+    try:
+        kbps = int(query["kbps"][0]) if "kbps" in query else None
+        subscriber = streamer.subscribe(kbps)
+    except ValueError as e:
+        body = json.dumps({"detail": f"Invalid kbps: {e}"}).encode("utf-8")
+        handler.send_response(400)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+        return
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/event-stream")
+    handler.send_header("Cache-Control", "no-cache")
+    handler.send_header("X-Accel-Buffering", "no")
+    handler.send_header("Access-Control-Allow-Origin", "*")
+    handler.send_header("Connection", "close")
+    handler.end_headers()
+    handler.close_connection = True
+    try:
+        handler.wfile.write(b"retry: 2000\n\n")
+        handler.wfile.flush()
+        while True:
+            data = streamer.next_event(subscriber)
+            message = f"event: preview\ndata: {data}\n\n" if data is not None else ": keep-alive\n\n"
+            handler.wfile.write(message.encode("utf-8"))
+            handler.wfile.flush()
+    except OSError:
+        pass
+    finally:
+        streamer.unsubscribe(subscriber)
@@ -0,0 +1,290 @@
+"""
+Startup profiler for the Colab notebook.
+
+The generators put a small cell at the top of the notebook that installs
+this module and calls install(). From then on every code cell is timed as
+a phase (named by the "# phase: ..." marker the generators add to each
+cell), and subprocess.run() calls and long time.sleep() calls made by the
+cell itself (the kernel's main thread, not helper threads such as the
+health monitor) are recorded as nested events, each with wall-clock and
+CPU time (CPU includes child processes, so pip and git are accounted for).
+At most MAX_EVENTS nested events are kept per session.
+
+After every cell the timeline is written as a Chrome trace (open it in
+chrome://tracing or https://ui.perfetto.dev) plus a text flame summary,
+and the per-phase totals are appended to a history kept on Google Drive
+when it is mounted, so regressions show up across sessions.
+
+    from sdbackend.profiler import phase
+    with phase("warm-up"):
+        ...
+"""
+
+import contextlib
+import json
+import os
+import re
+import shlex
+import subprocess
+import threading
+import time
+
+PROFILE_DIR = "/content/sdbackend_startup"
+DRIVE_PROFILE_DIR = "/content/drive/MyDrive/sdbackend/startup"
+PHASE_MARKER = re.compile(r"^#\s*phase:\s*(.+)$", re.MULTILINE)
+MIN_SLEEP = 0.5
+HISTORY_SIZE = 50
+MAX_EVENTS = 5000
+
+
+def cpu_seconds():
+    """CPU time of this process and its waited-for children."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def describe_command(args, limit=60):
+    if isinstance(args, (list, tuple)):
+        args = " ".join(shlex.quote(str(part)) for part in args)
+    args = " ".join(str(args).split())
+    return args if len(args) <= limit else args[:limit - 3] + "..."
+
+
+class Profiler:
+    """Collects timed events; save() writes the trace, summary and history."""
+
+    def __init__(self, session=None, out_dir=None):
+        self.session = session or time.strftime("%Y%m%d-%H%M%S")
+        self.out_dir = out_dir
+        self.origin = time.perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+        self.main_thread = threading.main_thread().ident
+        self.dropped = 0
+        self._cell = None
+        self._originals = {}
+
+    # -- recording ------------------------------------------------------
+
+    def record(self, name, category, start, wall, cpu, **args):
+        with self.lock:
+            # A long session must not grow the trace that every cell rewrites
+            if len(self.events) >= MAX_EVENTS and category != "cell":
+                self.dropped += 1
+                return
+            self.events.append({
+                "name": name,
+                "cat": category,
+                "start": start - self.origin,
+                "wall": wall,
+                "cpu": cpu,
+                "tid": threading.get_ident(),
+                "args": args,
+            })
+
+    @contextlib.contextmanager
+    def phase(self, name, category="phase"):
+        start, cpu = time.perf_counter(), cpu_seconds()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.perf_counter() - start, cpu_seconds() - cpu)
+
+    def begin_cell(self, name):
+        self._cell = (name, time.perf_counter(), cpu_seconds())
+
+    def end_cell(self, error=None):
+        if self._cell is None:
+            return
+        name, start, cpu = self._cell
+        self._cell = None
+        self.record(name, "cell", start, time.perf_counter() - start, cpu_seconds() - cpu,
+                    **({"error": error} if error else {}))
+
+    # -- hooks ----------------------------------------------------------
+
+    def install(self, shell=None):
+        """Patch subprocess.run/time.sleep and hook IPython cell execution."""
+        if self._originals:
+            return self
+        original_run, original_sleep = subprocess.run, time.sleep
+        self._originals = {"run": original_run, "sleep": original_sleep}
+
+        def run(args, *rest, **kwargs):
+            # Background threads (health checks, workers) run commands all session long
+            if threading.get_ident() != self.main_thread:
+                return original_run(args, *rest, **kwargs)
+            start, cpu = time.perf_counter(), cpu_seconds()
+            try:
+                return original_run(args, *rest, **kwargs)
+            finally:
+                self.record(describe_command(args), "subprocess", start,
+                            time.perf_counter() - start, cpu_seconds() - cpu)
+
+        def sleep(seconds):
+            if seconds < MIN_SLEEP or threading.get_ident() != self.main_thread:
+                return original_sleep(seconds)
+            start = time.perf_counter()
+            original_sleep(seconds)
+            self.record(f"sleep {seconds:g}s", "sleep", start, time.perf_counter() - start, 0.0)
+
+        subprocess.run = run
+        time.sleep = sleep
+
+        if shell is None:
+            try:
+                from IPython import get_ipython
+                shell = get_ipython()
+            except ImportError:
+                shell = None
+        if shell is not None:
+            shell.events.register("pre_run_cell", self._pre_run_cell)
+            shell.events.register("post_run_cell", self._post_run_cell)
+            self._originals["shell"] = shell
+        return self
+
+    def uninstall(self):
+        if not self._originals:
+            return
+        subprocess.run = self._originals["run"]
+        time.sleep = self._originals["sleep"]
+        shell = self._originals.get("shell")
+        if shell is not None:
+            shell.events.unregister("pre_run_cell", self._pre_run_cell)
+            shell.events.unregister("post_run_cell", self._post_run_cell)
+        self._originals = {}
+
+    def _pre_run_cell(self, info):
+        match = PHASE_MARKER.search(getattr(info, "raw_cell", "") or "")
+        self.begin_cell(match.group(1).strip() if match else "unnamed cell")
+
+    def _post_run_cell(self, result):
+        error = getattr(result, "error_in_exec", None)
+        self.end_cell(repr(error) if error else None)
+        try:
+            self.save()
+        except OSError:
+            pass
+
+    # -- output ---------------------------------------------------------
+
+    def trace(self):
+        """The timeline in Chrome trace event format."""
+        with self.lock:
+            events = list(self.events)
+        trace = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"startup {self.session}"}}]
+        for event in events:
+            trace.append({
+                "name": event["name"],
+                "cat": event["cat"],
+                "ph": "X",
+                "ts": round(event["start"] * 1e6),
+                "dur": round(event["wall"] * 1e6),
+                "pid": 1,
+                "tid": event["tid"],
+                "args": dict(event["args"], cpu_s=round(event["cpu"], 3)),
+            })
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def tree(self):
+        """Main-thread events nested by time containment: [(depth, event)]."""
+        with self.lock:
+            events = sorted((e for e in self.events if e["tid"] == self.main_thread),
+                            key=lambda e: (e["start"], -e["wall"]))
+        rows, stack = [], []
+        for event in events:
+            while stack and event["start"] >= stack[-1]["start"] + stack[-1]["wall"] - 1e-6:
+                stack.pop()
+            rows.append((len(stack), event))
+            stack.append(event)
+        return rows
+
+    def totals(self):
+        """Wall seconds per top-level phase."""
+        return {event["name"]: round(event["wall"], 3) for depth, event in self.tree() if depth == 0}
+
+    def summary(self, history=None, width=30):
+        rows = self.tree()
+        total = sum(event["wall"] for depth, event in rows if depth == 0) or 1.0
+        baseline = _median_totals(history or [])
+        lines = [f"Startup profile {self.session}: {total:.1f}s wall"
+                 + (f" ({self.dropped} events over the limit not recorded)" if self.dropped else ""),
+                 f"{'phase':<48} {'wall':>8} {'cpu':>8}  share"]
+        for depth, event in rows:
+            share = event["wall"] / total
+            label = ("  " * depth + event["name"])[:48]
+            line = f"{label:<48} {event['wall']:>7.1f}s {event['cpu']:>7.1f}s  {'█' * round(share * width)}"
+            previous = baseline.get(event["name"]) if depth == 0 else None
+            if previous and event["wall"] > previous * 1.25 and event["wall"] - previous > 5:
+                line += f"  ⚠️ was {previous:.1f}s"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def save(self, out_dir=None):
+        """Write trace-<session>.json, summary-<session>.txt and history.json."""
+        out_dir = out_dir or self.out_dir or default_out_dir()
+        os.makedirs(out_dir, exist_ok=True)
+        history_path = os.path.join(out_dir, "history.json")
+        try:
+            with open(history_path) as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            history = []
+        earlier = [entry for entry in history if entry.get("session") != self.session]
+
+        _write(os.path.join(out_dir, f"trace-{self.session}.json"), json.dumps(self.trace()))
+        _write(os.path.join(out_dir, f"summary-{self.session}.txt"), self.summary(earlier) + "\n")
+        entry = {"session": self.session, "phases": self.totals()}
+        _write(history_path, json.dumps((earlier + [entry])[-HISTORY_SIZE:], indent=1))
+        return out_dir
+
+
+def default_out_dir():
+    """Google Drive when mounted (survives the VM), else local disk."""
+    return DRIVE_PROFILE_DIR if os.path.isdir(os.path.dirname(os.path.dirname(DRIVE_PROFILE_DIR))) else PROFILE_DIR
+
+
+def _write(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _median_totals(history):
+    values = {}
+    for entry in history:
+        for name, wall in entry.get("phases", {}).items():
+            values.setdefault(name, []).append(wall)
+    return {name: sorted(walls)[len(walls) // 2] for name, walls in values.items()}
+
+
+_profiler = None
+
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def install(shell=None):
+    """Start profiling this kernel; returns the shared Profiler."""
+    return get_profiler().install(shell)
+
+
+def phase(name):
+    """Time a block as a named phase of the shared profiler."""
+    return get_profiler().phase(name)
+
+
+def print_summary():
+    profiler = get_profiler()
+    if not profiler.events:
+        print("   💡 Startup profiler is not running (run Cell 0 first)")
+        return
+    out_dir = profiler.save()
+    with open(os.path.join(out_dir, f"summary-{profiler.session}.txt"), encoding="utf-8") as f:
+        print(f.read().rstrip())
+    print(f"\n   📈 Trace: {os.path.join(out_dir, f'trace-{profiler.session}.json')} (open in ui.perfetto.dev)")
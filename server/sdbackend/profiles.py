@@ -0,0 +1,306 @@
+"""
+Launch profiles: map the detected GPU to WebUI performance flags.
+
+A profile picks the attention backend, the VRAM mode (--medvram/--lowvram),
+the precision and channels-last for one device class. The built-in table
+can be overridden from a YAML file, and the chosen profile is recorded
+next to the warm-up/benchmark numbers so results stay comparable.
+"""
+
+import json
+import os
+import subprocess
+import time
+
+OVERRIDES_PATH = os.environ.get("SDBACKEND_PROFILES", "/content/sdbackend_profiles.yaml")
+BENCHMARK_LOG = os.environ.get("SDBACKEND_BENCHMARKS", "/content/sdbackend_benchmarks.jsonl")
+
+BASE_ARGS = ["python", "launch.py", "--api", "--cors-allow-origins=*", "--listen"]
+
+ATTENTION_FLAGS = {
+    "default": [],
+    "xformers": ["--xformers"],
+    "sdp": ["--opt-sdp-attention"],
+    "sub-quad": ["--opt-sub-quad-attention"],
+}
+
+VRAM_FLAGS = {
+    "normal": [],
+    "medvram": ["--medvram"],
+    "lowvram": ["--lowvram"],
+}
+
+PRECISION_FLAGS = {
+    "half": [],
+    "half-vae-full": ["--no-half-vae"],
+    "full": ["--no-half", "--precision", "full"],
+}
+
+# Checked in order: the first profile whose "match" substring appears in the
+# device name wins; otherwise the first whose min_vram_gb fits is used.
+PROFILES = {
+    "a100": {
+        "match": ["A100", "H100"],
+        "min_vram_gb": 32,
+        "attention": "sdp",
+        "vram": "normal",
+        "precision": "half",
+        "channels_last": True,
+        "extra": [],
+    },
+    "l4": {
+        "match": ["L4", "A10G", "RTX 4090"],
+        "min_vram_gb": 20,
+        "attention": "sdp",
+        "vram": "normal",
+        "precision": "half",
+        "channels_last": True,
+        "extra": [],
+    },
+    "t4": {
+        "match": ["T4"],
+        "min_vram_gb": 12,
+        "attention": "xformers",
+        "vram": "normal",
+        "precision": "half-vae-full",
+        "channels_last": False,
+        "extra": [],
+    },
+    "small-gpu": {
+        "match": [],
+        "min_vram_gb": 6,
+        "attention": "xformers",
+        "vram": "medvram",
+        "precision": "half-vae-full",
+        "channels_last": False,
+        "extra": [],
+    },
+    "tiny-gpu": {
+        "match": [],
+        "min_vram_gb": 0.1,
+        "attention": "xformers",
+        "vram": "lowvram",
+        "precision": "half-vae-full",
+        "channels_last": False,
+        "extra": [],
+    },
+    "cpu": {
+        "match": ["CPU"],
+        "min_vram_gb": 0,
+        "attention": "sub-quad",
+        "vram": "normal",
+        "precision": "full",
+        "channels_last": False,
+        "extra": ["--use-cpu", "all", "--skip-torch-cuda-test"],
+    },
+}
+
+
+def detect_gpus(timeout=5):
+    """[(index, name, vram_gb)] from nvidia-smi; [] without a GPU."""
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=index,name,memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    if result.returncode != 0:
+        return []
+    gpus = []
+    for line in result.stdout.strip().splitlines():
+        index, name, memory = [field.strip() for field in line.split(",")]
+        gpus.append((int(index), name, int(memory) / 1024))
+    return gpus
+
+
+def detect_device():
+    """Return (device_name, vram_gb); ("CPU", 0.0) when CUDA is unavailable.
+
+    nvidia-smi answers in milliseconds; torch (seconds to import) is only
+    asked when it is missing.
+    """
+    gpus = detect_gpus()
+    if gpus:
+        return gpus[0][1], gpus[0][2]
+    try:
+        import torch
+        if torch.cuda.is_available():
+            props = torch.cuda.get_device_properties(0)
+            return torch.cuda.get_device_name(0), props.total_memory / (1024**3)
+    except Exception:
+        pass
+    return "CPU", 0.0
+
+
+# Allowed values of the override fields; a bad one would only fail at launch
+FIELD_CHOICES = {
+    "attention": ATTENTION_FLAGS,
+    "vram": VRAM_FLAGS,
+    "precision": PRECISION_FLAGS,
+}
+FIELD_TYPES = {
+    "match": (list, "a list"),
+    "min_vram_gb": ((int, float), "a number"),
+    "channels_last": (bool, "true or false"),
+    "extra": (list, "a list"),
+}
+
+
+def validate_overrides(data):
+    """Drop invalid entries from parsed overrides; returns (overrides, problems).
+
+    Each problem is a readable message; the dropped field keeps its
+    built-in value, so one typo does not stop the launch.
+    """
+    if not isinstance(data, dict):
+        return {}, [f"expected a mapping at the top level, got {type(data).__name__}"]
+    problems = []
+    overrides = {}
+    for key in data:
+        if key not in ("profile", "profiles"):
+            problems.append(f"unknown key {key!r} (expected 'profile' or 'profiles')")
+    profiles = data.get("profiles") or {}
+    if not isinstance(profiles, dict):
+        problems.append("'profiles' must be a mapping of profile name to fields")
+        profiles = {}
+    overrides["profiles"] = {}
+    for name, fields in profiles.items():
+        if not isinstance(fields, dict):
+            problems.append(f"profiles.{name}: expected a mapping of fields")
+            continue
+        valid = {}
+        for field, value in fields.items():
+            where = f"profiles.{name}.{field}"
+            if field in FIELD_CHOICES:
+                if not isinstance(value, str) or value not in FIELD_CHOICES[field]:
+                    problems.append(f"{where}: unknown value {value!r} "
+                                    f"(one of {', '.join(FIELD_CHOICES[field])})")
+                    continue
+            elif field in FIELD_TYPES:
+                types, expected = FIELD_TYPES[field]
+                # bool is an int, but "min_vram_gb: yes" is still a mistake
+                if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+                    problems.append(f"{where}: expected {expected}, got {value!r}")
+                    continue
+            else:
+                problems.append(f"{where}: unknown field")
+                continue
+            valid[field] = value
+        overrides["profiles"][name] = valid
+    chosen = data.get("profile")
+    if chosen is not None:
+        if chosen in PROFILES or chosen in overrides["profiles"]:
+            overrides["profile"] = chosen
+        else:
+            problems.append(f"profile: unknown profile {chosen!r}")
+    return overrides, problems
+
+
+def load_overrides(path=OVERRIDES_PATH):
+    """Load profile overrides from YAML (or JSON); {} when the file is missing.
+
+    Format:
+        profile: t4            # optional, force a profile by name
+        profiles:
+          t4:
+            attention: sdp     # fields merged over the built-in profile
+          my-gpu:              # or define a new one
+            match: ["RTX 3060"]
+            vram: medvram
+
+    A file that cannot be parsed is ignored and invalid values are
+    dropped (see validate_overrides); both are reported on stdout.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    try:
+        import yaml
+    except ImportError:
+        yaml = None
+    try:
+        data = yaml.safe_load(text) if yaml else json.loads(text)
+    except Exception as e:
+        if yaml:
+            print(f"   ⚠️ Ignoring {path}: not valid YAML ({e})")
+        else:
+            # Without PyYAML only JSON (which is also valid YAML) can be read
+            print(f"   ⚠️ Ignoring {path}: PyYAML is not installed, so the overrides must be "
+                  f"written as JSON ({e}); pip install pyyaml to use YAML")
+        return {}
+    if not data:
+        return {}
+    overrides, problems = validate_overrides(data)
+    for problem in problems:
+        print(f"   ⚠️ {path}: {problem}")
+    return overrides
+
+
+def resolve_profile(device_name, vram_gb, overrides=None):
+    """Pick the profile for a device, applying overrides; returns a new dict."""
+    overrides = overrides or {}
+    # Profiles defined only in the overrides are checked before the built-ins
+    profiles = {}
+    for name, fields in (overrides.get("profiles") or {}).items():
+        if name not in PROFILES:
+            profiles[name] = {"match": [], "min_vram_gb": None, "attention": "default",
+                              "vram": "normal", "precision": "half",
+                              "channels_last": False, "extra": []}
+    profiles.update({name: dict(profile) for name, profile in PROFILES.items()})
+    for name, fields in (overrides.get("profiles") or {}).items():
+        profiles[name].update(fields)
+
+    chosen = overrides.get("profile")
+    if chosen not in profiles:
+        chosen = None
+        for name, profile in profiles.items():
+            if any(m.lower() in device_name.lower() for m in profile.get("match", [])):
+                chosen = name
+                break
+    if chosen is None and vram_gb > 0:
+        for name, profile in profiles.items():
+            min_vram = profile.get("min_vram_gb")
+            if min_vram and vram_gb >= min_vram:
+                chosen = name
+                break
+    if chosen is None:
+        chosen = "cpu"
+
+    profile = profiles[chosen]
+    profile["name"] = chosen
+    profile["device"] = device_name
+    profile["vram_gb"] = round(vram_gb, 1)
+    return profile
+
+
+def profile_flags(profile):
+    """WebUI command-line flags for a resolved profile."""
+    flags = []
+    flags += ATTENTION_FLAGS[profile.get("attention", "default")]
+    flags += VRAM_FLAGS[profile.get("vram", "normal")]
+    flags += PRECISION_FLAGS[profile.get("precision", "half")]
+    if profile.get("channels_last"):
+        flags.append("--opt-channelslast")
+    flags += list(profile.get("extra", []))
+    return flags
+
+
+def launch_args(profile, port=7860):
+    """Full launch.py command line for a resolved profile."""
+    return BASE_ARGS + ["--port", str(port)] + profile_flags(profile)
+
+
+def record_benchmark(profile, results, path=BENCHMARK_LOG):
+    """Append one benchmark/warm-up result, tagged with its profile, as JSON."""
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "profile": profile,
+        "flags": profile_flags(profile),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+    return entry
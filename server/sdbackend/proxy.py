@@ -0,0 +1,546 @@
+"""
+Front proxy between the Cloudflare tunnel and the WebUI.
+
+    cloudflared → proxy (:7870) → WebUI (:7860)
+
+Requests are forwarded unchanged, except:
+  * with a Gateway attached, every request needs an API key and is rate
+    limited per key; generations are admitted against per-key
+    concurrency and cost quotas, and shed with 503 when the queued work
+    would take longer than the key's max_wait
+  * POST /sdapi/v1/txt2img and /img2img go through Proxy.generate(),
+    which answers deterministic repeats from the generation cache and
+    attaches identical in-flight requests to the job already running;
+    oversized requests are shrunk to fit VRAM by the memory guard and
+    compatible single-image txt2img calls are then micro-batched
+  * GET /thumbs... is served by the thumbnail service when attached
+  * GET /outputs/<path> is served by the storage manager when attached,
+    from the local disk or the persistent copy of an evicted file
+  * /uploads... is the resumable upload service when attached; img2img
+    payloads may reference its blobs as "sdblob:<sha256>"
+  * GET /sdbackend/stats reports proxy statistics as JSON
+  * GET /sdbackend/hashes[/<hash or name>] looks models up in a HashIndex
+  * GET /sdbackend/previews is a Server-Sent Events stream of small WebP
+    previews of the running generation when a PreviewStreamer is attached
+  * with a SessionState attached, running generations are tracked so a
+    snapshot can replay them after a Colab disconnect
+  * with a PostProcessor attached, generation payloads may carry
+    "sdbackend_postprocess" steps applied to the results on a process
+    pool, and POST /sdbackend/postprocess processes posted images
+  * responses are compressed (zstd/br/gzip, as negotiated) when a
+    Compressor is attached; the WebUI itself is asked for identity
+
+    python -m sdbackend.proxy --port 7870 --upstream http://localhost:7860
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from sdbackend.batcher import MicroBatcher
+from sdbackend.coalesce import Coalescer
+from sdbackend.compression import Compressor
+from sdbackend.gencache import CACHE_DIR, GenerationCache, is_deterministic, request_key
+from sdbackend.gateway import AUTH_HEADERS, Gateway, GatewayError, ensure_keys
+from sdbackend.hashindex import HashIndex
+from sdbackend.memguard import MemoryGuard, combined_memory_source, is_oom, webui_memory_source
+from sdbackend.postprocess import POSTPROCESS_KEY, PostProcessError, PostProcessor, validate_steps
+from sdbackend.previews import PreviewStreamer
+from sdbackend.session import SessionState
+from sdbackend.uploads import UPLOAD_DIR, UploadError, UploadService, serve_upload
+
+DEFAULT_UPSTREAM = "http://localhost:7860"
+DEFAULT_PORT = 7870
+
+GENERATION_PATHS = {"/sdapi/v1/txt2img": "txt2img", "/sdapi/v1/img2img": "img2img"}
+
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+              "trailers", "transfer-encoding", "upgrade", "content-length", "host"}
+
+
+# Responses made by the proxy itself need the CORS header the WebUI would send
+OWN_HEADERS = [("Content-Type", "application/json"), ("Access-Control-Allow-Origin", "*")]
+
+
+def json_response(status, data):
+    return status, list(OWN_HEADERS), json.dumps(data).encode("utf-8")
+
+
+def gateway_response(error):
+    """The reply for a request the gateway turned away."""
+    status, headers, body = json_response(error.status, {"detail": str(error)})
+    if error.retry_after:
+        headers.append(("Retry-After", str(error.retry_after)))
+    return status, headers, body
+
+
+def client_id(headers):
+    """Best-effort identity of the end client behind cloudflared."""
+    headers = {key.lower(): value for key, value in headers.items()}
+    forwarded = headers.get("x-forwarded-for", "").split(",")[0].strip()
+    return headers.get("cf-connecting-ip") or forwarded or "local"
+
+
+class Proxy:
+    """Forwarding logic plus the generation fast paths.
+
+    cache is a GenerationCache (or None to disable caching); coalescer a
+    Coalescer (or None) that merges identical in-flight generations;
+    batcher a MicroBatcher (or None) merging compatible txt2img calls;
+    guard a MemoryGuard (or None) that shrinks requests expected to run
+    out of VRAM and learns from every finished generation;
+    thumbnails a sdbackend.thumbnails.ThumbnailService to serve /thumbs;
+    storage a sdbackend.storage.StorageManager to serve /outputs;
+    compressor a sdbackend.compression.Compressor for responses;
+    uploads a sdbackend.uploads.UploadService for /uploads and blob refs;
+    postprocessor a sdbackend.postprocess.PostProcessor for result steps;
+    hashes a sdbackend.hashindex.HashIndex for model hash lookups;
+    previews a sdbackend.previews.PreviewStreamer for /sdbackend/previews;
+    gateway a sdbackend.gateway.Gateway for API keys and admission control;
+    session a sdbackend.session.SessionState told about every generation.
+    """
+
+    def __init__(self, upstream=DEFAULT_UPSTREAM, cache=None, coalescer=None, batcher=None,
+                 thumbnails=None, guard=None, storage=None, compressor=None,
+                 uploads=None, postprocessor=None, hashes=None, previews=None, gateway=None,
+                 session=None, timeout=600, options_ttl=10):
+        self.upstream = urlparse(upstream)
+        self.cache = cache
+        self.coalescer = coalescer
+        self.batcher = batcher
+        self.thumbnails = thumbnails
+        self.guard = guard
+        self.storage = storage
+        self.compressor = compressor
+        self.uploads = uploads
+        self.postprocessor = postprocessor
+        self.hashes = hashes
+        self.previews = previews
+        self.gateway = gateway
+        self.session = session
+        self.timeout = timeout
+        self.options_ttl = options_ttl
+        self._options = None
+        self._options_time = 0
+        self._options_lock = threading.Lock()
+        self.stats = {"requests": 0, "generations": 0, "upstream_errors": 0}
+
+    # -- upstream -------------------------------------------------------
+
+    def forward(self, method, path, body=b"", headers=None):
+        """Send one request to the WebUI; returns (status, headers, body)."""
+        headers = {key: value for key, value in (headers or {}).items()
+                   if key.lower() not in HOP_BY_HOP and key.lower() != "accept-encoding"}
+        if self.gateway is not None:
+            # The key is for this proxy; it has no business reaching the WebUI
+            headers = {key: value for key, value in headers.items() if key.lower() not in AUTH_HEADERS}
+        # Bodies are parsed, cached and batched here; compression happens at the edge
+        headers["Accept-Encoding"] = "identity"
+        connection = http.client.HTTPConnection(self.upstream.hostname, self.upstream.port or 80,
+                                                timeout=self.timeout)
+        try:
+            connection.request(method, path, body=body or None, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+            response_headers = [(key, value) for key, value in response.getheaders()
+                                if key.lower() not in HOP_BY_HOP]
+            return response.status, response_headers, data
+        except (OSError, http.client.HTTPException) as e:
+            self.stats["upstream_errors"] += 1
+            return json_response(502, {"detail": f"WebUI unreachable: {e}"})
+        finally:
+            connection.close()
+
+    def options(self):
+        """WebUI options (checkpoint, VAE), cached for options_ttl seconds."""
+        with self._options_lock:
+            if self._options is None or time.time() - self._options_time > self.options_ttl:
+                status, _, body = self.forward("GET", "/sdapi/v1/options")
+                self._options = json.loads(body) if status == 200 else {}
+                self._options_time = time.time()
+            return self._options
+
+    def invalidate_options(self):
+        with self._options_lock:
+            self._options = None
+
+    # -- generation -----------------------------------------------------
+
+    def generate(self, mode, path, body, headers, client=None):
+        """Handle a txt2img/img2img POST: cache, then coalesce, then upstream.
+
+        client is the gateway Client the request was authenticated as; its
+        limits apply to the work that actually reaches the GPU, so cache
+        hits and coalesced retries are free. Internal callers pass None.
+        """
+        self.stats["generations"] += 1
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return json_response(422, {"detail": "Invalid JSON body"})
+        if not isinstance(payload, dict):
+            return json_response(422, {"detail": "The request body must be a JSON object"})
+        if self.uploads is not None:
+            try:
+                resolved = self.uploads.resolve_payload(payload)
+            except UploadError as e:
+                return json_response(e.status, {"detail": str(e)})
+            if resolved is not payload:
+                payload, body = resolved, json.dumps(resolved).encode("utf-8")
+
+        key = None
+        if self.cache is not None or self.coalescer is not None:
+            key = request_key(payload, mode, self.options())
+        cacheable = self.cache is not None and is_deterministic(payload)
+        if cacheable:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return 200, OWN_HEADERS + [("X-SDBackend-Cache", "hit")], cached
+        elif self.cache is not None:
+            self.cache.count_uncacheable()
+
+        steps = payload.get(POSTPROCESS_KEY) if self.postprocessor is not None else None
+        if steps is not None:
+            try:
+                steps = validate_steps(steps)
+            except PostProcessError as e:
+                return json_response(422, {"detail": str(e)})
+
+        def generate_and_process():
+            if steps is None:
+                return self.run_generation(mode, path, payload, body, headers)
+            # The GPU is free for the next job while the pool works on these images
+            upstream = {k: v for k, v in payload.items() if k != POSTPROCESS_KEY}
+            response = self.run_generation(mode, path, upstream, json.dumps(upstream).encode("utf-8"), headers)
+            try:
+                return self.postprocessor.apply_to_response(response, steps)
+            except PostProcessError as e:
+                return json_response(422, {"detail": str(e)})
+            except Exception as e:
+                return json_response(500, {"detail": f"Post-processing failed: {e}"})
+
+        def tracked():
+            if self.previews is not None:
+                self.previews.wake()
+            if self.session is None:
+                return generate_and_process()
+            try:
+                token = self.session.job_started(mode, path, payload)
+            except Exception:
+                # Session bookkeeping never fails a generation
+                token = None
+            try:
+                return generate_and_process()
+            finally:
+                self.session.job_finished(token)
+
+        rejected = []
+
+        def execute():
+            if self.gateway is None or client is None:
+                return tracked()
+            try:
+                ticket = self.gateway.admit(client, payload, mode)
+            except GatewayError as e:
+                rejected.append(e)
+                return gateway_response(e)
+            response = (502, [], b"")
+            try:
+                response = tracked()
+                return response
+            finally:
+                self.gateway.finish(ticket, ok=response[0] == 200)
+
+        if self.coalescer is not None:
+            # Retries of a still-running request share its result. Random-seed
+            # requests only coalesce per client, so different users sending the
+            # same prompt still get different images (and can be micro-batched).
+            flight_key = key if is_deterministic(payload) else f"{key}:{client_id(headers)}"
+            # Deterministic flights are shared across API keys: a caller attached to a
+            # flight whose leader the gateway turned away is admitted on its own instead
+            (status, response_headers, response_body), shared = self.coalescer.run(
+                flight_key, execute, share=lambda response: not rejected)
+            if shared:
+                return status, response_headers + [("X-SDBackend-Coalesced", "1")], response_body
+        else:
+            status, response_headers, response_body = execute()
+
+        # A result the memory guard shrank is not what was asked for; later
+        # requests get a fresh try (VRAM may have freed up meanwhile)
+        adjusted = any(name == "X-SDBackend-Adjusted" for name, _ in response_headers)
+        if cacheable and status == 200 and not adjusted:
+            self.cache.put(key, response_body)
+            response_headers = response_headers + [("X-SDBackend-Cache", "miss")]
+        return status, response_headers, response_body
+
+    def run_generation(self, mode, path, payload, body, headers):
+        """Execute a generation upstream (cache misses end up here).
+
+        With a memory guard the request is planned to fit VRAM first; a
+        request that still runs out of memory is planned again with what
+        the guard learned from the failure and retried once.
+        """
+        if self.guard is None:
+            return self._dispatch_generation(mode, path, payload, body, headers)
+
+        planned, adjustments = self.guard.plan(payload)
+        response = self._dispatch_generation(mode, path, planned, body if planned is payload else None, headers)
+        if is_oom(response):
+            self.guard.record_oom(planned)
+            retry, more = self.guard.plan(planned)
+            if more:
+                adjustments += more
+                response = self._dispatch_generation(mode, path, retry, None, headers)
+        if adjustments:
+            status, response_headers, response_body = response
+            response = status, response_headers + [("X-SDBackend-Adjusted", "; ".join(adjustments))], response_body
+        return response
+
+    def _dispatch_generation(self, mode, path, payload, body, headers):
+        """One generation through the batcher (txt2img) or straight upstream.
+
+        body is the original request body when payload is unchanged, else None.
+        """
+        def forward(upstream_payload):
+            data = body if upstream_payload is payload and body is not None else \
+                json.dumps(upstream_payload).encode("utf-8")
+            response = self.forward("POST", path, data, headers)
+            if self.guard is not None and response[0] == 200:
+                self.guard.observe(upstream_payload)
+            return response
+
+        if self.batcher is not None and mode == "txt2img":
+            return self.batcher.run(payload, forward, self.options().get("sd_model_checkpoint"))
+        return forward(payload)
+
+    def postprocess(self, body):
+        """POST /sdbackend/postprocess: {"images": [base64...], "steps": [...]}."""
+        try:
+            request = json.loads(body or b"{}")
+            steps = validate_steps(request.get("steps"))
+            images = [base64.b64decode(image.split(",", 1)[-1]) for image in request.get("images") or []]
+        except (ValueError, AttributeError, PostProcessError) as e:
+            return json_response(422, {"detail": str(e)})
+        try:
+            results = self.postprocessor.process_many(images, steps)
+        except PostProcessError as e:
+            return json_response(422, {"detail": str(e)})
+        except Exception as e:
+            return json_response(500, {"detail": f"Post-processing failed: {e}"})
+        return json_response(200, {"images": [base64.b64encode(data).decode("ascii") for data in results]})
+
+    def report(self):
+        report = {"proxy": dict(self.stats)}
+        if self.cache is not None:
+            report["cache"] = self.cache.report()
+        if self.coalescer is not None:
+            report["coalescing"] = self.coalescer.report()
+        if self.batcher is not None:
+            report["batching"] = self.batcher.report()
+        if self.thumbnails is not None:
+            report["thumbnails"] = dict(self.thumbnails.stats)
+        if self.guard is not None:
+            report["memory"] = self.guard.report()
+        if self.storage is not None:
+            report["storage"] = self.storage.report()
+        if self.compressor is not None:
+            report["compression"] = self.compressor.report()
+        if self.uploads is not None:
+            report["uploads"] = self.uploads.report()
+        if self.postprocessor is not None:
+            report["postprocess"] = self.postprocessor.report()
+        if self.hashes is not None:
+            report["hashes"] = self.hashes.report()
+        if self.gateway is not None:
+            report["gateway"] = self.gateway.report()
+        if self.previews is not None:
+            report["previews"] = self.previews.report()
+        if self.session is not None:
+            report["session"] = self.session.report()
+        return report
+
+
+def make_handler(proxy):
+    """Build a request handler class bound to one Proxy."""
+
+    class ProxyHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, headers, body, head=False):
+            if proxy.compressor is not None:
+                headers, body = proxy.compressor.apply(self.headers.get("Accept-Encoding"), status, headers, body)
+            self.send_response(status)
+            for key, value in headers:
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+
+        def _dispatch(self, method):
+            proxy.stats["requests"] += 1
+            path = urlparse(self.path).path
+            client = None
+            if proxy.gateway is not None and method != "OPTIONS":
+                # CORS preflights carry no credentials; everything else needs a key
+                try:
+                    client = proxy.gateway.authenticate(self.headers, self.path, client_id(self.headers))
+                except GatewayError as e:
+                    # Turned away before the body is read, so the connection cannot be reused
+                    self.close_connection = True
+                    return self._reply(*gateway_response(e), head=(method == "HEAD"))
+            if path.startswith("/uploads") and proxy.uploads is not None:
+                # Before the body is read: uploads stream it to disk themselves
+                return serve_upload(proxy.uploads, self, method)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            headers = dict(self.headers.items())
+
+            if path == "/sdbackend/stats":
+                response = json_response(200, proxy.report())
+            elif path.startswith("/thumbs") and proxy.thumbnails is not None:
+                from sdbackend.thumbnails import serve_thumbnail
+                return serve_thumbnail(proxy.thumbnails, self)
+            elif path.startswith("/sdbackend/hashes") and proxy.hashes is not None:
+                from sdbackend.hashindex import serve_hashes
+                return serve_hashes(proxy.hashes, self)
+            elif path == "/sdbackend/previews" and proxy.previews is not None:
+                from sdbackend.previews import serve_previews
+                return serve_previews(proxy.previews, self)
+            elif path.startswith("/outputs") and proxy.storage is not None:
+                from sdbackend.storage import serve_output
+                return serve_output(proxy.storage, self)
+            elif method == "POST" and path == "/sdbackend/postprocess" and proxy.postprocessor is not None:
+                response = proxy.postprocess(body)
+            elif method == "POST" and path in GENERATION_PATHS:
+                response = proxy.generate(GENERATION_PATHS[path], self.path, body, headers, client)
+            else:
+                response = proxy.forward(method, self.path, body, headers)
+                if method == "POST" and path == "/sdapi/v1/options":
+                    proxy.invalidate_options()
+            self._reply(*response, head=(method == "HEAD"))
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_HEAD(self):
+            self._dispatch("HEAD")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_OPTIONS(self):
+            self._dispatch("OPTIONS")
+
+        def do_PATCH(self):
+            self._dispatch("PATCH")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+    return ProxyHandler
+
+
+def start_server(proxy, host="127.0.0.1", port=DEFAULT_PORT):
+    """Serve a Proxy from a daemon thread; returns the HTTP server."""
+    server = ThreadingHTTPServer((host, port), make_handler(proxy))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Front proxy for the Stable Diffusion WebUI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--upstream", default=DEFAULT_UPSTREAM)
+    parser.add_argument("--cache-dir", default=None, help="generation cache directory")
+    parser.add_argument("--cache-size-mb", type=int, default=2048, help="0 disables the cache")
+    parser.add_argument("--no-coalesce", action="store_true", help="do not merge identical in-flight requests")
+    parser.add_argument("--batch-window-ms", type=int, default=50, help="0 disables micro-batching")
+    parser.add_argument("--max-batch", type=int, default=4)
+    parser.add_argument("--per-item-batches", action="store_true",
+                        help="send per-item prompt/seed lists (backend must accept lists)")
+    parser.add_argument("--no-memory-guard", action="store_true", help="do not shrink requests to fit VRAM")
+    parser.add_argument("--memory-from", action="append", default=None, metavar="URL",
+                        help="worker URL the memory guard samples (repeat for each worker; default: --upstream)")
+    parser.add_argument("--upload-dir", default=None, help="resumable upload blob directory")
+    parser.add_argument("--no-uploads", action="store_true", help="disable the /uploads service")
+    parser.add_argument("--postprocess-workers", type=int, default=None,
+                        help="post-processing processes (default: all cores, 0 disables)")
+    parser.add_argument("--hash-webui-dir", default=None,
+                        help="index the model file hashes of this WebUI install for /sdbackend/hashes")
+    parser.add_argument("--preview-max-kbps", type=int, default=512,
+                        help="per-client bandwidth cap of /sdbackend/previews; 0 disables previews")
+    parser.add_argument("--keys", default=None,
+                        help="API keys file; requires a key on every request (created when missing)")
+    parser.add_argument("--max-jobs", type=int, default=32, help="generations admitted at once (with --keys)")
+    parser.add_argument("--session-dir", default=None,
+                        help="snapshot session state here and restore it on start")
+    parser.add_argument("--compress-min-size", type=int, default=1024,
+                        help="smallest response body to compress; 0 disables compression")
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache_size_mb > 0:
+        cache = GenerationCache(args.cache_dir or CACHE_DIR, args.cache_size_mb * 1024**2)
+    coalescer = None if args.no_coalesce else Coalescer()
+    guard = None
+    if not args.no_memory_guard:
+        # Behind a dispatcher the upstream answers from a random worker: sample each one
+        urls = args.memory_from or [args.upstream]
+        guard = MemoryGuard(combined_memory_source([webui_memory_source(url) for url in urls]))
+    batcher = None
+    if args.batch_window_ms > 0:
+        batcher = MicroBatcher(args.batch_window_ms / 1000, args.max_batch, args.per_item_batches, guard)
+    compressor = Compressor(args.compress_min_size) if args.compress_min_size > 0 else None
+    uploads = None
+    if not args.no_uploads:
+        uploads = UploadService(args.upload_dir or UPLOAD_DIR)
+        uploads.start_in_thread()
+    postprocessor = None
+    if args.postprocess_workers != 0:
+        postprocessor = PostProcessor(args.postprocess_workers)
+    hashes = None
+    if args.hash_webui_dir:
+        hashes = HashIndex(webui_dir=args.hash_webui_dir)
+        hashes.start_in_thread()
+    previews = None
+    if args.preview_max_kbps > 0:
+        previews = PreviewStreamer(args.upstream, max_kbps=args.preview_max_kbps,
+                                   default_kbps=min(256, args.preview_max_kbps))
+    gateway = None
+    if args.keys:
+        keys, created = ensure_keys(args.keys)
+        gateway = Gateway(keys, max_jobs=args.max_jobs)
+        if created:
+            print(f"🔑 New API key (saved in {args.keys}): {created}")
+    proxy = Proxy(args.upstream, cache, coalescer, batcher, guard=guard, compressor=compressor,
+                  uploads=uploads, postprocessor=postprocessor, hashes=hashes, previews=previews,
+                  gateway=gateway)
+    if args.session_dir:
+        session = SessionState(args.session_dir)
+        session.attach(proxy)
+        if session.load() is not None:
+            restored = session.restore_cache(cache) if cache is not None else 0
+            print(f"💾 Session restored: {restored} cached results, {session.replay_jobs()} jobs replayed")
+        session.start_in_thread()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(proxy))
+    server.daemon_threads = True
+    print(f"🔀 Proxy http://{args.host}:{args.port} → {args.upstream}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
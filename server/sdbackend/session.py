@@ -0,0 +1,353 @@
+"""
+Session checkpoints that survive a Colab disconnect.
+
+A disconnect takes the VM with it: /tmp (the cloudflared config), the
+generation cache, the jobs that were running and every option set
+through the API are gone, and the notebook starts from nothing.
+SessionState snapshots that state to persistent storage (Google Drive
+when mounted) every `interval` seconds:
+
+  config   launch settings recorded by the notebook (profile, workers)
+  options  the WebUI options in effect (checkpoint, VAE, CLIP skip...)
+  sizes    the resolutions real traffic used, to warm up the same ones
+  jobs     deterministic generations that had not finished
+  cache    the most recently used generation cache entries (byte budget)
+  files    small state files such as /tmp/cloudflared_config.json
+
+On the next start load() reads the snapshot; restore_files() and
+restore_cache() run before launch, the warm-up loads the saved
+checkpoint at the saved sizes, then apply_options() and replay_jobs()
+bring back the rest. A client retrying an interrupted job after the
+reconnect gets it from the cache, and resuming costs one model load.
+
+    python -m sdbackend.session [--dir DIR]   # show the saved snapshot
+"""
+
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+
+from sdbackend.gencache import is_deterministic
+
+SESSION_DIR = "/content/sdbackend_session"
+DRIVE_SESSION_DIR = "/content/drive/MyDrive/sdbackend/session"
+STATE_NAME = "session.json"
+CACHE_FOLDER = "cache"
+
+# Options carried over; the rest are defaults or specific to the old VM
+RESTORED_OPTIONS = ["sd_model_checkpoint", "sd_vae", "sd_unet", "CLIP_stop_at_last_layers",
+                    "eta_noise_seed_delta", "randn_source", "token_merging_ratio"]
+
+# State files restored verbatim (paths inside them are checked by their readers)
+STATE_FILES = ["/tmp/cloudflared_config.json"]
+
+# Nobody is waiting for a job older than this any more
+JOB_MAX_AGE = 1800
+MAX_JOB_BYTES = 16 * 1024**2
+
+
+def default_session_dir():
+    """Google Drive when mounted (survives the VM), else local disk."""
+    return DRIVE_SESSION_DIR if os.path.isdir("/content/drive/MyDrive") else SESSION_DIR
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class SessionState:
+    """Periodic snapshots of backend state, and their restoration.
+
+    proxy is the sdbackend.proxy.Proxy whose options, cache and jobs are
+    saved (attach later with attach()); the Proxy reports generations
+    through job_started()/job_finished(). config is a dict the notebook
+    fills with whatever it needs to relaunch the same way.
+    """
+
+    def __init__(self, root=None, proxy=None, interval=30.0, cache_bytes=256 * 1024**2,
+                 state_files=STATE_FILES):
+        self.root = root or default_session_dir()
+        self.proxy = proxy
+        self.interval = interval
+        self.cache_bytes = cache_bytes
+        self.state_files = list(state_files)
+        self.config = {}
+        self.previous = None
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.sizes = collections.Counter()
+        self.stats = {"checkpoints": 0, "checkpoint_errors": 0, "cache_copied": 0,
+                      "restored_cache": 0, "replayed": 0, "replay_errors": 0}
+        self.last_checkpoint = None
+        self._next_job = 0
+        self._stop = threading.Event()
+
+    @property
+    def state_path(self):
+        return os.path.join(self.root, STATE_NAME)
+
+    def attach(self, proxy):
+        self.proxy = proxy
+        proxy.session = self
+
+    # -- tracking (called by the proxy) -----------------------------------
+
+    def job_started(self, mode, path, payload):
+        """Remember a generation until it finishes; returns a token."""
+        with self.lock:
+            self._next_job += 1
+            token = self._next_job
+            try:
+                size = f"{int(payload.get('width') or 512)}x{int(payload.get('height') or 512)}"
+            except (TypeError, ValueError):
+                # Malformed sizes are the WebUI's to reject; just skip the sample
+                size = None
+            if size is not None:
+                self.sizes[size] += 1
+            if is_deterministic(payload):
+                self.jobs[token] = {"mode": mode, "path": path, "payload": payload, "started": time.time()}
+        return token
+
+    def job_finished(self, token):
+        with self.lock:
+            self.jobs.pop(token, None)
+
+    # -- snapshots --------------------------------------------------------
+
+    def snapshot(self):
+        """The state to save, as a JSON-serializable dict."""
+        options = {}
+        if self.proxy is not None:
+            current = self.proxy.options()
+            options = {key: current[key] for key in RESTORED_OPTIONS if key in current}
+        with self.lock:
+            jobs, budget = [], MAX_JOB_BYTES
+            for job in sorted(self.jobs.values(), key=lambda job: job["started"]):
+                size = len(json.dumps(job["payload"]))
+                if size <= budget:
+                    jobs.append(job)
+                    budget -= size
+            sizes = [size for size, _ in self.sizes.most_common(3)]
+        files = {}
+        for path in self.state_files:
+            try:
+                with open(path) as f:
+                    files[path] = f.read()
+            except OSError:
+                pass
+        # A WebUI that is down (or a session without traffic yet) keeps what was saved
+        previous = self.previous or {}
+        return {"version": 1, "saved": time.time(), "config": dict(self.config),
+                "options": options or previous.get("options") or {},
+                "sizes": sizes or previous.get("sizes") or [], "jobs": jobs, "files": files}
+
+    def hot_keys(self):
+        """Most recently used cache keys that fit in cache_bytes, hottest first."""
+        cache = getattr(self.proxy, "cache", None)
+        if cache is None:
+            return []
+        with cache.lock:
+            entries = list(cache.entries.items())
+        keys, total = [], 0
+        for key, size in reversed(entries):
+            if total + size > self.cache_bytes:
+                break
+            keys.append(key)
+            total += size
+        return keys
+
+    def _sync_cache(self, keys):
+        """Copy new hot entries into the session folder and drop cold ones."""
+        folder = os.path.join(self.root, CACHE_FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        saved = {name[:-5] for name in os.listdir(folder) if name.endswith(".json")}
+        cache = self.proxy.cache
+        for key in keys:
+            if key in saved:
+                continue
+            try:
+                with open(cache.path(key), "rb") as f:
+                    _write_atomic(os.path.join(folder, key + ".json"), f.read())
+                self.stats["cache_copied"] += 1
+            except OSError:
+                pass
+        for key in saved - set(keys):
+            try:
+                os.remove(os.path.join(folder, key + ".json"))
+            except OSError:
+                pass
+
+    def checkpoint(self):
+        """Write one snapshot; returns it (or None when saving failed)."""
+        try:
+            state = self.snapshot()
+            state["cache"] = self.hot_keys()
+            if self.proxy is not None and self.proxy.cache is not None:
+                self._sync_cache(state["cache"])
+            _write_atomic(self.state_path, json.dumps(state).encode("utf-8"))
+        except Exception as e:
+            self.stats["checkpoint_errors"] += 1
+            self.stats["last_error"] = str(e)
+            return None
+        self.stats["checkpoints"] += 1
+        self.last_checkpoint = state["saved"]
+        return state
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self.checkpoint()
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Stop the snapshot thread and write a final snapshot."""
+        self._stop.set()
+        self.checkpoint()
+
+    # -- restoring --------------------------------------------------------
+
+    def load(self):
+        """The last saved snapshot (also kept as self.previous), or None."""
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("version") != 1:
+            return None
+        self.previous = state
+        # Carry the launch settings over until the notebook records new ones
+        self.config.update(state.get("config") or {})
+        return state
+
+    def restore_files(self):
+        """Write the saved state files back; returns how many."""
+        restored = 0
+        for path, text in ((self.previous or {}).get("files") or {}).items():
+            if os.path.exists(path):
+                continue
+            try:
+                _write_atomic(path, text.encode("utf-8"))
+                restored += 1
+            except OSError:
+                pass
+        return restored
+
+    def restore_cache(self, cache):
+        """Put the saved hot entries into a GenerationCache; returns how many."""
+        folder = os.path.join(self.root, CACHE_FOLDER)
+        restored = 0
+        # Coldest first, so the hottest end up most recently used
+        for key in reversed((self.previous or {}).get("cache") or []):
+            if key in cache.entries:
+                continue
+            try:
+                with open(os.path.join(folder, key + ".json"), "rb") as f:
+                    cache.put(key, f.read())
+                restored += 1
+            except OSError:
+                pass
+        self.stats["restored_cache"] += restored
+        return restored
+
+    def warmup_settings(self):
+        """warm_up() keyword arguments that load what the last session used."""
+        state = self.previous or {}
+        options = state.get("options") or {}
+        settings = {key: options[name] for key, name in (("checkpoint", "sd_model_checkpoint"), ("vae", "sd_vae"))
+                    if options.get(name)}
+        sizes = [tuple(int(v) for v in size.split("x")) for size in state.get("sizes") or []]
+        if sizes:
+            settings["resolutions"] = sizes
+        return settings
+
+    def apply_options(self, base_url):
+        """POST the remaining saved options; returns the options applied."""
+        from sdbackend.warmup import api_request
+
+        options = dict((self.previous or {}).get("options") or {})
+        # The warm-up already loaded these (and loading twice is the expensive part)
+        options.pop("sd_model_checkpoint", None)
+        options.pop("sd_vae", None)
+        if options:
+            api_request(base_url, "/sdapi/v1/options", options, timeout=600)
+        if self.proxy is not None:
+            self.proxy.invalidate_options()
+        return options
+
+    def pending_jobs(self, max_age=JOB_MAX_AGE):
+        state = self.previous or {}
+        if time.time() - state.get("saved", 0) > max_age:
+            return []
+        return state.get("jobs") or []
+
+    def replay_jobs(self, max_age=JOB_MAX_AGE):
+        """Run the interrupted jobs again through the proxy in a daemon thread.
+
+        The results land in the generation cache, and a retry arriving
+        meanwhile attaches to the replay through the coalescer.
+        """
+        jobs = self.pending_jobs(max_age)
+
+        def replay():
+            for job in jobs:
+                body = json.dumps(job["payload"]).encode("utf-8")
+                try:
+                    status, _, _ = self.proxy.generate(job["mode"], job["path"], body, {})
+                    ok = status == 200
+                except Exception:
+                    ok = False
+                self.stats["replayed" if ok else "replay_errors"] += 1
+
+        if jobs and self.proxy is not None:
+            threading.Thread(target=replay, daemon=True).start()
+        return len(jobs)
+
+    def report(self):
+        with self.lock:
+            running = len(self.jobs)
+        return dict(self.stats, root=self.root, interval=self.interval, jobs=running,
+                    last_checkpoint=self.last_checkpoint,
+                    restored_from=(self.previous or {}).get("saved"))
+
+
+def describe(state):
+    """Lines summarizing a snapshot for the notebook output."""
+    age = time.time() - state.get("saved", 0)
+    options = state.get("options") or {}
+    lines = [f"saved {age / 60:.0f} min ago",
+             f"model: {options.get('sd_model_checkpoint', 'default')}"]
+    if state.get("sizes"):
+        lines.append("warm-up sizes: " + ", ".join(state["sizes"]))
+    lines.append(f"{len(state.get('cache') or [])} cached results, {len(state.get('jobs') or [])} unfinished jobs")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the saved backend session snapshot")
+    parser.add_argument("--dir", default=None, help="session folder (default: Drive when mounted)")
+    args = parser.parse_args(argv)
+    session = SessionState(args.dir)
+    state = session.load()
+    if state is None:
+        print(f"No session snapshot in {session.root}")
+        return
+    print(f"💾 Session snapshot in {session.root}")
+    for line in describe(state):
+        print(f"   • {line}")
+    if state.get("config"):
+        print(f"   • config: {json.dumps(state['config'])}")
+
+
+if __name__ == "__main__":
+    main()
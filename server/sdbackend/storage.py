@@ -0,0 +1,334 @@
+"""
+Output storage tiering: persistent copies and local eviction.
+
+Generated images pile up in the WebUI outputs directory on the ephemeral
+Colab disk. StorageManager copies every new output to a persistent
+target (a mounted Google Drive folder, or an S3-compatible bucket) with
+bounded concurrency and retries, and when the local disk fills up it
+deletes the least recently used local copies that are safely stored.
+A manifest records where every output lives, so /outputs requests still
+resolve after the local file is gone.
+
+Targets:
+  LocalTarget(root)   - any mounted directory (Drive, or a local stand-in)
+  S3Target(bucket)    - S3-compatible object storage (needs boto3)
+"""
+
+import asyncio
+import json
+import mimetypes
+import os
+import shutil
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlparse
+
+OUTPUTS_DIR = "/root/stable-diffusion-webui/outputs"
+DRIVE_DIR = "/content/drive/MyDrive/sd-outputs"
+MANIFEST_NAME = "manifest.json"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+class LocalTarget:
+    """Copy outputs into a directory (e.g. a mounted Drive folder)."""
+
+    def __init__(self, root=DRIVE_DIR):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def put(self, local_path, key):
+        destination = self.path(key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # Copy under a temporary name so a half-written file is never "stored"
+        tmp_path = destination + ".part"
+        shutil.copyfile(local_path, tmp_path)
+        os.replace(tmp_path, destination)
+        return os.path.getsize(destination)
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError:
+            return None
+
+    def read(self, key):
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def url(self, key):
+        return None
+
+    def describe(self, key):
+        return self.path(key)
+
+
+class S3Target:
+    """Upload outputs to an S3-compatible bucket (boto3 is imported lazily)."""
+
+    def __init__(self, bucket, prefix="sd-outputs", endpoint_url=None, url_expiry=3600, **client_options):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.url_expiry = url_expiry
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, **client_options)
+
+    def object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, local_path, key):
+        content_type = mimetypes.guess_type(local_path)[0] or "application/octet-stream"
+        self.client.upload_file(local_path, self.bucket, self.object_key(key),
+                                ExtraArgs={"ContentType": content_type})
+        return self.size(key)
+
+    def size(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))["ContentLength"]
+        except Exception:
+            return None
+
+    def read(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))["Body"].read()
+
+    def url(self, key):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.object_key(key)},
+            ExpiresIn=self.url_expiry)
+
+    def describe(self, key):
+        return f"s3://{self.bucket}/{self.object_key(key)}"
+
+
+class StorageManager:
+    """Upload new outputs to target and evict stored local copies under pressure.
+
+    Manifest entries (keyed by path relative to outputs_dir):
+      size, mtime     - of the local file when it was uploaded
+      stored          - the target holds a verified copy
+      local           - the local file still exists
+      last_access     - for LRU eviction (updated by resolve())
+    The manifest lives next to the persistent copies by default, so it
+    outlives the Colab VM.
+    """
+
+    def __init__(self, target, outputs_dir=OUTPUTS_DIR, manifest_path=None, concurrency=4,
+                 retries=3, backoff=1.0, high_watermark=0.85, low_watermark=0.75,
+                 poll_interval=5.0, verbose=True):
+        self.target = target
+        self.outputs_dir = outputs_dir
+        if manifest_path is None:
+            manifest_path = os.path.join(getattr(target, "root", outputs_dir), MANIFEST_NAME)
+        self.manifest_path = manifest_path
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.poll_interval = poll_interval
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.manifest = self._load_manifest()
+        self.stats = {"uploaded": 0, "upload_errors": 0, "retries": 0, "evicted": 0,
+                      "evicted_bytes": 0, "remote_hits": 0}
+        self._stop = threading.Event()
+
+    # -- manifest -------------------------------------------------------
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self):
+        with self.lock:
+            data = json.dumps(self.manifest)
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.manifest_path)
+
+    # -- uploading ------------------------------------------------------
+
+    def pending(self):
+        """Local outputs that have no stored copy of their current version."""
+        found = []
+        for dirpath, _, filenames in os.walk(self.outputs_dir):
+            for name in filenames:
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                key = os.path.relpath(path, self.outputs_dir).replace(os.sep, "/")
+                entry = self.manifest.get(key)
+                if entry and entry.get("stored") and entry.get("mtime") == stat.st_mtime:
+                    continue
+                found.append((key, path, stat))
+        return found
+
+    async def upload(self, key, path, stat, semaphore):
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    size = await asyncio.to_thread(self.target.put, path, key)
+                    if size != stat.st_size:
+                        raise OSError(f"size mismatch after upload: {size} != {stat.st_size}")
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        self.stats["upload_errors"] += 1
+                        if self.verbose:
+                            print(f"   ⚠️ Storage: could not upload {key}: {e}")
+                        return False
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(self.backoff * 2**attempt)
+        with self.lock:
+            previous = self.manifest.get(key) or {}
+            self.manifest[key] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "stored": True,
+                "local": True,
+                "location": self.target.describe(key),
+                "uploaded": time.time(),
+                "last_access": previous.get("last_access", stat.st_mtime),
+            }
+        self.stats["uploaded"] += 1
+        return True
+
+    async def sync_once(self):
+        """Upload everything pending, then evict if the disk is under pressure."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self.upload(key, path, stat, semaphore)
+                                         for key, path, stat in self.pending()))
+        evicted = await asyncio.to_thread(self.evict)
+        if results or evicted:
+            await asyncio.to_thread(self.save_manifest)
+        return {"uploaded": sum(results), "failed": len(results) - sum(results), "evicted": evicted}
+
+    async def run(self):
+        while not self._stop.is_set():
+            await self.sync_once()
+            await asyncio.sleep(self.poll_interval)
+
+    def start_in_thread(self):
+        """Run the uploader on its own event loop in a daemon thread."""
+        thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    # -- eviction -------------------------------------------------------
+
+    def disk_usage(self):
+        usage = shutil.disk_usage(self.outputs_dir)
+        return usage.used / usage.total
+
+    def evict(self, usage=None):
+        """Delete stored local copies, least recently used first, until the
+        disk is below low_watermark. Returns the number of files deleted."""
+        usage = self.disk_usage() if usage is None else usage
+        if usage < self.high_watermark:
+            return 0
+        total = shutil.disk_usage(self.outputs_dir).total
+        to_free = (usage - self.low_watermark) * total
+        with self.lock:
+            candidates = sorted((entry.get("last_access", 0), key) for key, entry in self.manifest.items()
+                                if entry.get("stored") and entry.get("local"))
+        evicted = 0
+        for _, key in candidates:
+            if to_free <= 0:
+                break
+            path = os.path.join(self.outputs_dir, key)
+            entry = self.manifest[key]
+            try:
+                # Never drop a file that changed since it was stored
+                if os.path.getmtime(path) != entry["mtime"] or self.target.size(key) != entry["size"]:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+            with self.lock:
+                entry["local"] = False
+            to_free -= entry["size"]
+            evicted += 1
+            self.stats["evicted"] += 1
+            self.stats["evicted_bytes"] += entry["size"]
+        return evicted
+
+    # -- lookup ---------------------------------------------------------
+
+    def resolve(self, key):
+        """Where an output lives: ("local", path), ("remote", url or None) or None."""
+        key = key.lstrip("/")
+        path = os.path.join(self.outputs_dir, key)
+        with self.lock:
+            entry = self.manifest.get(key)
+            if entry is not None:
+                entry["last_access"] = time.time()
+        if os.path.isfile(path):
+            return "local", path
+        if entry is not None and entry.get("stored"):
+            self.stats["remote_hits"] += 1
+            return "remote", self.target.url(key)
+        return None
+
+    def report(self):
+        with self.lock:
+            entries = list(self.manifest.values())
+        return dict(self.stats,
+                    files=len(entries),
+                    stored=sum(1 for e in entries if e.get("stored")),
+                    local=sum(1 for e in entries if e.get("local")),
+                    disk_usage=round(self.disk_usage(), 4))
+
+
+def serve_output(storage, handler):
+    """Answer GET /outputs/<path> (or /outputs?path=<path>) on a BaseHTTPRequestHandler.
+
+    Local files are sent directly; evicted ones are read back from the
+    target, or redirected to it when it has its own URLs (S3).
+    """
+    parsed = urlparse(handler.path)
+    key = (parse_qs(parsed.query).get("path") or [""])[0] or unquote(parsed.path[len("/outputs"):])
+    key = key.lstrip("/")
+    found = storage.resolve(key) if key and ".." not in key.split("/") else None
+    data = None
+    if found is not None:
+        where, location = found
+        if where == "remote" and location:
+            handler.send_response(302)
+            handler.send_header("Location", location)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        try:
+            if where == "local":
+                with open(location, "rb") as f:
+                    data = f.read()
+            else:
+                data = storage.target.read(key)
+        except Exception:
+            data = None
+    if data is None:
+        handler.send_response(404)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return
+    handler.send_response(200)
+    handler.send_header("Content-Type", mimetypes.guess_type(key)[0] or "application/octet-stream")
+    handler.send_header("Content-Length", str(len(data)))
+    handler.send_header("Cache-Control", "public, max-age=86400")
+    handler.send_header("Access-Control-Allow-Origin", "*")
+    handler.end_headers()
+    handler.wfile.write(data)
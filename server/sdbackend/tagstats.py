@@ -0,0 +1,200 @@
+"""
+Dataset-level tag statistics from caption files.
+
+DatasetCreator shows the tags of one image at a time; deciding which
+tags dominate a training set, which always come together and which are
+rare enough to prune needs the whole dataset, and doing that in the page
+freezes the tab on large datasets. analyze() takes the tags of every
+image (read_captions() loads them from the caption files the dataset
+export writes: one file per image, comma-separated tags), builds the
+sparse image x tag matrix and reports
+
+  counts    images per tag, and coverage: the share of images with it
+  pairs     co-occurring tags among the `top` most frequent ones, scored
+            by PMI log(p(a,b) / p(a)p(b)) and normalized PMI
+            (PMI / -log p(a,b): -1 never together, 0 independent,
+            1 always together)
+  rare      tags on fewer than min_count images, and how many images
+            would be left without any tag if they were pruned
+
+as compact JSON: tag names are listed once, most frequent first, and
+everything else refers to them by index. With NumPy and SciPy the pair
+counts are one sparse matrix product (seconds for 100k images); without
+them a pure Python pair count gives the same numbers, more slowly.
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, combinations
+
+CAPTION_EXTENSIONS = (".txt", ".caption")
+
+
+def parse_caption(text):
+    """Unique tags of one caption, normalized (lowercase, single spaces), in order."""
+    tags = {}
+    for part in text.replace("\n", ",").split(","):
+        tag = " ".join(part.split()).lower()
+        if tag:
+            tags.setdefault(tag, None)
+    return list(tags)
+
+
+def find_captions(root, extensions=CAPTION_EXTENSIONS):
+    """Caption files under root, in a stable order."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        paths.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                     if name.lower().endswith(extensions))
+    return paths
+
+
+def read_captions(paths, workers=16):
+    """Tags of every caption file; read in parallel since Drive reads are slow per file."""
+    def read(path):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return parse_caption(f.read())
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(read, paths))
+
+
+def tag_matrix(captions):
+    """(tags, rows): the vocabulary and each image's tag indices (the CSR rows)."""
+    index = {}
+    rows = [[index.setdefault(tag, len(index)) for tag in tags] for tags in captions]
+    return list(index), rows
+
+
+def _pairs_scipy(rows, n_tags, top_ids):
+    import numpy as np
+    from scipy import sparse
+
+    lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.fromiter(chain.from_iterable(rows), dtype=np.int32, count=int(indptr[-1]))
+    matrix = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr),
+                               shape=(len(rows), n_tags))
+    top = matrix[:, top_ids].tocsc()
+    product = (top.T @ top).tocoo()
+    upper = product.row < product.col
+    return {(top_ids[a], top_ids[b]): int(count)
+            for a, b, count in zip(product.row[upper], product.col[upper], product.data[upper])}
+
+
+def _pairs_python(rows, top_ids):
+    top = set(top_ids)
+    pairs = Counter()
+    for row in rows:
+        pairs.update(combinations(sorted(tag for tag in row if tag in top), 2))
+    return pairs
+
+
+def analyze(captions, top=200, min_count=2, min_pair=2, max_pairs=500):
+    """Frequency, co-occurrence and coverage statistics of a list of tag lists."""
+    start = time.perf_counter()
+    names, rows = tag_matrix(captions)
+    images = len(rows)
+    counts = Counter(chain.from_iterable(rows))
+    order = sorted(range(len(names)), key=lambda tag: (-counts[tag], names[tag]))
+    position = {tag: i for i, tag in enumerate(order)}
+    top_ids = order[:top]
+    try:
+        pairs = _pairs_scipy(rows, len(names), top_ids)
+        backend = "scipy"
+    except ImportError:
+        pairs = _pairs_python(rows, top_ids)
+        backend = "python"
+
+    scored = []
+    for (a, b), together in pairs.items():
+        if together < min_pair:
+            continue
+        pmi = math.log(together * images / (counts[a] * counts[b]))
+        joint = -math.log(together / images)
+        npmi = pmi / joint if joint else 1.0
+        first, second = sorted((position[a], position[b]))
+        scored.append([first, second, together, round(pmi, 3), round(npmi, 3)])
+    scored.sort(key=lambda pair: (-pair[4], -pair[2], pair[0], pair[1]))
+
+    lengths = sorted(map(len, rows))
+    rare_from = next((i for i, tag in enumerate(order) if counts[tag] < min_count), len(order))
+    left_untagged = sum(1 for row in rows if row and all(counts[tag] < min_count for tag in row))
+    return {
+        "images": images,
+        "untagged": lengths.count(0) if lengths else 0,
+        "tags_per_image": {
+            "mean": round(sum(lengths) / images, 2) if images else 0,
+            "median": lengths[images // 2] if images else 0,
+            "max": lengths[-1] if images else 0,
+        },
+        "tags": [names[tag] for tag in order],
+        "counts": [counts[tag] for tag in order],
+        "coverage": [round(counts[tag] / images, 4) for tag in order],
+        # [tag a, tag b, images with both, pmi, npmi]; a and b index "tags"
+        "pairs": scored[:max_pairs],
+        "pair_tags": len(top_ids),
+        "rare": {
+            "min_count": min_count,
+            "from": rare_from,
+            "tags": len(order) - rare_from,
+            "occurrences": sum(counts[tag] for tag in order[rare_from:]),
+            "images_left_untagged": left_untagged,
+        },
+        "backend": backend,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def describe(stats, limit=10):
+    """Lines summarizing analyze() output for a terminal."""
+    tags = stats["tags"]
+    lines = [f"{stats['images']} images, {len(tags)} tags "
+             f"({stats['tags_per_image']['mean']} per image, {stats['untagged']} untagged)"]
+    lines.append("top: " + ", ".join(f"{tag} {coverage:.0%}"
+                                      for tag, coverage in zip(tags[:limit], stats["coverage"])))
+    pairs = stats["pairs"][:limit]
+    if pairs:
+        lines.append("together: " + ", ".join(f"{tags[a]} + {tags[b]} ({npmi:.2f})"
+                                              for a, b, _, _, npmi in pairs))
+    rare = stats["rare"]
+    lines.append(f"{rare['tags']} tags on fewer than {rare['min_count']} images; "
+                 f"pruning them leaves {rare['images_left_untagged']} images untagged")
+    lines.append(f"analyzed in {stats['seconds']} s ({stats['backend']})")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tag frequency and co-occurrence statistics of a dataset")
+    parser.add_argument("root", help="dataset folder with one caption file per image")
+    parser.add_argument("-o", "--output", default=None, help="write the JSON here (default: print it)")
+    parser.add_argument("--top", type=int, default=200, help="most frequent tags to score pairs among")
+    parser.add_argument("--min-count", type=int, default=2, help="tags on fewer images count as rare")
+    parser.add_argument("--min-pair", type=int, default=2, help="ignore pairs seen on fewer images")
+    parser.add_argument("--max-pairs", type=int, default=500)
+    parser.add_argument("--ext", action="append", default=None,
+                        help="caption extension (repeatable, default .txt and .caption)")
+    args = parser.parse_args(argv)
+
+    paths = find_captions(args.root, tuple(args.ext) if args.ext else CAPTION_EXTENSIONS)
+    stats = analyze(read_captions(paths), top=args.top, min_count=args.min_count,
+                    min_pair=args.min_pair, max_pairs=args.max_pairs)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(stats, f, separators=(",", ":"), ensure_ascii=False)
+        print(f"📊 Tag statistics written to {args.output}")
+        for line in describe(stats):
+            print(f"   • {line}")
+    else:
+        print(json.dumps(stats, separators=(",", ":"), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Thumbnail pipeline for generated outputs.
+
+New images under the WebUI outputs directory are turned into multi-size
+WebP thumbnails in a process pool. JPEG sources are downscaled while
+decoding (Image.draft); PNG and WebP, which is what the WebUI writes,
+are decoded at full resolution once and every size is derived from the
+previous one (reducing_gap keeps those resizes cheap). Thumbnails live
+in a content-addressed cache (sha256 of the source bytes) with LRU
+eviction by total size, and are served with immutable long-lived cache
+headers. A file whose digest is already cached is only hashed, so a
+new session does not render the existing outputs again.
+
+The bundled front end does not request /thumbs yet: its dataset grid
+shows the user's local files and generation results arrive inline as
+base64, so neither crosses the tunnel as an output file. /thumbs is
+for clients that browse /outputs (add ?key=<key> behind the gateway).
+
+Requires Pillow (installed by the WebUI setup cell).
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+OUTPUTS_DIR = "/root/stable-diffusion-webui/outputs"
+CACHE_DIR = "/content/sdbackend_cache/thumbs"
+SIZES = (128, 256, 512)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def render_thumbnails(data, sizes=SIZES, quality=80):
+    """Encode WebP thumbnails of image bytes; returns {size: webp bytes}.
+
+    Sizes are rendered largest first and each smaller one is derived from
+    the previous result, so the source is decoded only once.
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    largest = max(sizes)
+    # JPEG: let the decoder downscale by 1/2, 1/4 or 1/8 while decoding
+    image.draft("RGB", (largest, largest))
+    image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+    results = {}
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size), Image.LANCZOS, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=quality, method=4)
+        results[size] = buffer.getvalue()
+    return results
+
+
+def thumbnail_path(root, digest, size):
+    return os.path.join(root, digest[:2], f"{digest}_{size}.webp")
+
+
+def _thumbnail_job(path, sizes, quality, cache_root):
+    """Process pool entry point: read a file and render its thumbnails.
+
+    Returns (digest, None) without rendering when the cache already has
+    every size of that content.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if all(os.path.exists(thumbnail_path(cache_root, digest, size)) for size in sizes):
+        return digest, None
+    return digest, render_thumbnails(data, sizes, quality)
+
+
+class ThumbnailCache:
+    """Content-addressed thumbnail store with LRU eviction by total bytes.
+
+    Files are stored as <root>/<digest[:2]>/<digest>_<size>.webp; a read
+    bumps the file's mtime, which is the LRU order used for eviction.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=512 * 1024**2):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._entries())
+
+    def path(self, digest, size):
+        return thumbnail_path(self.root, digest, size)
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".webp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def has(self, digest, sizes):
+        return all(os.path.exists(self.path(digest, size)) for size in sizes)
+
+    def put(self, digest, thumbnails):
+        with self.lock:
+            for size, data in thumbnails.items():
+                path = self.path(digest, size)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                self.total_bytes += len(data) - old_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def get(self, digest, size):
+        path = self.path(digest, size)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _evict(self):
+        # Drop least recently used files until we are 10% under the limit
+        target = self.max_bytes * 0.9
+        for path, size, _ in sorted(self._entries(), key=lambda entry: entry[2]):
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+            except OSError:
+                pass
+
+
+class ThumbnailService:
+    """Watch the outputs directory and thumbnail new images in a process pool.
+
+    index maps an output path (relative to outputs_dir) to its content
+    digest, so galleries can ask for thumbnails by path or by digest.
+    """
+
+    def __init__(self, outputs_dir=OUTPUTS_DIR, cache=None, sizes=SIZES,
+                 quality=80, workers=None, poll_interval=2.0):
+        self.outputs_dir = outputs_dir
+        self.cache = cache or ThumbnailCache()
+        self.sizes = tuple(sizes)
+        self.quality = quality
+        self.poll_interval = poll_interval
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        self.index_path = os.path.join(self.cache.root, "index.json")
+        self.index = self._load_index()
+        self._index_lock = threading.Lock()
+        self._index_dirty = False
+        self.pending = {}
+        self.stats = {"rendered": 0, "cached": 0, "errors": 0}
+        self._seen = {}
+        self._stop = threading.Event()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self):
+        """Write the index if it changed; once per scan, not once per image."""
+        with self._index_lock:
+            if not self._index_dirty:
+                return
+            data = json.dumps(self.index)
+            self._index_dirty = False
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.index_path)
+
+    def scan_once(self):
+        """Submit new or modified images; returns the number submitted."""
+        submitted = 0
+        for dirpath, _, filenames in os.walk(self.outputs_dir):
+            for name in filenames:
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if self._seen.get(path) == mtime or path in self.pending:
+                    continue
+                self._seen[path] = mtime
+                self.submit(path)
+                submitted += 1
+        return submitted
+
+    def submit(self, path):
+        future = self.pool.submit(_thumbnail_job, path, self.sizes, self.quality, self.cache.root)
+        self.pending[path] = future
+        future.add_done_callback(lambda f, path=path: self._done(path, f))
+        return future
+
+    def _done(self, path, future):
+        self.pending.pop(path, None)
+        try:
+            digest, thumbnails = future.result()
+        except Exception:
+            self.stats["errors"] += 1
+            return
+        if thumbnails is None:
+            self.stats["cached"] += 1
+        else:
+            self.cache.put(digest, thumbnails)
+            self.stats["rendered"] += 1
+        with self._index_lock:
+            self.index[os.path.relpath(path, self.outputs_dir)] = digest
+            self._index_dirty = True
+
+    def add_bytes(self, data):
+        """Thumbnail in-memory image bytes (e.g. API results); returns the digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.cache.has(digest, self.sizes):
+            self.cache.put(digest, render_thumbnails(data, self.sizes, self.quality))
+            self.stats["rendered"] += 1
+        return digest
+
+    def run(self):
+        while not self._stop.is_set():
+            self.scan_once()
+            self._stop.wait(self.poll_interval)
+            # Jobs of the previous scan have finished by now (or will be in the next write)
+            self.save_index()
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+        self.pool.shutdown(wait=False)
+        self.save_index()
+
+    def lookup(self, query_path):
+        """Resolve a /thumbs request path to (digest, size) or None.
+
+        /thumbs/<digest>_<size>.webp         by content digest
+        /thumbs?path=<output path>&size=256  by path under outputs_dir
+        """
+        parsed = urlparse(query_path)
+        name = parsed.path.rstrip("/").rsplit("/", 1)[-1]
+        if name.endswith(".webp") and "_" in name:
+            digest, size = name[:-5].rsplit("_", 1)
+            return (digest, int(size)) if size.isdigit() else None
+        params = parse_qs(parsed.query)
+        path = (params.get("path") or [""])[0]
+        try:
+            size = int((params.get("size") or [self.sizes[0]])[0])
+        except ValueError:
+            return None
+        digest = self.index.get(path)
+        if not digest:
+            return None
+        # Fall back to the nearest rendered size at or above the request
+        size = min((s for s in self.sizes if s >= size), default=max(self.sizes))
+        return digest, size
+
+
+def serve_thumbnail(service, handler):
+    """Answer a GET /thumbs... request on a BaseHTTPRequestHandler."""
+    found = service.lookup(handler.path)
+    data = service.cache.get(*found) if found else None
+    if data is None:
+        handler.send_response(404)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return
+    etag = f'"{found[0]}_{found[1]}"'
+    if handler.headers.get("If-None-Match") == etag:
+        handler.send_response(304)
+        handler.send_header("ETag", etag)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return
+    handler.send_response(200)
+    handler.send_header("Content-Type", "image/webp")
+    handler.send_header("Content-Length", str(len(data)))
+    handler.send_header("Cache-Control", CACHE_CONTROL)
+    handler.send_header("ETag", etag)
+    handler.send_header("Access-Control-Allow-Origin", "*")
+    handler.end_headers()
+    handler.wfile.write(data)
+
+
+def start_server(service, host="127.0.0.1", port=7861):
+    """Serve /thumbs from a standalone HTTP server in a daemon thread."""
+
+    class ThumbnailHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            serve_thumbnail(service, self)
+
+    server = ThreadingHTTPServer((host, port), ThumbnailHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
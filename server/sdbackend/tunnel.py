@@ -0,0 +1,123 @@
+"""
+cloudflared helpers shared by the launch cell and the health monitor.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+CONFIG_PATH = "/tmp/cloudflared_config.json"
+URL_PATH = "/tmp/tunnel_url.txt"
+URL_PATTERN = re.compile(r'https://[a-zA-Z0-9-]+\.trycloudflare\.com')
+
+COMMON_PATHS = [
+    "/usr/bin/cloudflared",
+    "/usr/local/bin/cloudflared",
+    "/snap/bin/cloudflared",
+    "/tmp/cloudflared",
+]
+
+
+def find_cloudflared(config_path=CONFIG_PATH):
+    """Locate cloudflared: saved config first, then PATH, then common paths."""
+    try:
+        with open(config_path) as f:
+            path = json.load(f).get("cloudflared_path")
+        if path and os.path.exists(path):
+            return path
+    except (OSError, ValueError):
+        pass
+    path = shutil.which("cloudflared")
+    if path:
+        return path
+    for path in COMMON_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def start_tunnel(cloudflared_path, port=7860, timeout=20, echo=False, url_path=URL_PATH):
+    """Start a quick tunnel to localhost:port; returns (process, url or None)."""
+    process = subprocess.Popen(
+        [cloudflared_path, "tunnel", "--url", f"http://localhost:{port}"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+    )
+    deadline = time.time() + timeout
+    url = None
+    while time.time() < deadline:
+        line = process.stdout.readline()
+        if not line:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+            continue
+        if echo:
+            print(f"      {line.rstrip()}")
+        match = URL_PATTERN.search(line)
+        if match:
+            url = match.group(0)
+            break
+    if url and url_path:
+        with open(url_path, "w") as f:
+            f.write(url)
+    # Keep reading so cloudflared never blocks on a full stdout pipe
+    threading.Thread(target=_drain, args=(process.stdout,), daemon=True).start()
+    return process, url
+
+
+def _drain(stream):
+    for _ in stream:
+        pass
+
+
+def read_tunnel_url(url_path=URL_PATH):
+    try:
+        with open(url_path) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def restart_tunnel(cloudflared_path=None, port=7860, timeout=20):
+    """Kill running cloudflared processes and start a fresh quick tunnel."""
+    subprocess.run("pkill -f 'cloudflared tunnel'", shell=True, stderr=subprocess.DEVNULL)
+    time.sleep(1)
+    cloudflared_path = cloudflared_path or find_cloudflared()
+    if not cloudflared_path:
+        return None, None
+    return start_tunnel(cloudflared_path, port, timeout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Open a Cloudflare quick tunnel and keep it running")
+    parser.add_argument("--port", type=int, default=7860, help="local port to expose")
+    parser.add_argument("--timeout", type=float, default=20, help="seconds to wait for the URL")
+    parser.add_argument("--verbose", action="store_true", help="echo cloudflared output")
+    args = parser.parse_args(argv)
+
+    cloudflared_path = find_cloudflared()
+    if not cloudflared_path:
+        print("❌ cloudflared not found")
+        return 1
+    process, url = start_tunnel(cloudflared_path, args.port, args.timeout, echo=args.verbose)
+    if not url:
+        process.terminate()
+        print("❌ No tunnel URL from cloudflared")
+        return 1
+    print(f"🌐 {url} -> http://localhost:{args.port}")
+    try:
+        return process.wait()
+    except KeyboardInterrupt:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+"""
+Resumable chunked uploads into a content-addressed blob store.
+
+img2img and inpaint inputs normally travel as base64 inside one JSON
+POST, which fails all-or-nothing over a flaky tunnel. UploadService
+speaks a subset of the tus 1.0 protocol (core + creation + termination)
+under /uploads, stores finished uploads by sha256, and lets generation
+payloads reference them instead of inlining the image:
+
+    POST   /uploads               Upload-Length, Upload-Metadata: sha256 <b64>
+    HEAD   /uploads/<id>          -> Upload-Offset (resume point)
+    PATCH  /uploads/<id>          Upload-Offset + application/offset+octet-stream
+    DELETE /uploads/<id>
+    HEAD   /uploads/blobs/<sha>   200 if the blob is already stored
+    GET    /uploads/blobs/<sha>
+
+    {"init_images": ["sdblob:<sha256>"], "mask": "sdblob:<sha256>", ...}
+
+Announcing the sha256 at creation skips the transfer entirely when the
+blob exists, so reusing an init image across variations costs nothing.
+Partial uploads live on disk and survive a proxy restart. start_in_thread()
+drops unfinished uploads after `expiry` seconds and trims the blob store
+to max_blob_bytes, least recently used first; new uploads are refused
+(507) while unfinished ones hold more than max_partial_bytes.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+UPLOAD_DIR = "/content/sdbackend_cache/uploads"
+TUS_VERSION = "1.0.0"
+BLOB_PREFIX = "sdblob:"
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+CHUNK_SIZE = 1024**2
+
+CORS_HEADERS = [
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Methods", "POST, HEAD, PATCH, DELETE, GET, OPTIONS"),
+    ("Access-Control-Allow-Headers", "*"),
+    ("Access-Control-Expose-Headers", "Location, Upload-Offset, Upload-Length, Tus-Resumable, "
+                                      "Tus-Version, Tus-Max-Size, X-Blob-Id"),
+]
+
+
+class UploadError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_metadata(header):
+    """Upload-Metadata: "key b64value,key2 b64value2" -> {key: str}."""
+    metadata = {}
+    for pair in (header or "").split(","):
+        parts = pair.strip().split(" ", 1)
+        if not parts[0]:
+            continue
+        try:
+            metadata[parts[0]] = base64.b64decode(parts[1]).decode("utf-8") if len(parts) > 1 else ""
+        except (ValueError, UnicodeDecodeError):
+            raise UploadError(400, f"Invalid Upload-Metadata value for {parts[0]}")
+    return metadata
+
+
+class BlobStore:
+    """Files stored under <root>/blobs/<sha[:2]>/<sha>."""
+
+    def __init__(self, root):
+        self.root = os.path.join(root, "blobs")
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest):
+        return bool(SHA256_PATTERN.match(digest)) and os.path.isfile(self.path(digest))
+
+    def read(self, digest):
+        with open(self.path(digest), "rb") as f:
+            data = f.read()
+        self.touch(digest)
+        return data
+
+    def touch(self, digest):
+        """Mark a blob as used; eviction goes by mtime."""
+        try:
+            os.utime(self.path(digest))
+        except OSError:
+            pass
+
+    def files(self):
+        """[(mtime, size, path)] of every stored blob."""
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, path))
+        return found
+
+    def evict(self, max_bytes):
+        """Delete the least recently used blobs until max_bytes remain; returns how many."""
+        files = sorted(self.files())
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in files:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def add_file(self, path, digest):
+        destination = self.path(digest)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(path, destination)
+        return destination
+
+
+class UploadService:
+    """tus-style upload state machine on top of a BlobStore."""
+
+    def __init__(self, root=UPLOAD_DIR, max_size=64 * 1024**2, expiry=24 * 3600,
+                 max_blob_bytes=2 * 1024**3, max_partial_bytes=512 * 1024**2):
+        self.root = root
+        self.blobs = BlobStore(root)
+        self.partial_dir = os.path.join(root, "partial")
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self.max_size = max_size
+        self.expiry = expiry
+        self.max_blob_bytes = max_blob_bytes
+        self.max_partial_bytes = max_partial_bytes
+        self.lock = threading.Lock()
+        self.locks = {}
+        self._stop = threading.Event()
+        self.stats = {"created": 0, "completed": 0, "deduplicated": 0, "resumed": 0,
+                      "bytes_received": 0, "resolved": 0, "expired": 0, "evicted": 0, "refused": 0}
+
+    # -- upload state ---------------------------------------------------
+
+    def _info_path(self, upload_id):
+        if not re.match(r"^[0-9a-f]{32}$", upload_id):
+            raise UploadError(404, "Unknown upload")
+        return os.path.join(self.partial_dir, upload_id + ".json")
+
+    def _load(self, upload_id):
+        try:
+            with open(self._info_path(upload_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError(404, "Unknown upload")
+
+    def _save(self, upload_id, info):
+        path = self._info_path(upload_id)
+        with open(path + ".tmp", "w") as f:
+            json.dump(info, f)
+        os.replace(path + ".tmp", path)
+
+    def _upload_lock(self, upload_id):
+        with self.lock:
+            return self.locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, length, metadata=None):
+        """Start an upload; returns (upload_id or None, info).
+
+        upload_id is None when the announced sha256 is already stored.
+        """
+        if length < 0 or length > self.max_size:
+            raise UploadError(413, f"Upload-Length must be between 0 and {self.max_size}")
+        metadata = metadata or {}
+        digest = metadata.get("sha256", "").lower()
+        if digest and not SHA256_PATTERN.match(digest):
+            raise UploadError(400, "sha256 metadata must be 64 hex digits")
+        if digest and self.blobs.has(digest):
+            self.stats["deduplicated"] += 1
+            self.blobs.touch(digest)
+            return None, {"length": length, "offset": length, "sha256": digest, "blob": digest}
+        if self.partial_bytes() + length > self.max_partial_bytes:
+            self.expire()
+            if self.partial_bytes() + length > self.max_partial_bytes:
+                self.stats["refused"] += 1
+                raise UploadError(507, "Too many unfinished uploads; finish or delete some first")
+        upload_id = uuid.uuid4().hex
+        info = {"length": length, "offset": 0, "sha256": digest or None, "blob": None,
+                "metadata": metadata, "created": time.time()}
+        open(os.path.join(self.partial_dir, upload_id + ".part"), "wb").close()
+        self._save(upload_id, info)
+        self.stats["created"] += 1
+        if length == 0:
+            info = self._finish(upload_id, info)
+        return upload_id, info
+
+    def status(self, upload_id):
+        info = self._load(upload_id)
+        if info["offset"] and not info["blob"]:
+            self.stats["resumed"] += 1
+        return info
+
+    def append(self, upload_id, offset, stream, length):
+        """Write length bytes from stream at offset; returns the updated info."""
+        with self._upload_lock(upload_id):
+            info = self._load(upload_id)
+            if info["blob"]:
+                raise UploadError(409, "Upload already complete")
+            if offset != info["offset"]:
+                raise UploadError(409, f"Upload-Offset mismatch: expected {info['offset']}")
+            if offset + length > info["length"]:
+                raise UploadError(413, "Chunk exceeds Upload-Length")
+            part_path = os.path.join(self.partial_dir, upload_id + ".part")
+            written = 0
+            with open(part_path, "r+b") as f:
+                f.seek(offset)
+                while written < length:
+                    try:
+                        chunk = stream.read(min(CHUNK_SIZE, length - written))
+                    except OSError:
+                        break
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    written += len(chunk)
+                f.truncate(offset + written)
+            # A dropped connection keeps what arrived; the client resumes from there
+            info["offset"] = offset + written
+            self.stats["bytes_received"] += written
+            self._save(upload_id, info)
+            if info["offset"] == info["length"]:
+                info = self._finish(upload_id, info)
+            return info
+
+    def _finish(self, upload_id, info):
+        part_path = os.path.join(self.partial_dir, upload_id + ".part")
+        sha = hashlib.sha256()
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        if info["sha256"] and info["sha256"] != digest:
+            self.terminate(upload_id)
+            raise UploadError(460, "Checksum mismatch")
+        self.blobs.add_file(part_path, digest)
+        info["blob"] = digest
+        self._save(upload_id, info)
+        self.stats["completed"] += 1
+        self.evict_blobs()
+        return info
+
+    def terminate(self, upload_id):
+        self._info_path(upload_id)
+        for suffix in (".part", ".json"):
+            try:
+                os.remove(os.path.join(self.partial_dir, upload_id + suffix))
+            except OSError:
+                pass
+        with self.lock:
+            self.locks.pop(upload_id, None)
+
+    def expire(self):
+        """Drop partial uploads older than expiry; returns how many."""
+        removed = 0
+        cutoff = time.time() - self.expiry
+        for name in os.listdir(self.partial_dir):
+            if name.endswith(".json"):
+                upload_id = name[:-5]
+                try:
+                    if self._load(upload_id)["created"] < cutoff:
+                        self.terminate(upload_id)
+                        removed += 1
+                except UploadError:
+                    continue
+        self.stats["expired"] += removed
+        return removed
+
+    def evict_blobs(self):
+        """Trim the blob store to max_blob_bytes; returns how many blobs were dropped."""
+        removed = self.blobs.evict(self.max_blob_bytes)
+        self.stats["evicted"] += removed
+        return removed
+
+    def partial_bytes(self):
+        """Bytes held on disk by unfinished uploads."""
+        total = 0
+        for name in os.listdir(self.partial_dir):
+            if name.endswith(".part"):
+                try:
+                    total += os.path.getsize(os.path.join(self.partial_dir, name))
+                except OSError:
+                    continue
+        return total
+
+    def run(self, interval=600):
+        while not self._stop.is_set():
+            try:
+                self.expire()
+                self.evict_blobs()
+            except OSError:
+                pass
+            self._stop.wait(interval)
+
+    def start_in_thread(self, interval=600):
+        """Expire stale uploads and trim the blob store every interval seconds."""
+        thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    # -- generation payloads --------------------------------------------
+
+    def resolve_payload(self, payload):
+        """Replace sdblob:<sha256> references in init_images/mask with base64.
+
+        Returns the payload (a new dict if anything was replaced).
+        """
+        def resolve(value):
+            if not isinstance(value, str) or not value.startswith(BLOB_PREFIX):
+                return value
+            digest = value[len(BLOB_PREFIX):].lower()
+            try:
+                # Eviction may remove the blob between has() and read()
+                if not self.blobs.has(digest):
+                    raise OSError(digest)
+                data = self.blobs.read(digest)
+            except OSError:
+                raise UploadError(422, f"Unknown upload blob {digest}") from None
+            self.stats["resolved"] += 1
+            return base64.b64encode(data).decode("ascii")
+
+        images = payload.get("init_images")
+        mask = payload.get("mask")
+        has_refs = (isinstance(mask, str) and mask.startswith(BLOB_PREFIX)) or (
+            isinstance(images, list) and any(isinstance(i, str) and i.startswith(BLOB_PREFIX) for i in images))
+        if not has_refs:
+            return payload
+        resolved = dict(payload)
+        if isinstance(images, list):
+            resolved["init_images"] = [resolve(image) for image in images]
+        if mask is not None:
+            resolved["mask"] = resolve(mask)
+        return resolved
+
+    def report(self):
+        partial = sum(1 for name in os.listdir(self.partial_dir) if name.endswith(".part"))
+        return dict(self.stats, partial_uploads=partial, partial_bytes=self.partial_bytes(),
+                    blob_bytes=sum(size for _, size, _ in self.blobs.files()))
+
+
+def serve_upload(service, handler, method):
+    """Answer an /uploads request on a BaseHTTPRequestHandler.
+
+    The request body is streamed to disk, never read into memory whole.
+    """
+    path = urlparse(handler.path).path.rstrip("/")
+    parts = path.split("/")[2:]
+    headers = [("Tus-Resumable", TUS_VERSION), ("Cache-Control", "no-store")] + CORS_HEADERS
+    body = b""
+    try:
+        if method == "OPTIONS":
+            status = 204
+            headers += [("Tus-Version", TUS_VERSION), ("Tus-Extension", "creation,termination"),
+                        ("Tus-Max-Size", str(service.max_size))]
+        elif parts[:1] == ["blobs"] and len(parts) == 2 and method in ("HEAD", "GET"):
+            digest = parts[1].lower()
+            if not service.blobs.has(digest):
+                raise UploadError(404, "Unknown blob")
+            status = 200
+            headers += [("X-Blob-Id", digest), ("Content-Type", "application/octet-stream")]
+            if method == "GET":
+                body = service.blobs.read(digest)
+            else:
+                headers.append(("X-Blob-Size", str(os.path.getsize(service.blobs.path(digest)))))
+        elif not parts and method == "POST":
+            length = int(handler.headers.get("Upload-Length", -1))
+            upload_id, info = service.create(length, parse_metadata(handler.headers.get("Upload-Metadata")))
+            status = 201 if upload_id else 200
+            if upload_id:
+                headers.append(("Location", f"/uploads/{upload_id}"))
+            headers.append(("Upload-Offset", str(info["offset"])))
+            if info["blob"]:
+                headers.append(("X-Blob-Id", info["blob"]))
+        elif len(parts) == 1 and method == "HEAD":
+            info = service.status(parts[0])
+            status = 200
+            headers += [("Upload-Offset", str(info["offset"])), ("Upload-Length", str(info["length"]))]
+            if info["blob"]:
+                headers.append(("X-Blob-Id", info["blob"]))
+        elif len(parts) == 1 and method == "PATCH":
+            if handler.headers.get("Content-Type") != "application/offset+octet-stream":
+                raise UploadError(415, "Content-Type must be application/offset+octet-stream")
+            length = int(handler.headers.get("Content-Length") or 0)
+            info = service.append(parts[0], int(handler.headers.get("Upload-Offset", -1)), handler.rfile, length)
+            status = 204
+            headers.append(("Upload-Offset", str(info["offset"])))
+            if info["blob"]:
+                headers.append(("X-Blob-Id", info["blob"]))
+        elif len(parts) == 1 and method == "DELETE":
+            service.terminate(parts[0])
+            status = 204
+        else:
+            raise UploadError(405, "Method not allowed")
+    except UploadError as e:
+        status = e.status
+        headers.append(("Content-Type", "application/json"))
+        body = json.dumps({"detail": str(e)}).encode("utf-8")
+    except ValueError:
+        status = 400
+        headers.append(("Content-Type", "application/json"))
+        body = json.dumps({"detail": "Invalid upload headers"}).encode("utf-8")
+
+    if status >= 400:
+        # An unread PATCH body would corrupt the next request on this connection
+        handler.close_connection = True
+        headers.append(("Connection", "close"))
+    handler.send_response(status)
+    for key, value in headers:
+        handler.send_header(key, value)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    if method != "HEAD":
+        handler.wfile.write(body)
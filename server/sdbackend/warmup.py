@@ -0,0 +1,129 @@
+"""
+Warm-up stage for a freshly launched WebUI.
+
+The first txt2img after launch.py starts pays for checkpoint/VAE load,
+CUDA kernel compilation and xformers autotune. warm_up() pays that cost
+up front with tiny throwaway generations so the first real user is served
+warm, and reports cold vs warm latency per resolution.
+"""
+
+import json
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_URL = "http://localhost:7860"
+
+# 512x512 is the index.html default; the others are the common portrait/landscape picks
+DEFAULT_RESOLUTIONS = [(512, 512), (512, 768), (768, 512)]
+
+
+def api_request(base_url, path, payload=None, timeout=30):
+    """GET (or POST when payload is given) a WebUI API path and decode JSON."""
+    data = None
+    headers = {"Accept": "application/json"}
+    if payload is not None:
+        data = json.dumps(payload).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    request = urllib.request.Request(base_url.rstrip("/") + path, data=data, headers=headers)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+    return json.loads(body) if body else {}
+
+
+def wait_for_api(base_url=DEFAULT_URL, timeout=600, interval=2):
+    """Poll /sdapi/v1/sd-models until the API answers; return seconds waited."""
+    start = time.time()
+    while True:
+        try:
+            api_request(base_url, "/sdapi/v1/sd-models", timeout=5)
+            return time.time() - start
+        except (urllib.error.URLError, ConnectionError, OSError, ValueError):
+            if time.time() - start > timeout:
+                raise TimeoutError(f"WebUI API not ready after {timeout}s")
+            time.sleep(interval)
+
+
+def load_defaults(base_url=DEFAULT_URL, checkpoint=None, vae=None):
+    """Load the configured default checkpoint and VAE via /sdapi/v1/options.
+
+    When checkpoint/vae are not given the values currently configured in
+    the WebUI options are re-applied, which forces them to be loaded.
+    Returns the options that were applied.
+    """
+    options = api_request(base_url, "/sdapi/v1/options", timeout=30)
+    wanted = {
+        "sd_model_checkpoint": checkpoint or options.get("sd_model_checkpoint"),
+        "sd_vae": vae or options.get("sd_vae", "Automatic"),
+    }
+    wanted = {key: value for key, value in wanted.items() if value}
+    if wanted:
+        api_request(base_url, "/sdapi/v1/options", wanted, timeout=600)
+    return wanted
+
+
+def _generate(base_url, width, height, steps):
+    payload = {
+        "prompt": "warm-up",
+        "steps": steps,
+        "width": width,
+        "height": height,
+        "seed": 1,
+        "batch_size": 1,
+        "n_iter": 1,
+        "send_images": False,
+        "save_images": False,
+    }
+    start = time.time()
+    api_request(base_url, "/sdapi/v1/txt2img", payload, timeout=600)
+    return time.time() - start
+
+
+def warm_up(base_url=DEFAULT_URL, checkpoint=None, vae=None,
+            resolutions=DEFAULT_RESOLUTIONS, steps=2, ready_timeout=600):
+    """Wait for the API, load models and run throwaway generations.
+
+    Each resolution is generated twice: the first call is the cold
+    latency, the second the warm one. Errors never propagate - they are
+    recorded in the report so the launch cell can still start the tunnel.
+    """
+    report = {"ready_s": None, "load_s": None, "options": {}, "resolutions": [], "error": None}
+    start = time.time()
+    try:
+        report["ready_s"] = wait_for_api(base_url, timeout=ready_timeout)
+
+        load_start = time.time()
+        report["options"] = load_defaults(base_url, checkpoint, vae)
+        report["load_s"] = time.time() - load_start
+
+        for width, height in resolutions:
+            cold = _generate(base_url, width, height, steps)
+            warm = _generate(base_url, width, height, steps)
+            report["resolutions"].append({
+                "width": width,
+                "height": height,
+                "cold_s": cold,
+                "warm_s": warm,
+            })
+    except Exception as e:
+        report["error"] = str(e)
+    report["total_s"] = time.time() - start
+    return report
+
+
+def print_report(report):
+    """Print a warm-up report in the notebook's output style."""
+    print("\n🔥 Warm-up results:")
+    if report.get("ready_s") is not None:
+        print(f"   • API ready after: {report['ready_s']:.1f}s")
+    if report.get("load_s") is not None:
+        model = report["options"].get("sd_model_checkpoint", "default")
+        print(f"   • Model load ({model}): {report['load_s']:.1f}s")
+    for item in report.get("resolutions", []):
+        speedup = item["cold_s"] / item["warm_s"] if item["warm_s"] else 0
+        print(f"   • {item['width']}x{item['height']}: "
+              f"cold {item['cold_s']:.2f}s → warm {item['warm_s']:.2f}s ({speedup:.1f}x)")
+    if report.get("error"):
+        print(f"   ⚠️ Warm-up incomplete: {report['error'][:100]}")
+    else:
+        print(f"   ✅ Warm-up complete in {report.get('total_s', 0):.1f}s")
@@ -0,0 +1,432 @@
+"""
+Several WebUI instances in one runtime, behind a local dispatcher.
+
+A runtime with more than one GPU (or one GPU with room for two small
+models) still serves everything from a single launch.py. Launcher starts
+one WebUI per planned slot, pinned with CUDA_VISIBLE_DEVICES and on its
+own port, one after another: the next worker starts when the previous
+one answers (or after `stagger` seconds), so checkpoint loads do not
+compete for system RAM and disk. Dispatcher listens on the usual port
+7860 and spreads requests over the workers, so the proxy, warm-up,
+health checks and the single tunnel URL keep working unchanged.
+
+Try it on CPU with mock workers:
+
+    python -m sdbackend.workers --mock 3
+"""
+
+import argparse
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from sdbackend.profiles import detect_gpus
+from sdbackend.warmup import api_request
+
+DEFAULT_PORT = 7860
+FIRST_WORKER_PORT = 7861
+LOG_DIR = "/content/sdbackend_workers"
+
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+              "trailers", "transfer-encoding", "upgrade", "content-length", "host"}
+
+# Requests that change or reset per-instance state go to every worker
+BROADCAST_PATHS = {
+    "/sdapi/v1/options", "/sdapi/v1/interrupt", "/sdapi/v1/skip",
+    "/sdapi/v1/refresh-checkpoints", "/sdapi/v1/refresh-loras", "/sdapi/v1/refresh-vae",
+    "/sdapi/v1/reload-checkpoint", "/sdapi/v1/unload-checkpoint",
+}
+
+
+def plan_workers(gpus, per_worker_gb=None, max_workers=None, first_port=FIRST_WORKER_PORT):
+    """One worker per GPU, or several on a GPU that fits per_worker_gb each.
+
+    Returns [{"name", "gpu", "port"}]; a CPU-only runtime gets one worker
+    with gpu None.
+    """
+    slots = []
+    for index, _, vram_gb in gpus:
+        count = max(1, int(vram_gb // per_worker_gb)) if per_worker_gb else 1
+        slots += [index] * count
+    if not slots:
+        slots = [None]
+    if max_workers:
+        slots = slots[:max_workers]
+    return [{"name": f"worker-{i}", "gpu": gpu, "port": first_port + i} for i, gpu in enumerate(slots)]
+
+
+class Worker:
+    """One WebUI process and where to reach it."""
+
+    def __init__(self, name, gpu, port):
+        self.name = name
+        self.gpu = gpu
+        self.port = port
+        self.process = None
+        self.log_path = None
+        self.started = None
+        self.ready = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def report(self):
+        return {
+            "name": self.name,
+            "gpu": self.gpu,
+            "port": self.port,
+            "alive": self.alive(),
+            "startup_seconds": round(self.ready - self.started, 1) if self.ready else None,
+            "log": self.log_path,
+        }
+
+
+class Launcher:
+    """Start workers one after another and stop them together.
+
+    command(port) returns the argv of one worker (e.g.
+    lambda port: profiles.launch_args(profile, port)).
+    """
+
+    def __init__(self, command, plan, stagger=30.0, ready_timeout=900, cwd=None, log_dir=LOG_DIR,
+                 env=None, verbose=True):
+        self.command = command
+        self.workers = [Worker(slot["name"], slot["gpu"], slot["port"]) for slot in plan]
+        self.stagger = stagger
+        self.ready_timeout = ready_timeout
+        self.cwd = cwd
+        self.log_dir = log_dir
+        self.env = env
+        self.verbose = verbose
+
+    def spawn(self, worker):
+        env = dict(os.environ if self.env is None else self.env)
+        if worker.gpu is not None:
+            env["CUDA_VISIBLE_DEVICES"] = str(worker.gpu)
+        os.makedirs(self.log_dir, exist_ok=True)
+        worker.log_path = os.path.join(self.log_dir, f"{worker.name}.log")
+        with open(worker.log_path, "ab") as log:
+            worker.process = subprocess.Popen(self.command(worker.port), stdout=log,
+                                              stderr=subprocess.STDOUT, cwd=self.cwd, env=env)
+        worker.started = time.time()
+        if self.verbose:
+            where = f"GPU {worker.gpu}" if worker.gpu is not None else "CPU"
+            print(f"   🚀 {worker.name} on {where}, port {worker.port} (log: {worker.log_path})")
+
+    def wait_ready(self, worker, timeout):
+        """True once the worker's API answers; False on timeout or exit."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if not worker.alive():
+                return False
+            try:
+                api_request(worker.url, "/sdapi/v1/sd-models", timeout=5)
+                worker.ready = time.time()
+                return True
+            except (urllib.error.URLError, OSError, ValueError):
+                time.sleep(1)
+        return False
+
+    def start(self):
+        """Spawn every worker, each after the previous is ready or stagger elapsed."""
+        for i, worker in enumerate(self.workers):
+            self.spawn(worker)
+            if i < len(self.workers) - 1:
+                self.wait_ready(worker, self.stagger)
+        return self
+
+    def wait_all(self, timeout=None):
+        """Wait until every worker answers; returns the ones that do."""
+        deadline = time.time() + (self.ready_timeout if timeout is None else timeout)
+        ready = []
+        for worker in self.workers:
+            if worker.ready or self.wait_ready(worker, max(0, deadline - time.time())):
+                ready.append(worker)
+            elif self.verbose:
+                print(f"   ⚠️ {worker.name} did not come up; see {worker.log_path}")
+        return ready
+
+    def stop(self, timeout=10):
+        for worker in self.workers:
+            if worker.alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                try:
+                    worker.process.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+
+    def report(self):
+        return [worker.report() for worker in self.workers]
+
+
+class Backend:
+    """Dispatcher-side state of one worker URL."""
+
+    def __init__(self, url):
+        self.url = urlparse(url)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.down_until = 0.0
+
+    def report(self):
+        return {"url": self.url.geturl(), "in_flight": self.in_flight, "requests": self.requests,
+                "errors": self.errors, "down": self.down_until > time.time()}
+
+
+class Dispatcher:
+    """Spread requests over worker URLs, least in-flight first.
+
+    A worker that refuses connections is skipped for retry_after seconds
+    and the request goes to the next one. Option changes, interrupts and
+    refreshes are sent to every worker; /sdapi/v1/progress is answered by
+    the busiest worker, which is where a polling client's job most likely
+    runs.
+    """
+
+    def __init__(self, urls, timeout=600, retry_after=10.0):
+        self.backends = [Backend(url) for url in urls]
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "broadcasts": 0, "failovers": 0, "unavailable": 0}
+
+    def pick(self, exclude=()):
+        with self.lock:
+            now = time.time()
+            candidates = [b for b in self.backends if b not in exclude and b.down_until <= now]
+            if not candidates:
+                # Everything looks down: try the ones not tried yet anyway
+                candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                return None
+            backend = min(candidates, key=lambda b: (b.in_flight, b.requests))
+            backend.in_flight += 1
+            backend.requests += 1
+            return backend
+
+    def send(self, backend, method, path, body, headers):
+        """(status, headers, body) from one worker; raises ConnectionError if it is unreachable."""
+        connection = http.client.HTTPConnection(backend.url.hostname, backend.url.port, timeout=self.timeout)
+        try:
+            try:
+                connection.connect()
+            except OSError as e:
+                raise ConnectionError(str(e)) from e
+            connection.request(method, path, body=body or None, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+            response_headers = [(key, value) for key, value in response.getheaders()
+                                if key.lower() not in HOP_BY_HOP]
+            return response.status, response_headers, data
+        finally:
+            connection.close()
+
+    def forward(self, method, path, body=b"", headers=None):
+        headers = {key: value for key, value in (headers or {}).items() if key.lower() not in HOP_BY_HOP}
+        self.stats["requests"] += 1
+        if method == "POST" and urlparse(path).path in BROADCAST_PATHS:
+            return self.broadcast(method, path, body, headers)
+        if method == "GET" and urlparse(path).path == "/sdapi/v1/progress":
+            return self.progress(path, headers)
+        tried = []
+        while True:
+            backend = self.pick(tried)
+            if backend is None:
+                self.stats["unavailable"] += 1
+                return error_response(503, "No WebUI worker is reachable")
+            tried.append(backend)
+            try:
+                return self.send(backend, method, path, body, headers)
+            except ConnectionError:
+                # Nothing reached the worker, so trying the next one is safe
+                self.mark_down(backend)
+                self.stats["failovers"] += 1
+            except (OSError, http.client.HTTPException) as e:
+                backend.errors += 1
+                return error_response(502, f"WebUI worker failed: {e}")
+            finally:
+                with self.lock:
+                    backend.in_flight -= 1
+
+    def mark_down(self, backend):
+        with self.lock:
+            backend.errors += 1
+            backend.down_until = time.time() + self.retry_after
+
+    def broadcast(self, method, path, body, headers):
+        """Send to every worker; the first successful answer is returned."""
+        self.stats["broadcasts"] += 1
+        results = [None] * len(self.backends)
+
+        def run(i, backend):
+            try:
+                results[i] = self.send(backend, method, path, body, headers)
+            except (OSError, http.client.HTTPException):
+                self.mark_down(backend)
+
+        threads = [threading.Thread(target=run, args=(i, backend), daemon=True)
+                   for i, backend in enumerate(self.backends)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        answered = [result for result in results if result is not None]
+        for result in answered:
+            if result[0] < 400:
+                return result
+        return answered[0] if answered else error_response(503, "No WebUI worker is reachable")
+
+    def progress(self, path, headers):
+        with self.lock:
+            order = sorted(self.backends, key=lambda b: -b.in_flight)
+        for backend in order:
+            try:
+                return self.send(backend, "GET", path, b"", headers)
+            except ConnectionError:
+                self.mark_down(backend)
+            except (OSError, http.client.HTTPException):
+                continue
+        return error_response(503, "No WebUI worker is reachable")
+
+    def report(self):
+        with self.lock:
+            return dict(self.stats, workers=[backend.report() for backend in self.backends])
+
+
+def json_response(status, data):
+    return (status, [("Content-Type", "application/json"), ("Access-Control-Allow-Origin", "*")],
+            json.dumps(data).encode("utf-8"))
+
+
+def error_response(status, detail):
+    return json_response(status, {"detail": detail})
+
+
+def make_handler(dispatcher):
+    """Build a request handler class bound to one Dispatcher."""
+
+    class DispatchHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _dispatch(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            if urlparse(self.path).path == "/sdbackend/workers":
+                status, headers, data = json_response(200, dispatcher.report())
+            else:
+                status, headers, data = dispatcher.forward(method, self.path, body, dict(self.headers.items()))
+            self.send_response(status)
+            for key, value in headers:
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if method != "HEAD":
+                self.wfile.write(data)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_HEAD(self):
+            self._dispatch("HEAD")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_OPTIONS(self):
+            self._dispatch("OPTIONS")
+
+    return DispatchHandler
+
+
+def start_server(dispatcher, host="127.0.0.1", port=DEFAULT_PORT):
+    """Serve a Dispatcher from a daemon thread; returns the HTTP server."""
+    server = ThreadingHTTPServer((host, port), make_handler(dispatcher))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_workers(command, plan, port=DEFAULT_PORT, host="127.0.0.1", **launcher_options):
+    """Launch the planned workers and put a dispatcher on port.
+
+    A single worker is started on port itself, without a dispatcher.
+    Returns (launcher, dispatcher or None); the dispatcher's HTTP server
+    is dispatcher.server.
+    """
+    if len(plan) == 1:
+        plan = [dict(plan[0], port=port)]
+    launcher = Launcher(command, plan, **launcher_options).start()
+    if len(plan) == 1:
+        return launcher, None
+    dispatcher = Dispatcher([worker.url for worker in launcher.workers])
+    dispatcher.server = start_server(dispatcher, host, port)
+    return launcher, dispatcher
+
+
+def mock_command(port):
+    """argv of a CPU mock worker (sdbackend.mockserver)."""
+    return [sys.executable, "-m", "sdbackend.mockserver", "--port", str(port)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several WebUI workers behind one dispatcher")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="dispatcher port")
+    parser.add_argument("--first-worker-port", type=int, default=FIRST_WORKER_PORT)
+    parser.add_argument("--mock", type=int, default=0, metavar="N", help="start N CPU mock workers")
+    parser.add_argument("--per-worker-gb", type=float, default=None,
+                        help="VRAM per worker; fits several workers on a large GPU")
+    parser.add_argument("--max-workers", type=int, default=None)
+    parser.add_argument("--stagger", type=float, default=30.0, help="max seconds between worker starts")
+    parser.add_argument("--log-dir", default=LOG_DIR)
+    parser.add_argument("--webui-dir", default="/root/stable-diffusion-webui")
+    args = parser.parse_args(argv)
+
+    if args.mock:
+        plan = [{"name": f"worker-{i}", "gpu": None, "port": args.first_worker_port + i}
+                for i in range(args.mock)]
+        command, cwd = mock_command, None
+        # The mock workers import sdbackend from wherever this copy lives
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            [os.path.dirname(os.path.dirname(os.path.abspath(__file__))), os.environ.get("PYTHONPATH", "")]))
+    else:
+        from sdbackend.profiles import detect_device, launch_args, load_overrides, resolve_profile
+
+        profile = resolve_profile(*detect_device(), load_overrides())
+        plan = plan_workers(detect_gpus(), args.per_worker_gb, args.max_workers, args.first_worker_port)
+        command, cwd, env = (lambda port: launch_args(profile, port)), args.webui_dir, None
+
+    launcher, dispatcher = start_workers(command, plan, port=args.port, cwd=cwd, env=env,
+                                         stagger=args.stagger, log_dir=args.log_dir)
+    # Stop the workers with the dispatcher, also when it is terminated
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    ready = launcher.wait_all()
+    print(f"🔀 {len(ready)}/{len(launcher.workers)} workers ready behind http://127.0.0.1:{args.port}")
+    try:
+        while any(worker.alive() for worker in launcher.workers):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        launcher.stop()
+
+
+if __name__ == "__main__":
+    main()
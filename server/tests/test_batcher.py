@@ -0,0 +1,68 @@
+"""
+Tests for sdbackend.batcher.
+
+    cd server && python -m pytest -q tests
+"""
+
+import json
+import os
+import sys
+import threading
+import unittest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from sdbackend.batcher import MicroBatcher  # noqa: E402
+
+
+class MicroBatcherTest(unittest.TestCase):
+    def run_together(self, batcher, payloads):
+        """Send payloads concurrently; returns the upstream payloads and the replies."""
+        upstream, replies = [], [None] * len(payloads)
+        lock = threading.Lock()
+
+        def forward(payload):
+            with lock:
+                upstream.append(payload)
+            count = int(payload.get("batch_size", 1))
+            body = {"images": [f"image-{i}" for i in range(count)], "info": json.dumps({})}
+            return 200, {}, json.dumps(body).encode("utf-8")
+
+        def send(index, payload):
+            replies[index] = batcher.run(payload, forward, checkpoint="model.safetensors")
+
+        threads = [threading.Thread(target=send, args=(i, payload)) for i, payload in enumerate(payloads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return upstream, replies
+
+    def test_identical_settings_are_merged(self):
+        batcher = MicroBatcher(window=0.2, max_batch=4, per_item=True)
+        payload = {"prompt": "a cat", "steps": 20, "restore_faces": True}
+        upstream, replies = self.run_together(batcher, [payload, dict(payload, prompt="a dog", seed=7)])
+        self.assertEqual(len(upstream), 1)
+        self.assertEqual(upstream[0]["batch_size"], 2)
+        self.assertEqual(sorted(upstream[0]["prompt"]), ["a cat", "a dog"])
+        self.assertEqual([len(json.loads(reply[2])["images"]) for reply in replies], [1, 1])
+
+    def test_requests_differing_in_one_setting_are_not_merged(self):
+        for field, value in (("restore_faces", True), ("tiling", True), ("styles", ["noir"]),
+                             ("subseed_strength", 0.5), ("eta", 0.3), ("denoising_strength", 0.4)):
+            with self.subTest(field=field):
+                batcher = MicroBatcher(window=0.2, max_batch=4, per_item=True)
+                payload = {"prompt": "a cat", "steps": 20}
+                upstream, _ = self.run_together(batcher, [payload, dict(payload, **{field: value})])
+                self.assertEqual(len(upstream), 2)
+                self.assertEqual(sorted(p.get(field) is not None for p in upstream), [False, True])
+
+    def test_prompts_must_match_without_per_item(self):
+        batcher = MicroBatcher(window=0.2, max_batch=4)
+        upstream, _ = self.run_together(batcher, [{"prompt": "a cat"}, {"prompt": "a dog"}])
+        self.assertEqual(len(upstream), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests for sdbackend.profiles.
+
+    cd server && python -m pytest -q tests
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from sdbackend.profiles import launch_args, load_overrides, resolve_profile  # noqa: E402
+
+
+class LoadOverridesTest(unittest.TestCase):
+    def load(self, text, without_yaml=False):
+        """load_overrides() of a file holding text; returns (overrides, printed output)."""
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "profiles.yaml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            output = io.StringIO()
+            modules = {"yaml": None} if without_yaml else {}
+            with mock.patch.dict(sys.modules, modules), contextlib.redirect_stdout(output):
+                return load_overrides(path), output.getvalue()
+
+    def test_bad_values_are_dropped_and_reported(self):
+        overrides, output = self.load(json.dumps({
+            "profile": "t4",
+            "profiles": {"t4": {"attention": "flash", "vram": "medvram", "min_vram_gb": "lots"}},
+        }))
+        self.assertEqual(overrides["profiles"]["t4"], {"vram": "medvram"})
+        self.assertIn("profiles.t4.attention", output)
+        self.assertIn("profiles.t4.min_vram_gb", output)
+        # The launch command still builds, with the built-in attention of the profile
+        args = launch_args(resolve_profile("Tesla T4", 15.0, overrides))
+        self.assertIn("--xformers", args)
+        self.assertIn("--medvram", args)
+
+    def test_unknown_forced_profile_is_reported(self):
+        overrides, output = self.load(json.dumps({"profile": "t5"}))
+        self.assertNotIn("profile", overrides)
+        self.assertIn("'t5'", output)
+
+    def test_yaml_without_pyyaml_is_ignored_with_a_message(self):
+        overrides, output = self.load("profile: t4\n", without_yaml=True)
+        self.assertEqual(overrides, {})
+        self.assertIn("PyYAML is not installed", output)
+
+    def test_json_without_pyyaml_still_loads(self):
+        overrides, output = self.load(json.dumps({"profiles": {"t4": {"attention": "sdp"}}}),
+                                      without_yaml=True)
+        self.assertEqual(overrides["profiles"]["t4"], {"attention": "sdp"})
+        self.assertEqual(output, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
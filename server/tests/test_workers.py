@@ -0,0 +1,175 @@
+"""
+Tests for sdbackend.workers against CPU mock workers (sdbackend.mockserver).
+
+    cd server && python -m pytest -q tests
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+import urllib.request
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from sdbackend import mockserver  # noqa: E402
+from sdbackend.workers import Dispatcher, mock_command, plan_workers, start_workers  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock(step_latency=0.001):
+    server = mockserver.start_server(port=0, config=mockserver.MockConfig(
+        step_latency=step_latency, base_latency=0.0, load_latency=0.0))
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def post(dispatcher, path, payload):
+    return dispatcher.forward("POST", path, json.dumps(payload).encode("utf-8"),
+                              {"Content-Type": "application/json"})
+
+
+class PlanWorkersTest(unittest.TestCase):
+    def test_cpu_runtime_gets_one_worker(self):
+        self.assertEqual(plan_workers([], first_port=7861),
+                         [{"name": "worker-0", "gpu": None, "port": 7861}])
+
+    def test_one_worker_per_gpu(self):
+        plan = plan_workers([(0, "Tesla T4", 15.0), (1, "Tesla T4", 15.0)], first_port=7861)
+        self.assertEqual([(slot["gpu"], slot["port"]) for slot in plan], [(0, 7861), (1, 7862)])
+
+    def test_several_workers_on_a_large_gpu(self):
+        plan = plan_workers([(0, "A100", 40.0)], per_worker_gb=12)
+        self.assertEqual([slot["gpu"] for slot in plan], [0, 0, 0])
+        self.assertEqual(len({slot["port"] for slot in plan}), 3)
+
+    def test_max_workers(self):
+        plan = plan_workers([(0, "A100", 80.0)], per_worker_gb=10, max_workers=2)
+        self.assertEqual(len(plan), 2)
+
+
+class DispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def mocks(self, count, step_latency=0.001):
+        urls = []
+        for _ in range(count):
+            server, url = start_mock(step_latency)
+            self.servers.append(server)
+            urls.append(url)
+        return urls
+
+    def test_pick_prefers_least_in_flight(self):
+        dispatcher = Dispatcher(self.mocks(3))
+        busy, idle, other = dispatcher.backends
+        busy.in_flight, idle.in_flight, other.in_flight = 2, 0, 1
+        self.assertIs(dispatcher.pick(), idle)
+
+    def test_concurrent_generations_spread_over_workers(self):
+        dispatcher = Dispatcher(self.mocks(2, step_latency=0.02))
+        results = []
+
+        def generate():
+            results.append(post(dispatcher, "/sdapi/v1/txt2img", {"steps": 10})[0])
+
+        threads = [threading.Thread(target=generate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [200] * 4)
+        self.assertEqual([server.backend.generated for server in self.servers], [2, 2])
+        self.assertEqual([backend.in_flight for backend in dispatcher.backends], [0, 0])
+
+    def test_options_are_broadcast(self):
+        dispatcher = Dispatcher(self.mocks(2))
+        title = self.servers[0].backend.models[1]["title"]
+        status, _, _ = post(dispatcher, "/sdapi/v1/options", {"sd_model_checkpoint": title})
+        self.assertEqual(status, 200)
+        self.assertEqual([server.backend.options["sd_model_checkpoint"] for server in self.servers],
+                         [title, title])
+        self.assertEqual(dispatcher.stats["broadcasts"], 1)
+
+    def test_interrupt_reaches_the_busy_worker(self):
+        dispatcher = Dispatcher(self.mocks(2, step_latency=0.5))
+        result = {}
+
+        def generate():
+            start = time.time()
+            result["status"] = post(dispatcher, "/sdapi/v1/txt2img", {"steps": 20})[0]
+            result["seconds"] = time.time() - start
+
+        thread = threading.Thread(target=generate)
+        thread.start()
+        deadline = time.time() + 5
+        while not any(server.backend.job for server in self.servers) and time.time() < deadline:
+            time.sleep(0.01)
+        post(dispatcher, "/sdapi/v1/interrupt", {})
+        thread.join(10)
+        self.assertEqual(result["status"], 200)
+        self.assertLess(result["seconds"], 5)
+        self.assertEqual([server.backend.interrupts for server in self.servers], [1, 1])
+
+    def test_failover_skips_a_worker_that_is_down(self):
+        dead = f"http://127.0.0.1:{free_port()}"
+        dispatcher = Dispatcher([dead] + self.mocks(1), retry_after=60)
+        for _ in range(3):
+            status, _, body = dispatcher.forward("GET", "/sdapi/v1/sd-models")
+            self.assertEqual(status, 200)
+            self.assertTrue(json.loads(body))
+        self.assertEqual(dispatcher.stats["failovers"], 1)
+        self.assertTrue(dispatcher.report()["workers"][0]["down"])
+
+    def test_no_worker_reachable(self):
+        dispatcher = Dispatcher([f"http://127.0.0.1:{free_port()}"])
+        status, _, _ = dispatcher.forward("GET", "/sdapi/v1/sd-models")
+        self.assertEqual(status, 503)
+
+
+class LauncherTest(unittest.TestCase):
+    """Real worker processes (mock workers) behind a dispatcher server."""
+
+    def test_mock_workers_behind_dispatcher(self):
+        port = free_port()
+        plan = [{"name": f"worker-{i}", "gpu": None, "port": free_port()} for i in range(2)]
+        env = dict(os.environ, PYTHONPATH=SERVER_DIR)
+        log_dir = os.path.join(os.environ.get("TMPDIR", "/tmp"), f"sdbackend-test-workers-{port}")
+        launcher, dispatcher = start_workers(mock_command, plan, port=port, env=env, stagger=10,
+                                             ready_timeout=30, log_dir=log_dir, verbose=False)
+        try:
+            self.assertEqual(len(launcher.wait_all()), 2)
+            url = f"http://127.0.0.1:{port}"
+            with urllib.request.urlopen(url + "/sdbackend/workers", timeout=10) as response:
+                self.assertEqual(len(json.load(response)["workers"]), 2)
+
+            # A worker that dies is failed over to the other one
+            launcher.workers[0].process.kill()
+            launcher.workers[0].process.wait()
+            for _ in range(2):
+                request = urllib.request.Request(url + "/sdapi/v1/txt2img", json.dumps({"steps": 2}).encode(),
+                                                 {"Content-Type": "application/json"})
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    self.assertEqual(len(json.load(response)["images"]), 1)
+            self.assertEqual(dispatcher.stats["failovers"], 1)
+        finally:
+            launcher.stop()
+            dispatcher.server.shutdown()
+            dispatcher.server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()